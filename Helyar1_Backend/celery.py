@@ -12,6 +12,8 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
+# subscriptions keeps its tasks in task.py rather than tasks.py
+app.autodiscover_tasks(['subscriptions'], related_name='task')
 
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
@@ -1,24 +1,67 @@
+import os
+import threading
+
 from django.conf import settings
-import gocardless_pro
 
-def get_gocardless_client():
+
+def _build_gocardless_client():
+    # Imported here so processes that never call GoCardless don't load gocardless_pro
+    from .gocardless import ResilientClient
+
     access_token = getattr(settings, 'GC_ACCESS_TOKEN')
     environment = getattr(settings, 'GC_ENVIRONMENT', 'sandbox')  # Default to sandbox
-    
+
     if not access_token:
         raise ValueError("GC ACCESS TOKEN is not found")
-    
+
     # Validate token matches environment
     if environment == 'sandbox' and not access_token.startswith('sandbox_'):
         raise ValueError(f"Sandbox environment requires a sandbox token (starts with 'sandbox_')")
     elif environment == 'live' and not access_token.startswith('live_'):
         raise ValueError(f"Live environment requires a live token (starts with 'live_')")
-    
-    client = gocardless_pro.Client(
+
+    client = ResilientClient(
         access_token=access_token,
         environment=environment
     )
-    
+
     return client
 
-gocardless_client = get_gocardless_client()
\ No newline at end of file
+
+def idempotency_headers(*parts):
+    """
+    Deterministic Idempotency-Key for creates that may be attempted by more than
+    one path (e.g. CompleteMandate and the billing_requests webhook); the second
+    attempt gets the resource the first one created.
+    """
+    return {'Idempotency-Key': ':'.join(str(part) for part in parts)}
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_gocardless_client():
+    """
+    Return this process's GoCardless client, building it on first use.
+    Keyed on the PID so forked workers (Celery prefork, gunicorn --preload)
+    never share the parent's pooled connections.
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = _build_gocardless_client()
+                _client_pid = os.getpid()
+    return _client
+
+
+class LazyGoCardlessClient:
+    """Stands in for the client at import time; resolves it on attribute access"""
+
+    def __getattr__(self, name):
+        return getattr(get_gocardless_client(), name)
+
+
+gocardless_client = LazyGoCardlessClient()
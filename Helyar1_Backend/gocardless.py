@@ -0,0 +1,244 @@
+# Helyar1_Backend/gocardless.py
+"""
+Resilient transport for the GoCardless client.
+
+gocardless_pro sends every call through module-level requests.get/post with
+no timeout. ResilientClient swaps in an ApiClient that:
+
+- reuses pooled keep-alive connections from one requests.Session per process,
+- bounds every call (connect/read timeouts plus an overall deadline across retries),
+- retries timeouts, connection errors, 5xx and 429 with full-jitter backoff
+  (POSTs keep the Idempotency-Key the library injected, so retried creates
+  can't duplicate resources),
+- fails fast through a circuit breaker while GoCardless is unhealthy,
+- takes a token from the shared rate limiter (Helyar1_Backend.ratelimit)
+  before every attempt,
+- serves repeated single-resource GETs from a short-TTL cache
+  (Helyar1_Backend.resource_cache), dropped again on writes.
+"""
+import json
+import random
+import threading
+import time
+
+import gocardless_pro
+import requests
+from django.conf import settings
+from gocardless_pro.api_client import ApiClient, update_rate_limit
+from gocardless_pro.errors import GoCardlessProError
+from gocardless_pro.services.base_service import BaseService
+from requests.adapters import HTTPAdapter
+
+from .ratelimit import TokenBucketLimiter
+from .resource_cache import gocardless_cache
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class GoCardlessUnavailableError(GoCardlessProError):
+    """Raised without calling GoCardless while the circuit breaker is open"""
+
+
+class GoCardlessRateLimitedError(GoCardlessUnavailableError):
+    """Raised without calling GoCardless when no rate limit token arrived in time"""
+
+
+class CircuitBreaker:
+    """
+    Per-process breaker: opens after `failure_threshold` consecutive failures,
+    rejects calls for `reset_timeout` seconds, then lets one trial call through.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                raise GoCardlessUnavailableError("GoCardless circuit breaker is open")
+            # Half-open: this call is the trial
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("GoCardless circuit breaker closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.error(f"GoCardless circuit breaker opened after {self._failures} consecutive failures")
+                self._opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+
+class ResilientApiClient(ApiClient):
+
+    BACKOFF_BASE = 0.2
+    BACKOFF_CAP = 2.0
+
+    def __init__(self, base_url, access_token, breaker, limiter):
+        super().__init__(base_url, access_token)
+        self.breaker = breaker
+        self.limiter = limiter
+        self.connect_timeout = settings.GC_CONNECT_TIMEOUT
+        self.read_timeout = settings.GC_READ_TIMEOUT
+        self.deadline = settings.GC_CALL_DEADLINE
+        self.max_retries = settings.GC_MAX_RETRIES
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.GC_POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, path, params=None, headers=None):
+        resource = gocardless_cache.cacheable(path, params)
+        if resource is None:
+            return self._fetch(path, params=params, headers=headers)
+
+        body = gocardless_cache.get(*resource)
+        if body is not None:
+            return self._cached_response(path, body)
+
+        response = self._fetch(path, params=params, headers=headers)
+        gocardless_cache.set(*resource, response.content)
+        return response
+
+    @update_rate_limit
+    def _fetch(self, path, params=None, headers=None):
+        return self._send('GET', path, params=params, headers=headers)
+
+    @update_rate_limit
+    def post(self, path, body, headers=None):
+        return self._write('POST', path, body, headers)
+
+    @update_rate_limit
+    def put(self, path, body, headers=None):
+        return self._write('PUT', path, body, headers)
+
+    @update_rate_limit
+    def delete(self, path, body, headers=None):
+        return self._write('DELETE', path, body, headers)
+
+    def _write(self, method, path, body, headers):
+        try:
+            response = self._send(method, path, body=body, headers=headers)
+        except Exception:
+            # The write may have applied even though we saw no response
+            gocardless_cache.invalidate_write(path, None)
+            raise
+        gocardless_cache.invalidate_write(path, response.content)
+        return response
+
+    def _cached_response(self, path, body):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = body
+        response.headers['Content-Type'] = 'application/json'
+        response.encoding = 'utf-8'
+        response.url = self._url_for(path)
+        return response
+
+    def _send(self, method, path, params=None, body=None, headers=None):
+        self.breaker.before_call()
+        # Time queued for a rate limit token doesn't count against the call deadline
+        if not self.limiter.acquire():
+            raise GoCardlessRateLimitedError(f"GoCardless {method} {path} not sent: rate limit budget exhausted")
+
+        deadline = time.monotonic() + self.deadline
+        # Built once, so every retry of a POST carries the same Idempotency-Key
+        headers = self._headers(headers)
+        data = json.dumps(body) if body is not None else None
+        response = None
+        error = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt and not self.limiter.acquire(deadline):
+                raise GoCardlessRateLimitedError(f"GoCardless {method} {path} not sent: rate limit budget exhausted")
+
+            remaining = deadline - time.monotonic()
+            try:
+                response = self.session.request(
+                    method,
+                    self._url_for(path),
+                    params=params,
+                    data=data,
+                    headers=headers,
+                    timeout=(min(self.connect_timeout, remaining), min(self.read_timeout, remaining)),
+                )
+                error = None
+            except (requests.Timeout, requests.ConnectionError) as e:
+                response = None
+                error = e
+
+            if response is not None and response.status_code < 500 and response.status_code != 429:
+                self.breaker.record_success()
+                self._handle_errors(response)
+                return response
+
+            # Rate limiting isn't an outage; timeouts, connection errors and 5xx are
+            if response is None or response.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                self.limiter.drain()
+
+            delay = random.uniform(0, min(self.BACKOFF_CAP, self.BACKOFF_BASE * (2 ** attempt)))
+            if attempt == self.max_retries or self.breaker.is_open or time.monotonic() + delay >= deadline:
+                break
+
+            logger.warning(
+                f"GoCardless {method} {path} failed "
+                f"({error or f'HTTP {response.status_code}'}), retrying in {delay:.2f}s"
+            )
+            time.sleep(delay)
+
+        if response is not None:
+            self._handle_errors(response)  # Raises the matching ApiError
+            return response
+        raise error
+
+
+class ResilientClient(gocardless_pro.Client):
+    """gocardless_pro.Client over ResilientApiClient"""
+
+    _breaker = None
+    _limiter = None
+
+    def __init__(self, access_token=None, environment=None, base_url=None, **kwargs):
+        super().__init__(access_token=access_token, environment=environment, base_url=base_url, **kwargs)
+
+        # One breaker and limiter per process, shared by every client instance
+        if ResilientClient._breaker is None:
+            ResilientClient._breaker = CircuitBreaker(
+                failure_threshold=settings.GC_BREAKER_FAILURES,
+                reset_timeout=settings.GC_BREAKER_RESET_TIMEOUT,
+            )
+        if ResilientClient._limiter is None:
+            ResilientClient._limiter = TokenBucketLimiter()
+        self._api_client = ResilientApiClient(
+            self._api_client.base_url, access_token, ResilientClient._breaker, ResilientClient._limiter
+        )
+
+    def __getattribute__(self, name):
+        value = super().__getattribute__(name)
+        if isinstance(value, BaseService):
+            # Retries happen in ResilientApiClient, with backoff and a deadline
+            value.max_network_retries = 1
+        return value
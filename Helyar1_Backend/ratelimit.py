@@ -0,0 +1,184 @@
+# Helyar1_Backend/ratelimit.py
+"""
+Client-side rate limiting for outbound GoCardless calls.
+
+A token bucket sized to stay under GoCardless's per-account limit. With
+GC_RATE_LIMIT_REDIS_URL set, the bucket lives in Redis and is shared by every
+web and Celery process on every node; without it, each process keeps its own.
+
+Calls take tokens through one of two lanes:
+    interactive - default; request handlers, and webhook processing, which
+                  finishes checkouts users are waiting on
+    background  - Celery sync/reconciliation/retry jobs
+
+The background lane can't take the last GC_RATE_LIMIT_RESERVE fraction of the
+bucket, so a resync burst drains the bucket only down to the reserve and live
+checkouts still get tokens immediately.
+
+    with background_priority():
+        gocardless_client.subscriptions.get(...)
+
+background_priority() also works as a decorator.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+import logging
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+_lane = ContextVar('gocardless_lane', default=INTERACTIVE)
+
+
+@contextmanager
+def background_priority():
+    """Run the enclosed GoCardless calls in the background lane"""
+    token = _lane.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def current_lane():
+    return _lane.get()
+
+
+# Refill, then take one token if that leaves at least `floor` behind.
+# Returns {taken, ms until a token is available to this lane}.
+# Uses the Redis clock so nodes with skewed clocks agree.
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local floor = tonumber(ARGV[3])
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local taken = 0
+local wait_ms = 0
+if tokens - 1 >= floor then
+    tokens = tokens - 1
+    taken = 1
+else
+    wait_ms = math.ceil((floor + 1 - tokens) / rate * 1000)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return {taken, wait_ms}
+"""
+
+_DRAIN_SCRIPT = """
+local now_parts = redis.call('TIME')
+redis.call('HSET', KEYS[1], 'tokens', '0', 'ts', tostring(tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000))
+return 1
+"""
+
+
+class _LocalBucket:
+    """Same algorithm as _TAKE_SCRIPT, for a single process"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._tokens = capacity
+        self._ts = time.monotonic()
+
+    def take(self, floor):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._ts) * self.rate)
+            self._ts = now
+            if self._tokens - 1 >= floor:
+                self._tokens -= 1
+                return True, 0
+            return False, (floor + 1 - self._tokens) / self.rate
+
+    def drain(self):
+        with self._lock:
+            self._tokens = 0
+            self._ts = time.monotonic()
+
+
+class TokenBucketLimiter:
+    KEY = 'ratelimit:gocardless'
+
+    def __init__(self):
+        self.rate = settings.GC_RATE_LIMIT_PER_MINUTE / 60
+        self.capacity = settings.GC_RATE_LIMIT_BURST
+        self.floors = {
+            INTERACTIVE: 0,
+            BACKGROUND: self.capacity * settings.GC_RATE_LIMIT_RESERVE,
+        }
+        self.max_waits = {
+            INTERACTIVE: settings.GC_RATE_LIMIT_INTERACTIVE_WAIT,
+            BACKGROUND: settings.GC_RATE_LIMIT_BACKGROUND_WAIT,
+        }
+        self._local = _LocalBucket(self.rate, self.capacity)
+        self._redis = None
+        self._take = None
+
+    def _get_redis(self):
+        url = getattr(settings, 'GC_RATE_LIMIT_REDIS_URL', None)
+        if not url:
+            return None
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(url)
+            self._take = self._redis.register_script(_TAKE_SCRIPT)
+        return self._redis
+
+    def _try_take(self, floor):
+        """Returns (taken, seconds until a token is available)"""
+        client = self._get_redis()
+        if client is not None:
+            try:
+                taken, wait_ms = self._take(keys=[self.KEY], args=[self.rate, self.capacity, floor])
+                return bool(taken), wait_ms / 1000
+            except Exception as e:
+                logger.warning(f"GoCardless rate limiter Redis unavailable, limiting locally: {str(e)}")
+        return self._local.take(floor)
+
+    def acquire(self, deadline=None):
+        """
+        Wait for a token in the current lane. Returns False if none became
+        available within the lane's maximum wait (or before `deadline`, a
+        time.monotonic() value).
+        """
+        lane = current_lane()
+        floor = self.floors[lane]
+        give_up = time.monotonic() + self.max_waits[lane]
+        if deadline is not None:
+            give_up = min(give_up, deadline)
+
+        while True:
+            taken, wait = self._try_take(floor)
+            if taken:
+                return True
+            remaining = give_up - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"No GoCardless rate limit token for the {lane} lane")
+                return False
+            time.sleep(min(wait, remaining))
+
+    def drain(self):
+        """Empty the bucket after GoCardless returns 429, so every process backs off"""
+        self._local.drain()
+        client = self._get_redis()
+        if client is not None:
+            try:
+                client.eval(_DRAIN_SCRIPT, 1, self.KEY)
+            except Exception as e:
+                logger.warning(f"Failed to drain GoCardless rate limit bucket: {str(e)}")
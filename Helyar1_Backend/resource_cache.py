@@ -0,0 +1,182 @@
+# Helyar1_Backend/resource_cache.py
+"""
+Short-TTL read-through cache for GoCardless resource fetches.
+
+ResilientApiClient serves GET /<resource_type>/<id> (e.g. subscriptions.get,
+billing_requests.get) from here, so repeated reads of one resource within a
+webhook batch, or by CompleteMandate and the webhook path, cost one round trip.
+Entries live GC_CACHE_TTL seconds in Redis when GC_CACHE_REDIS_URL is set, so
+web and Celery processes share them. The per-process LRU in front of it can't
+be invalidated from other processes, so it keeps entries only
+GC_CACHE_LOCAL_TTL seconds (by default a second or so, enough to absorb
+repeated reads within one request or task).
+
+Entries are dropped when we write to the resource (any POST/PUT/DELETE under
+its path, plus the resources linked from the write's response), and once per
+webhook batch for the resources its events link to.
+"""
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+import logging
+logger = logging.getLogger(__name__)
+
+_RESOURCE_PATH = re.compile(r'^/(?P<resource_type>[a-z_]+)/(?P<identity>[A-Z0-9]+)(?:/|$)')
+
+# Link names in API/event payloads -> resource type they point at
+LINK_RESOURCES = {
+    'billing_request': 'billing_requests',
+    'customer': 'customers',
+    'mandate': 'mandates',
+    'mandate_request_mandate': 'mandates',
+    'subscription': 'subscriptions',
+}
+
+
+class _LocalLRU:
+    def __init__(self, size):
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if time.monotonic() > expires:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class GoCardlessResourceCache:
+
+    def __init__(self):
+        self._local = _LocalLRU(getattr(settings, 'GC_CACHE_LOCAL_SIZE', 1000))
+        self._redis = None
+
+    @staticmethod
+    def _local_ttl():
+        return min(settings.GC_CACHE_LOCAL_TTL, settings.GC_CACHE_TTL)
+
+    def _get_redis(self):
+        url = getattr(settings, 'GC_CACHE_REDIS_URL', None)
+        if not url:
+            return None
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(url)
+        return self._redis
+
+    @staticmethod
+    def _key(resource_type, identity):
+        return f"gocardless:{resource_type}:{identity}"
+
+    @staticmethod
+    def resource_for(path):
+        """(resource_type, id) a request path addresses, or None"""
+        match = _RESOURCE_PATH.match(path)
+        if match is None:
+            return None
+        return match.group('resource_type'), match.group('identity')
+
+    def cacheable(self, path, params):
+        resource = self.resource_for(path)
+        if resource is None or params or path.count('/') != 2:
+            return None
+        if resource[0] not in settings.GC_CACHE_RESOURCES or settings.GC_CACHE_TTL <= 0:
+            return None
+        return resource
+
+    def get(self, resource_type, identity):
+        """Cached response body (bytes) for a resource, or None"""
+        key = self._key(resource_type, identity)
+        body = self._local.get(key)
+        if body is not None:
+            return body
+
+        client = self._get_redis()
+        if client is not None:
+            try:
+                body = client.get(key)
+            except Exception as e:
+                logger.warning(f"GoCardless cache unavailable, fetching: {str(e)}")
+            if body is not None:
+                self._local.set(key, body, self._local_ttl())
+        return body
+
+    def set(self, resource_type, identity, body):
+        key = self._key(resource_type, identity)
+        self._local.set(key, body, self._local_ttl())
+        client = self._get_redis()
+        if client is not None:
+            try:
+                client.set(key, body, px=int(settings.GC_CACHE_TTL * 1000))
+            except Exception as e:
+                logger.warning(f"Failed to cache GoCardless {resource_type} {identity}: {str(e)}")
+
+    def invalidate(self, *resources):
+        """Drop cached (resource_type, id) pairs"""
+        keys = [self._key(resource_type, identity) for resource_type, identity in resources]
+        for key in keys:
+            self._local.delete(key)
+
+        client = self._get_redis()
+        if client is not None and keys:
+            try:
+                client.delete(*keys)
+            except Exception as e:
+                logger.warning(f"Failed to invalidate cached GoCardless resources {keys}: {str(e)}")
+
+    def invalidate_links(self, *links):
+        """Drop the resources one or more payloads' `links` point at, in one call"""
+        self.invalidate(*{
+            (LINK_RESOURCES[name], identity)
+            for payload_links in links
+            for name, identity in (payload_links or {}).items()
+            if name in LINK_RESOURCES and identity
+        })
+
+    def invalidate_write(self, path, body):
+        """Drop the resource a write addressed and the resources linked from its response"""
+        resources = []
+        resource = self.resource_for(path)
+        if resource is not None:
+            resources.append(resource)
+
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            payload = {}
+        for envelope, data in payload.items():
+            if isinstance(data, dict):
+                if data.get('id'):
+                    resources.append((envelope, data['id']))
+                resources.extend(
+                    (LINK_RESOURCES[name], identity)
+                    for name, identity in (data.get('links') or {}).items()
+                    if name in LINK_RESOURCES and identity
+                )
+        self.invalidate(*resources)
+
+
+gocardless_cache = GoCardlessResourceCache()
@@ -292,6 +292,49 @@ LOGGING = {
 }
 
 
+# ============================================================================
+# CATALOG SNAPSHOT
+# ============================================================================
+
+# Rendered catalog shared by all worker processes through a memory-mapped file.
+# Point this at a tmpfs (e.g. /dev/shm) in production.
+CATALOG_SNAPSHOT_PATH = env('CATALOG_SNAPSHOT_PATH', default=os.path.join(BASE_DIR, 'run', 'catalog.snapshot'))
+
+
+# ============================================================================
+# SINGLE-FLIGHT REQUEST COALESCING
+# ============================================================================
+
+# Set to share in-flight computations across nodes (e.g. redis://localhost:6379/2)
+SINGLEFLIGHT_REDIS_URL = env('SINGLEFLIGHT_REDIS_URL', default=None)
+SINGLEFLIGHT_TIMEOUT = env.float('SINGLEFLIGHT_TIMEOUT', default=10)
+
+
+# ============================================================================
+# ENTITLEMENT CACHE
+# ============================================================================
+
+# Per-user subscription entitlements for permission checks. Redis is optional;
+# without it each process keeps only its short-lived local LRU. A read racing an
+# invalidation can write back a stale entry, so Redis entries are kept as briefly
+# as local ones; Redis still spares the other processes the database read.
+ENTITLEMENT_REDIS_URL = env('ENTITLEMENT_REDIS_URL', default=None)
+ENTITLEMENT_CACHE_TTL = env.int('ENTITLEMENT_CACHE_TTL', default=30)
+ENTITLEMENT_LOCAL_TTL = env.float('ENTITLEMENT_LOCAL_TTL', default=30)
+ENTITLEMENT_LOCAL_SIZE = env.int('ENTITLEMENT_LOCAL_SIZE', default=10000)
+
+
+# ============================================================================
+# SUBSCRIPTION STATUS EVENTS
+# ============================================================================
+
+# Redis pub/sub carrying subscription changes from Celery workers to the web
+# processes holding MandateStatusStream connections (e.g. redis://localhost:6379/3)
+SUBSCRIPTION_EVENTS_REDIS_URL = env('SUBSCRIPTION_EVENTS_REDIS_URL', default=None)
+# Matches the 10 minute setup timeout in MandateStatus
+MANDATE_STATUS_STREAM_TIMEOUT = env.int('MANDATE_STATUS_STREAM_TIMEOUT', default=600)
+
+
 # ============================================================================
 # SESSION CONFIGURATION (Enhanced for GoCardless)
 # ============================================================================
@@ -371,11 +414,39 @@ SIMPLE_JWT = {
 # GOCARDLESS CONFIGURATION
 # ============================================================================
 
-GC_ACCESS_TOKEN = env('GC_ACCESS_TOKEN')
+GC_ACCESS_TOKEN = env('GC_ACCESS_TOKEN', default='')  # Checked when the client is first used
 GC_PUBLISHABLE_KEY = env('GC_PUBLISHABLE_KEY', default='')
 GC_WEBHOOK_SECRET = env('GC_WEBHOOK_SECRET')
 GC_ENVIRONMENT = env('GC_ENVIRONMENT', default='sandbox')
 
+# Outbound API calls (see Helyar1_Backend/gocardless.py)
+GC_CONNECT_TIMEOUT = env.float('GC_CONNECT_TIMEOUT', default=3.05)  # seconds
+GC_READ_TIMEOUT = env.float('GC_READ_TIMEOUT', default=10)  # seconds
+GC_CALL_DEADLINE = env.float('GC_CALL_DEADLINE', default=15)  # seconds, across all retries of one call
+GC_MAX_RETRIES = env.int('GC_MAX_RETRIES', default=3)
+GC_POOL_SIZE = env.int('GC_POOL_SIZE', default=10)  # keep-alive connections per process
+GC_BREAKER_FAILURES = env.int('GC_BREAKER_FAILURES', default=5)  # consecutive failures before failing fast
+GC_BREAKER_RESET_TIMEOUT = env.int('GC_BREAKER_RESET_TIMEOUT', default=30)  # seconds before a trial call
+GC_LIST_PAGE_SIZE = env.int('GC_LIST_PAGE_SIZE', default=500)  # records per list call (GoCardless maximum)
+
+# Client-side rate limiting (see Helyar1_Backend/ratelimit.py). GoCardless allows
+# 1000 requests/minute per account; stay under it. Set the Redis URL to share the
+# bucket across processes and nodes (e.g. redis://localhost:6379/4).
+GC_RATE_LIMIT_REDIS_URL = env('GC_RATE_LIMIT_REDIS_URL', default=None)
+GC_RATE_LIMIT_PER_MINUTE = env.int('GC_RATE_LIMIT_PER_MINUTE', default=900)
+GC_RATE_LIMIT_BURST = env.int('GC_RATE_LIMIT_BURST', default=100)
+GC_RATE_LIMIT_RESERVE = env.float('GC_RATE_LIMIT_RESERVE', default=0.3)  # share of the bucket only interactive calls may use
+GC_RATE_LIMIT_INTERACTIVE_WAIT = env.float('GC_RATE_LIMIT_INTERACTIVE_WAIT', default=2)  # seconds
+GC_RATE_LIMIT_BACKGROUND_WAIT = env.float('GC_RATE_LIMIT_BACKGROUND_WAIT', default=60)  # seconds
+
+# Read-through cache for single-resource GETs (see Helyar1_Backend/resource_cache.py).
+# Set the Redis URL to share entries between web and Celery processes (e.g. redis://localhost:6379/5).
+GC_CACHE_REDIS_URL = env('GC_CACHE_REDIS_URL', default=None)
+GC_CACHE_TTL = env.float('GC_CACHE_TTL', default=10)  # seconds; 0 disables the cache
+# Per-process copies can't be invalidated by other processes, so keep them briefly
+GC_CACHE_LOCAL_TTL = env.float('GC_CACHE_LOCAL_TTL', default=1)
+GC_CACHE_RESOURCES = env.list('GC_CACHE_RESOURCES', default=['subscriptions', 'billing_requests', 'mandates', 'customers'])
+
 # Base URLs for redirects (make environment-aware)
 if ENVIRONMENT == 'production':
     BASE_FRONTEND_URL = env('FRONTEND_URL', default='https://yourdomain.com')
@@ -423,19 +494,89 @@ from celery.schedules import crontab
 
 CELERY_BEAT_SCHEDULE = {
     'check-expired-subscriptions': {
-        'task': 'subscriptions.tasks.check_expired_subscriptions',
+        'task': 'subscriptions.task.check_expired_subscriptions',
         'schedule': crontab(hour=0, minute=0),  # Daily at midnight UTC
     },
     'send-expiry-reminders': {
-        'task': 'subscriptions.tasks.send_expiry_reminders',
+        'task': 'subscriptions.task.send_expiry_reminders',
         'schedule': crontab(hour=9, minute=0),  # Daily at 9 AM UTC
     },
     'cleanup-pending-subscriptions': {
-        'task': 'subscriptions.tasks.cleanup_pending_subscriptions',
+        'task': 'subscriptions.task.cleanup_pending_subscriptions',
         'schedule': crontab(hour=2, minute=0),  # Daily at 2 AM UTC
     },
+    'send-saved-offer-expiry-alerts': {
+        'task': 'offers.tasks.send_saved_offer_expiry_alerts',
+        'schedule': crontab(hour=8, minute=0),  # Daily at 8 AM UTC
+    },
+    'send-weekly-offer-digest': {
+        'task': 'notifications.tasks.send_weekly_offer_digest',
+        'schedule': crontab(hour=10, minute=0, day_of_week='monday'),  # Weekly, Monday 10 AM UTC
+    },
+    'retry-webhook-events': {
+        'task': 'subscriptions.task.retry_webhook_events',
+        'schedule': crontab(minute='*/5'),  # Every 5 minutes
+    },
+    'catch-up-webhook-events': {
+        'task': 'subscriptions.task.catch_up_webhook_events',
+        'schedule': crontab(minute='*/10'),  # Every 10 minutes
+    },
+    'prune-webhook-events': {
+        'task': 'subscriptions.task.prune_webhook_events',
+        'schedule': crontab(hour=3, minute=30),  # Daily at 3:30 AM UTC
+    },
+    'reconcile-subscriptions': {
+        'task': 'subscriptions.task.reconcile_subscriptions',
+        'schedule': crontab(hour=4, minute=0),  # Daily at 4 AM UTC
+    },
+    'reconcile-active-offer-counts': {
+        'task': 'offers.tasks.reconcile_active_offer_counts',
+        'schedule': crontab(minute=15),  # Hourly at :15
+    },
 }
 
+# Checkout GoCardless calls run as chained Celery tasks behind a BillingOperation
+# status handle; turn off to run them inline in the request (old response shape)
+BILLING_ORCHESTRATION_ASYNC = env.bool('BILLING_ORCHESTRATION_ASYNC', default=True)
+# Retries per step for transient errors and billing requests not yet fulfilled
+BILLING_STEP_MAX_RETRIES = env.int('BILLING_STEP_MAX_RETRIES', default=6)
+
+# Rows per transaction for the set-based subscription lifecycle jobs
+SUBSCRIPTION_JOB_CHUNK_SIZE = env.int('SUBSCRIPTION_JOB_CHUNK_SIZE', default=1000)
+# Times a subscription status transition re-reads the row after losing a
+# compare-and-swap race before giving up (the caller's task is then retried)
+SUBSCRIPTION_TRANSITION_ATTEMPTS = env.int('SUBSCRIPTION_TRANSITION_ATTEMPTS', default=5)
+
+# Saved offers ending within this many days are included in the daily alert
+SAVED_OFFER_ALERT_DAYS = env.int('SAVED_OFFER_ALERT_DAYS', default=3)
+
+# Recipients per delivery task for the weekly offer digest
+DIGEST_CHUNK_SIZE = env.int('DIGEST_CHUNK_SIZE', default=500)
+
+# Webhook inbox: events claimed per batch, retry limit, and seconds before a
+# 'processing' event is considered abandoned by its worker
+WEBHOOK_BATCH_SIZE = env.int('WEBHOOK_BATCH_SIZE', default=100)
+WEBHOOK_MAX_ATTEMPTS = env.int('WEBHOOK_MAX_ATTEMPTS', default=5)
+WEBHOOK_STALE_AFTER = env.int('WEBHOOK_STALE_AFTER', default=600)
+
+# Webhook events are hash-partitioned by subscription/mandate onto queues
+# named <prefix>.<n>; each queue needs exactly one single-process consumer
+WEBHOOK_PARTITIONS = env.int('WEBHOOK_PARTITIONS', default=8)
+WEBHOOK_QUEUE_PREFIX = env('WEBHOOK_QUEUE_PREFIX', default='webhooks')
+
+# Seconds a partition waits before draining, so bursts of payment/subscription
+# events for one subscription are coalesced into a single transition
+WEBHOOK_COALESCE_WINDOW = env.float('WEBHOOK_COALESCE_WINDOW', default=5)
+
+# How long accepted webhook event IDs are remembered for deduplication
+# (GoCardless retries failed deliveries for several days)
+WEBHOOK_IDEMPOTENCY_TTL_DAYS = env.int('WEBHOOK_IDEMPOTENCY_TTL_DAYS', default=30)
+
+# Events API catch-up: seconds re-read behind the stored cursor (events can
+# become visible slightly out of order), and how far back the first run looks
+WEBHOOK_CATCHUP_OVERLAP = env.int('WEBHOOK_CATCHUP_OVERLAP', default=300)
+WEBHOOK_CATCHUP_INITIAL_LOOKBACK = env.int('WEBHOOK_CATCHUP_INITIAL_LOOKBACK', default=86400)
+
 
 # ============================================================================
 # GOOGLE LOGIN SETUP
@@ -0,0 +1,135 @@
+# Helyar1_Backend/singleflight.py
+"""
+Single-flight request coalescing.
+
+Concurrent callers asking for the same key share one computation instead of
+each rebuilding the same result. Coalescing always happens within a process;
+when SINGLEFLIGHT_REDIS_URL is set, it also happens across nodes through a
+Redis lock, with the leader publishing its (JSON) result for remote waiters.
+Results are keyed by the leader's lock token, so a waiter only ever reads the
+result of the flight it joined, never one left behind by an earlier flight.
+
+Waiters that time out compute the result themselves rather than fail.
+"""
+import json
+import secrets
+import threading
+import time
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    REDIS_POLL_INTERVAL = 0.05
+
+    def __init__(self, namespace, timeout=None, result_ttl=5, shared=True):
+        self.namespace = namespace
+        self.timeout = timeout or getattr(settings, 'SINGLEFLIGHT_TIMEOUT', 10)
+        self.result_ttl = result_ttl
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._redis = None
+
+    def do(self, key, fn):
+        """Return fn(), running it at most once at a time per key"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if call.done.wait(self.timeout):
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            logger.warning(f"Single-flight wait timed out for {self.namespace}:{key}, computing locally")
+            return fn()
+
+        try:
+            call.result = self._do_shared(key, fn)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            call.done.set()
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def _get_redis(self):
+        url = getattr(settings, 'SINGLEFLIGHT_REDIS_URL', None)
+        if not self.shared or not url:
+            return None
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(url)
+        return self._redis
+
+    def _result_key(self, key, token):
+        return f"singleflight:{self.namespace}:result:{key}:{token}"
+
+    def _do_shared(self, key, fn):
+        """Coalesce across nodes when Redis is configured"""
+        client = self._get_redis()
+        if client is None:
+            return fn()
+
+        lock_key = f"singleflight:{self.namespace}:lock:{key}"
+        token = secrets.token_hex(8)
+
+        try:
+            acquired = client.set(lock_key, token, nx=True, px=int(self.timeout * 1000))
+            # The lock holds the leader's token, which names the key its result goes to
+            leader_token = token if acquired else client.get(lock_key)
+        except Exception as e:
+            logger.warning(f"Single-flight Redis unavailable, computing locally: {str(e)}")
+            return fn()
+
+        if acquired:
+            try:
+                result = fn()
+                try:
+                    client.set(self._result_key(key, token), json.dumps(result), px=int(self.result_ttl * 1000))
+                except Exception as e:
+                    # Waiters on other nodes time out and compute it themselves
+                    logger.warning(f"Failed to publish single-flight result for {self.namespace}:{key}: {str(e)}")
+                return result
+            finally:
+                # Only release the lock if it is still ours
+                try:
+                    if client.get(lock_key) == token.encode():
+                        client.delete(lock_key)
+                except Exception as e:
+                    logger.warning(f"Failed to release single-flight lock {lock_key}: {str(e)}")
+
+        if leader_token is None:
+            # The flight we lost to has already ended; don't reuse its result
+            return fn()
+
+        # Another node is computing, wait for its published result
+        result_key = self._result_key(key, leader_token.decode())
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            try:
+                payload = client.get(result_key)
+            except Exception as e:
+                logger.warning(f"Single-flight Redis unavailable, computing locally: {str(e)}")
+                break
+            if payload is not None:
+                return json.loads(payload)
+            time.sleep(self.REDIS_POLL_INTERVAL)
+
+        logger.warning(f"Single-flight remote wait ended for {self.namespace}:{key}, computing locally")
+        return fn()
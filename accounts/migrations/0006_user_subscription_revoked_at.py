@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_alter_brandaccountrequest_brand_logo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='subscription_revoked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
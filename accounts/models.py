@@ -53,6 +53,7 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_superuser = models.BooleanField(default=False)
     mail_verified = models.BooleanField(default=False)
     subscription_status= models.BooleanField(default=False)
+    subscription_revoked_at = models.DateTimeField(null=True, blank=True)  # Tokens issued earlier must be refreshed
     brand_request_id = models.CharField(max_length=256, blank=True, null=True)
     last_logout = models.DateTimeField(null=True, blank=True)
     date_joined = models.DateField(auto_now_add=True)  # Renamed for clarity (was 'joins')
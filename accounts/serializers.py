@@ -3,8 +3,10 @@ from django.conf import settings
 from django.utils import timezone  # Added if needed for validation timestamps
 
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
 
 from .tasks import verify_phone_number
+from .tokens import SubscriptionRefreshToken
 from user_consent.consent_service import  UserConsentService
 from notifications.marketing_service import MarketingPreferenceService
 from user_consent.consent_service import UserConsentService
@@ -251,4 +253,9 @@ class ResetPasswordSerializer(serializers.Serializer):
         except User.DoesNotExist:
             raise serializers.ValidationError({"email": "User with this email does not exist."})
         
-        return data
\ No newline at end of file
+        return data
+    
+
+class SubscriptionTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refresh that re-reads the subscription claims for the new access token"""
+    token_class = SubscriptionRefreshToken
@@ -1,3 +1,92 @@
+import time
+from datetime import timedelta
+from unittest import mock
+
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+
+from custom_permissions.user_subscribed_permission import IsSubscribed
+from subscriptions.entitlements import EntitlementService
+from subscriptions.models import Subscription
+from subscriptions.state_machine import SubscriptionStateMachine
+from user_profile.models import UserProfile
+from .models import User
+from .tokens import SUB_ACTIVE_UNTIL_CLAIM, SubscriptionRefreshToken
+
+
+class SubscriberView(APIView):
+    permission_classes = [IsSubscribed]
+
+    def get(self, request):
+        return Response({'ok': True})
+
+
+class IsSubscribedTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='member@example.com', password='x', is_active=True)
+        UserProfile.objects.create(user=self.user)
+        self.subscription = Subscription.objects.create(user=self.user, status='pending')
+        EntitlementService.invalidate(self.user.id)
+
+    def activate(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            SubscriptionStateMachine.transition(
+                self.subscription, 'active', is_active=True, expires_at=timezone.now() + timedelta(days=365)
+            )
+
+    def access_token(self, issued_at=None):
+        with mock.patch('accounts.tokens.time.time', return_value=issued_at or time.time()):
+            return SubscriptionRefreshToken.for_user(self.user).access_token
+
+    def get(self, token):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return SubscriberView.as_view()(request)
+
+    def test_claim_grants_access(self):
+        self.activate()
+        token = self.access_token()
+        self.assertIsNotNone(token[SUB_ACTIVE_UNTIL_CLAIM])
+
+        with mock.patch.object(EntitlementService, 'has_active_subscription') as has_active_subscription:
+            response = self.get(token)
+
+        self.assertEqual(response.status_code, 200)
+        has_active_subscription.assert_not_called()
+
+    def test_without_claim(self):
+        token = self.access_token()
+        self.assertIsNone(token[SUB_ACTIVE_UNTIL_CLAIM])
+
+        self.assertEqual(self.get(token).status_code, 403)
+
+        # Renewed since the token was issued; the entitlement is checked instead
+        self.activate()
+        self.assertEqual(self.get(token).status_code, 200)
+
+    def test_revoked_claim_requires_refresh(self):
+        self.activate()
+        token = self.access_token(issued_at=time.time() - 60)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SubscriptionStateMachine.transition(self.subscription, 'cancelled', is_active=False)
+
+        response = self.get(token)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['detail'].code, 'token_refresh_required')
+
+        token = self.access_token()
+        self.assertIsNone(token[SUB_ACTIVE_UNTIL_CLAIM])
+        self.assertEqual(self.get(token).status_code, 403)
+
+    def test_claims_read_the_database(self):
+        # Cached before the subscription was activated by another process
+        self.assertFalse(EntitlementService.has_active_subscription(self.user.id))
+        Subscription.objects.filter(pk=self.subscription.pk).update(
+            status='active', is_active=True, expires_at=timezone.now() + timedelta(days=365)
+        )
 
-# Create your tests here.
+        self.assertIsNotNone(self.access_token()[SUB_ACTIVE_UNTIL_CLAIM])
@@ -0,0 +1,55 @@
+# accounts/tokens.py
+"""
+JWT tokens carrying the caller's subscription entitlement.
+
+Access tokens include `sub_active_until` (UNIX time the subscription is paid
+up to, or null) and `sub_checked_at` (when that was read), so IsSubscribed can
+authorize paying members from the token alone. Once a downgrade commits it
+stamps User.subscription_revoked_at, which makes older tokens ask for a refresh.
+"""
+import time
+
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+SUB_ACTIVE_UNTIL_CLAIM = 'sub_active_until'
+SUB_CHECKED_AT_CLAIM = 'sub_checked_at'
+
+
+def subscription_claims(user_id):
+    from subscriptions.entitlements import EntitlementService
+
+    # Stamped before the read, and read from the database rather than a process-local
+    # cache. Revocations are stamped after their downgrade commits, so a read that
+    # missed the downgrade is always older than the stamp and must be refreshed.
+    checked_at = round(time.time(), 3)
+    entitlement = EntitlementService.get(user_id, fresh=True)
+    active_until = int(entitlement.expires_at.timestamp()) if entitlement.active else None
+    return {
+        SUB_ACTIVE_UNTIL_CLAIM: active_until,
+        SUB_CHECKED_AT_CLAIM: checked_at,
+    }
+
+
+def revoke_subscription_claims(user_ids):
+    """
+    Force tokens issued before now to be refreshed before they grant subscriber
+    access. Call it after the downgrade has committed (see SubscriptionFlagService).
+    """
+    from .models import User
+    User.objects.filter(id__in=user_ids).update(subscription_revoked_at=timezone.now())
+
+
+class SubscriptionRefreshToken(RefreshToken):
+    """Refresh token whose access tokens carry fresh subscription claims"""
+
+    # Entitlement is re-read for every access token, never copied from the refresh token
+    no_copy_claims = RefreshToken.no_copy_claims + (SUB_ACTIVE_UNTIL_CLAIM, SUB_CHECKED_AT_CLAIM)
+
+    @property
+    def access_token(self):
+        access = super().access_token
+        for claim, value in subscription_claims(self.payload[api_settings.USER_ID_CLAIM]).items():
+            access[claim] = value
+        return access
@@ -12,6 +12,7 @@ urlpatterns = [
     path('otp-validation/', CheckResetCodeView.as_view()),
     path('reset-password/', ResetPasswordView.as_view()),
     path('logout/', UserLogoutView.as_view()),
+    path('token/refresh/', SubscriptionTokenRefreshView.as_view()),
     path('auth/google/login/', GoogleLoginView.as_view(), name='google-login'),
     path('auth/google/callback/', GoogleCallbackView.as_view(), name='google-callback'),  
 ]
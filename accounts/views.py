@@ -10,12 +10,14 @@ from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser
 
 from rest_framework_simplejwt.tokens import RefreshToken, TokenError
+from rest_framework_simplejwt.views import TokenRefreshView
 
 from drf_spectacular.utils import extend_schema, OpenApiResponse
 
 from .models import *
 from .serializers import *
 from .tasks import mail_send
+from .tokens import SubscriptionRefreshToken
 from .services.google_auth import GoogleAuthService
 from user_consent.consent_service import UserConsentService
 from notifications.marketing_service import MarketingPreferenceService
@@ -112,7 +114,7 @@ class EmailVerificationView(APIView):
                 user.role = "customer"
                 user.save()
 
-                ref_token = RefreshToken.for_user(user)
+                ref_token = SubscriptionRefreshToken.for_user(user)
                 logger.debug(f"refresh token: {str(ref_token)}")
                 response = {
                     "email": user.email,
@@ -327,7 +329,7 @@ class GoogleCallbackView(APIView):
             update_last_login(None, user)
 
             # Generate tokens
-            refresh_token = RefreshToken.for_user(user)
+            refresh_token = SubscriptionRefreshToken.for_user(user)
             access_token = refresh_token.access_token
 
             response_data = {
@@ -377,7 +379,7 @@ class UserLoginView(APIView):
             first_name = user.first_name
             last_name = user.last_name
             
-            refresh_token = RefreshToken.for_user(user)
+            refresh_token = SubscriptionRefreshToken.for_user(user)
             access_token = refresh_token.access_token
             
             response = {
@@ -588,4 +590,17 @@ class UserLogoutView(APIView):
             return Response(
                 {"detail": "An error occurred during logout"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
+
+
+class SubscriptionTokenRefreshView(TokenRefreshView):
+    """Exchange a refresh token for an access token with current subscription claims"""
+    serializer_class = SubscriptionTokenRefreshSerializer
+    
+    @extend_schema(
+        tags=["accounts"],
+        description="Refresh the access token. Call again whenever a request fails with 'token_refresh_required'.",
+        summary="Token Refresh",
+    )
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
@@ -0,0 +1,9 @@
+from rest_framework import permissions
+
+class IsBrand(permissions.BasePermission):
+    """
+    Allows access only to authenticated users with the 'brand' role.
+    """
+
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and getattr(request.user, 'role', None) == "brand"
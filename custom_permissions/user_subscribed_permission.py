@@ -1,13 +1,37 @@
+import time
+
 from rest_framework import permissions
+from rest_framework.exceptions import AuthenticationFailed
+from accounts.tokens import SUB_ACTIVE_UNTIL_CLAIM, SUB_CHECKED_AT_CLAIM
+from subscriptions.entitlements import EntitlementService
 
 class IsSubscribed(permissions.BasePermission):
     """
     Allows access only to authenticated users who are subscribed.
     Works for both view-level and object-level checks.
+    Paying members are authorized from the sub_active_until claim of their access
+    token; tokens without a current claim fall back to the cached EntitlementService.
     """
 
     def has_permission(self, request, view):
-        return request.user.is_authenticated and getattr(request.user, 'subscribed', False)
+        return request.user.is_authenticated and self._is_subscribed(request)
 
     def has_object_permission(self, request, view, obj):
-        return request.user.is_authenticated and getattr(request.user, 'subscribed', False)
+        return request.user.is_authenticated and self._is_subscribed(request)
+
+    def _is_subscribed(self, request):
+        token = request.auth
+        active_until = token.get(SUB_ACTIVE_UNTIL_CLAIM) if token is not None else None
+
+        if active_until and active_until > time.time():
+            # request.user is already loaded by JWTAuthentication, so this costs nothing
+            revoked_at = request.user.subscription_revoked_at
+            if revoked_at and token.get(SUB_CHECKED_AT_CLAIM, 0) < revoked_at.timestamp():
+                raise AuthenticationFailed(
+                    "Your subscription has changed, please refresh your access token.",
+                    code="token_refresh_required",
+                )
+            return True
+
+        # No current claim (not subscribed when issued, or it lapsed): the user may have renewed since
+        return EntitlementService.has_active_subscription(request.user.id)
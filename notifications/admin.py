@@ -1,3 +1,10 @@
 from django.contrib import admin
 
 # Register your models here.
+from .models import OfferDigest
+
+
+@admin.register(OfferDigest)
+class OfferDigestAdmin(admin.ModelAdmin):
+    list_display = ['period_start', 'period_end', 'offer_count', 'segment_count', 'recipient_count', 'created_at']
+    readonly_fields = ['period_start', 'period_end', 'offer_count', 'segment_count', 'recipient_count', 'created_at']
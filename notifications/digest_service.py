@@ -0,0 +1,94 @@
+from collections import defaultdict
+from datetime import timedelta
+from html import escape
+
+from django.conf import settings
+from django.utils import timezone
+
+from offers.models import Offer
+from user_profile.models import UserProfile
+from .models import MarketingPreferences, OfferDigest
+
+
+class OfferDigestService:
+    """
+    Builds the new-offers digest.
+    Subscribers are grouped into segments (channel + employer) so each distinct
+    digest body is rendered once, however many users receive it.
+    """
+
+    EMPLOYER_NAMES = dict(UserProfile.EMPLOYER)
+    # Covered by the very first digest, when there is no previous run to start from
+    FIRST_PERIOD = timedelta(days=7)
+
+    @staticmethod
+    def get_period():
+        """Offers are collected from the end of the last digest up to now"""
+        period_end = timezone.now()
+        last_digest = OfferDigest.objects.order_by('-period_end').first()
+        period_start = last_digest.period_end if last_digest else period_end - OfferDigestService.FIRST_PERIOD
+        return period_start, period_end
+
+
+    @staticmethod
+    def get_new_offers(period_start, period_end):
+        return list(Offer.objects.filter(
+            is_active=True,
+            end_date__gte=period_end,
+            created_at__gte=period_start,
+            created_at__lt=period_end,
+        ).select_related('subcategory__category').order_by('subcategory__category__name', 'brand_name'))
+
+
+    @staticmethod
+    def get_segments():
+        """
+        Map (channel, employer) -> recipients in a single query.
+        Email recipients are (email, name) pairs, SMS recipients are phone numbers.
+        """
+        segments = defaultdict(list)
+
+        rows = MarketingPreferences.objects.filter(
+            user__is_active=True,
+        ).exclude(
+            email=False, sms=False,
+        ).values_list(
+            'email', 'sms', 'user__email', 'user__first_name', 'user__last_name',
+            'user__phone_no', 'user__profile__employer',
+        )
+
+        for wants_email, wants_sms, email, first_name, last_name, phone_no, employer in rows:
+            if wants_email:
+                name = f"{first_name} {last_name}".strip() or "Subscriber"
+                segments[('email', employer)].append((email, name))
+            if wants_sms and phone_no:
+                segments[('sms', employer)].append(phone_no)
+
+        return segments
+
+
+    @staticmethod
+    def render_email(offers, employer):
+        employer_name = OfferDigestService.EMPLOYER_NAMES.get(employer)
+        intro = f"New offers for {escape(employer_name)} members this week" if employer_name else "New offers this week"
+
+        items = "".join(
+            f'<li><a href="{escape(offer.retailer_url)}">{escape(offer.brand_name)}</a>'
+            f' ({escape(offer.subcategory.category.name)}) - ends {offer.end_date.strftime("%B %d, %Y")}</li>'
+            for offer in offers
+        )
+        return f"<h2>{intro}</h2><ul>{items}</ul><p>The Helyar1 Team</p>"
+
+
+    @staticmethod
+    def render_sms(offers, employer):
+        brands = ", ".join(offer.brand_name for offer in offers[:5])
+        more = f" and {len(offers) - 5} more" if len(offers) > 5 else ""
+        return f"Helyar1: {len(offers)} new offers this week from {brands}{more}."[:160]
+
+
+    @staticmethod
+    def chunk(recipients):
+        size = settings.DIGEST_CHUNK_SIZE
+        for start in range(0, len(recipients), size):
+            yield recipients[start:start + size]
@@ -52,4 +52,20 @@ class MarketingPreferences(models.Model):
     email = models.BooleanField(default=False)
     sms = models.BooleanField(default=False)
     push = models.BooleanField(default=False)
-    
\ No newline at end of file
+
+
+class OfferDigest(models.Model):
+    """One run of the new-offers digest; the latest run marks where the next one starts"""
+    period_start = models.DateTimeField(null=True, blank=True)
+    period_end = models.DateTimeField()
+    offer_count = models.PositiveIntegerField(default=0)
+    segment_count = models.PositiveIntegerField(default=0)
+    recipient_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Offer digest up to {self.period_end} - {self.offer_count} offers"
+
+    class Meta:
+        ordering = ['-period_end']
+
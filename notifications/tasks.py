@@ -4,8 +4,12 @@ from celery import shared_task
 from django.conf import settings
 from django.utils import timezone
 from accounts.models import User  # Corrected import
-from .models import MarketingCampaign, NotificationLog
+from .models import MarketingCampaign, NotificationLog, OfferDigest
+from .digest_service import OfferDigestService
 from twilio.rest import Client  # installed
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 @shared_task
@@ -165,4 +169,108 @@ def blacklist_netcore(email):
 
     response = requests.post(url, headers=headers, json=payload)
     if response.status_code != 200:
-        raise Exception(f"Netcore blacklist failed: {response.status_code} - {response.text}")
\ No newline at end of file
+        raise Exception(f"Netcore blacklist failed: {response.status_code} - {response.text}")
+
+
+@shared_task
+def send_weekly_offer_digest():
+    """
+    Celery task to send the new-offers digest.
+    Each (channel, employer) segment's body is rendered once and delivered
+    in chunks, so rendering cost scales with segments rather than users.
+    Run weekly via Celery Beat.
+    """
+    period_start, period_end = OfferDigestService.get_period()
+    offers = OfferDigestService.get_new_offers(period_start, period_end)
+
+    # Recorded before dispatching (and even when empty) so the next digest starts
+    # from here, and a run that dies part-way isn't sent again
+    digest = OfferDigest.objects.create(
+        period_start=period_start,
+        period_end=period_end,
+        offer_count=len(offers),
+    )
+
+    segment_count = 0
+    recipient_count = 0
+
+    if offers:
+        for (channel, employer), recipients in OfferDigestService.get_segments().items():
+            segment_count += 1
+            recipient_count += len(recipients)
+
+            if channel == 'email':
+                html = OfferDigestService.render_email(offers, employer)
+                for chunk in OfferDigestService.chunk(recipients):
+                    send_digest_email_chunk.delay("New offers this week", html, chunk)
+            elif channel == 'sms':
+                body = OfferDigestService.render_sms(offers, employer)
+                for chunk in OfferDigestService.chunk(recipients):
+                    send_digest_sms_chunk.delay(body, chunk)
+
+    OfferDigest.objects.filter(id=digest.id).update(
+        segment_count=segment_count,
+        recipient_count=recipient_count,
+    )
+
+    return f"Digest of {len(offers)} offers sent to {recipient_count} recipients in {segment_count} segments"
+
+
+@shared_task
+def send_digest_email_chunk(subject, html, recipients):
+    """
+    Celery task to send one rendered digest to a chunk of recipients
+    with a single Netcore request (one personalization per recipient).
+    """
+    url = "https://emailapi.netcorecloud.net/v5/mail/send"
+    headers = {
+        "api_key": settings.NETCORE_EMAIL_API_KEY,
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "from": {
+            "email": settings.FROM_EMAIL,
+            "name": "Maximum Savings"
+        },
+        "subject": subject,
+        "content": [
+            {
+                "type": "html",
+                "value": html
+            }
+        ],
+        "personalizations": [
+            {"to": [{"email": email, "name": name}]}
+            for email, name in recipients
+        ],
+        "tags": ["offer_digest"]
+    }
+
+    response = requests.post(url, headers=headers, json=payload)
+    if response.status_code not in (200, 202):
+        raise Exception(f"Netcore digest send failed: {response.status_code} - {response.text}")
+
+
+@shared_task
+def send_digest_sms_chunk(body, phone_numbers):
+    """
+    Celery task to send one rendered SMS digest to a chunk of numbers via Twilio.
+    Failures are logged per number rather than raised: retrying the chunk
+    would text again every number that already succeeded.
+    """
+    client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+
+    failed = []
+    for phone_no in phone_numbers:
+        try:
+            client.messages.create(
+                body=body,
+                from_=settings.TWILIO_PHONE_NUMBER,
+                to=phone_no
+            )
+        except Exception as e:
+            failed.append(phone_no)
+            logger.error(f"Twilio digest SMS to {phone_no} failed: {str(e)}")
+
+    return f"Sent digest SMS to {len(phone_numbers) - len(failed)} of {len(phone_numbers)} numbers"
+
@@ -1,3 +1,103 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import User
+from offers.models import Category, SubCategory, Offer
+from user_profile.models import UserProfile
+from .digest_service import OfferDigestService
+from .models import MarketingPreferences, OfferDigest
+from .tasks import send_weekly_offer_digest
+
+
+class OfferDigestTests(TestCase):
+
+    def setUp(self):
+        now = timezone.now()
+        category = Category.objects.create(name='Tech', slug='tech')
+        subcategory = SubCategory.objects.create(category=category, name='Laptops', slug='laptops')
+        Offer.objects.create(
+            subcategory=subcategory, user=User.objects.create_user(email='brand@example.com', password='x'),
+            brand_name='Acme', coupon_code='A1', slug='acme', start_date=now, end_date=now + timedelta(days=30),
+            retailer_url='https://acme.example.com',
+        )
+
+    def subscriber(self, email, employer, wants_email=True, wants_sms=False, phone_no='', is_active=True):
+        user = User.objects.create_user(
+            email=email, password='x', first_name='Sam', last_name='Jones', phone_no=phone_no, is_active=is_active,
+        )
+        UserProfile.objects.create(user=user, employer=employer)
+        MarketingPreferences.objects.create(user=user, email=wants_email, sms=wants_sms)
+        return user
+
+    def send_digest(self):
+        with mock.patch('notifications.tasks.send_digest_email_chunk.delay') as send_email, \
+                mock.patch('notifications.tasks.send_digest_sms_chunk.delay') as send_sms:
+            send_weekly_offer_digest()
+        return send_email, send_sms
+
+    def test_segments(self):
+        self.subscriber('a@example.com', 'nhs')
+        self.subscriber('b@example.com', 'nhs', wants_sms=True, phone_no='+447700900001')
+        self.subscriber('c@example.com', 'police', wants_email=False, wants_sms=True, phone_no='+447700900002')
+        # Not reached: no channel chosen, SMS without a number, inactive account
+        self.subscriber('d@example.com', 'police', wants_email=False)
+        self.subscriber('e@example.com', 'police', wants_email=False, wants_sms=True)
+        self.subscriber('f@example.com', 'nhs', is_active=False)
+
+        with self.assertNumQueries(1):
+            segments = OfferDigestService.get_segments()
+
+        self.assertEqual({segment: sorted(recipients) for segment, recipients in segments.items()}, {
+            ('email', 'nhs'): [('a@example.com', 'Sam Jones'), ('b@example.com', 'Sam Jones')],
+            ('sms', 'nhs'): ['+447700900001'],
+            ('sms', 'police'): ['+447700900002'],
+        })
+
+    @override_settings(DIGEST_CHUNK_SIZE=2)
+    def test_each_segment_rendered_once(self):
+        for n in range(3):
+            self.subscriber(f'nhs{n}@example.com', 'nhs')
+        self.subscriber('police@example.com', 'police', wants_sms=True, phone_no='+447700900001')
+
+        with mock.patch.object(OfferDigestService, 'render_email', wraps=OfferDigestService.render_email) as render_email:
+            send_email, send_sms = self.send_digest()
+
+        self.assertEqual(sorted(call.args[1] for call in render_email.call_args_list), ['nhs', 'police'])
+        # Three NHS recipients in chunks of two, one police recipient
+        self.assertEqual(sorted(len(call.args[2]) for call in send_email.call_args_list), [1, 1, 2])
+        self.assertTrue(all(
+            'NHS' in call.args[1] for call in send_email.call_args_list if call.args[2][0][0].startswith('nhs')
+        ))
+        send_sms.assert_called_once_with(mock.ANY, ['+447700900001'])
+
+        digest = OfferDigest.objects.get()
+        self.assertEqual((digest.offer_count, digest.segment_count, digest.recipient_count), (1, 3, 5))
+
+    def test_periods(self):
+        period_start, period_end = OfferDigestService.get_period()
+        self.assertEqual(period_end - period_start, OfferDigestService.FIRST_PERIOD)
+
+        self.send_digest()
+
+        period_start, _ = OfferDigestService.get_period()
+        self.assertEqual(period_start, OfferDigest.objects.get().period_end)
+
+    def test_offers_outside_period(self):
+        now = timezone.now()
+
+        self.assertEqual(len(OfferDigestService.get_new_offers(now - timedelta(days=1), now + timedelta(seconds=1))), 1)
+        self.assertEqual(OfferDigestService.get_new_offers(now + timedelta(seconds=1), now + timedelta(seconds=2)), [])
+
+    def test_nothing_new(self):
+        self.subscriber('a@example.com', 'nhs')
+        self.send_digest()
+
+        # The next run only looks at offers created since this one
+        send_email, send_sms = self.send_digest()
+
+        send_email.assert_not_called()
+        send_sms.assert_not_called()
+        self.assertEqual(list(OfferDigest.objects.values_list('offer_count', flat=True)), [0, 1])
@@ -1,11 +1,43 @@
 # admin.py
+from datetime import timedelta
+
 from django.contrib import admin
-from .models import Category, SubCategory, Offer
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils.functional import cached_property
+
+from .models import Category, SubCategory, Offer, SavedOffer
+from .catalog_snapshot import invalidate_catalog_snapshot
+from .counters import recount_offer_counts
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that avoids COUNT(*) over the whole offers table.
+    Unfiltered PostgreSQL changelists use the planner's row estimate;
+    small tables, filtered querysets and other databases get an exact count.
+    """
+    EXACT_COUNT_THRESHOLD = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] > self.EXACT_COUNT_THRESHOLD:
+                return row[0]
+        return super().count
 
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'slug', 'description']
+    list_display = ['name', 'slug', 'description', 'active_offer_count']
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ['name']
     
@@ -42,7 +74,7 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(SubCategory)
 class SubCategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'category', 'slug', 'description']
+    list_display = ['name', 'category', 'slug', 'description', 'active_offer_count']
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ['name', 'category__name']
     list_filter = ['category']
@@ -88,13 +120,18 @@ class OfferAdmin(admin.ModelAdmin):
     ]
     prepopulated_fields = {'slug': ('brand_name',)}
     search_fields = ['brand_name', 'description']
-    list_filter = ['is_active', 'usage_type', 'subcategory__category', 'subcategory']
-    date_hierarchy = 'created_at'
+    # A date filter instead of date_hierarchy, which runs a DISTINCT dates query over the table
+    list_filter = ['is_active', 'usage_type', ('created_at', admin.DateFieldListFilter), 'subcategory__category', 'subcategory']
     readonly_fields = ['created_at']
+    list_select_related = ['subcategory__category', 'user']
+    autocomplete_fields = ['subcategory', 'user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['activate_offers', 'deactivate_offers', 'extend_end_date']
     
     fieldsets = (
         ('Basic Information', {
-            'fields': ('subcategory', 'brand_name', 'slug')
+            'fields': ('subcategory', 'brand_name', 'coupon_code', 'slug')
         }),
         ('Discount Details', {
             'fields': ('description', 'discount_percent', 'discount_amount', 'minimum_purchase')
@@ -103,7 +140,7 @@ class OfferAdmin(admin.ModelAdmin):
             'fields': ('start_date', 'end_date', 'usage_type', 'max_uses', 'is_active')
         }),
         ('External Link', {
-            'fields': ('brand_url',)
+            'fields': ('retailer_url',)
         }),
         ('Metadata', {
             'fields': ('created_at',),
@@ -111,6 +148,29 @@ class OfferAdmin(admin.ModelAdmin):
         }),
     )
     
+    def _bulk_update(self, request, queryset, message, **changes):
+        """Apply changes with a single UPDATE; queryset is already limited by get_queryset"""
+        with transaction.atomic():
+            subcategory_ids = set(queryset.values_list('subcategory_id', flat=True)) if 'is_active' in changes else None
+            updated = queryset.update(**changes)
+            if subcategory_ids:
+                recount_offer_counts(subcategory_ids)
+            # update() skips model signals, so drop the catalog snapshot ourselves
+            transaction.on_commit(invalidate_catalog_snapshot)
+        self.message_user(request, f"{updated} offer(s) {message}.")
+    
+    @admin.action(description="Activate selected offers", permissions=['change'])
+    def activate_offers(self, request, queryset):
+        self._bulk_update(request, queryset, "activated", is_active=True)
+    
+    @admin.action(description="Deactivate selected offers", permissions=['change'])
+    def deactivate_offers(self, request, queryset):
+        self._bulk_update(request, queryset, "deactivated", is_active=False)
+    
+    @admin.action(description="Extend end date of selected offers by 30 days", permissions=['change'])
+    def extend_end_date(self, request, queryset):
+        self._bulk_update(request, queryset, "extended by 30 days", end_date=F('end_date') + timedelta(days=30))
+    
     def get_fieldsets(self, request, obj=None):
         """
         Add 'user' field for superusers, hide it for brands.
@@ -248,4 +308,11 @@ class OfferAdmin(admin.ModelAdmin):
             return obj.user == request.user
         
         # General permission check
-        return hasattr(request.user, 'role') and request.user.role == "brand"
\ No newline at end of file
+        return hasattr(request.user, 'role') and request.user.role == "brand"
+
+@admin.register(SavedOffer)
+class SavedOfferAdmin(admin.ModelAdmin):
+    list_display = ['user', 'offer', 'created_at', 'expiry_alerted_at']
+    list_select_related = ['user', 'offer']
+    search_fields = ['user__email', 'offer__brand_name']
+    raw_id_fields = ['user', 'offer']
@@ -0,0 +1,184 @@
+# bulk_service.py
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+
+from .models import SubCategory, Offer
+from .serializers import BrandOfferRowSerializer
+from .catalog_snapshot import invalidate_catalog_snapshot
+from .counters import recount_offer_counts
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class SlugAllocator:
+    """
+    Hands out unique offer slugs for a whole batch.
+    Existing slugs for every base in the batch are loaded with one query and
+    new ones are numbered in memory (brand, brand-2, brand-3, ...).
+    """
+
+    # Base for brand names that slugify to nothing (e.g. non-Latin scripts)
+    FALLBACK_BASE = "offer"
+
+    def __init__(self, bases):
+        bases = {base or self.FALLBACK_BASE for base in bases}
+        self.taken = set()
+        self.counters = {}
+
+        if bases:
+            query = Q()
+            for base in bases:
+                query |= Q(slug=base) | Q(slug__startswith=f"{base}-")
+            self.taken = set(Offer.objects.filter(query).values_list('slug', flat=True))
+
+    def allocate(self, base):
+        base = base or self.FALLBACK_BASE
+        candidate = base
+        counter = self.counters.get(base, 1)
+
+        while candidate in self.taken:
+            counter += 1
+            candidate = f"{base}-{counter}"
+
+        self.counters[base] = counter
+        self.taken.add(candidate)
+        return candidate
+
+
+class OfferBulkService:
+    """
+    Validates and writes batches of offers for a brand.
+    Rows are matched to existing offers by coupon_code and written with
+    bulk_create / grouped queryset updates instead of one Offer.save() per row.
+    """
+
+    MAX_ROWS = 10000
+    BATCH_SIZE = 500
+
+    @staticmethod
+    def validate(rows):
+        """Validate rows without touching the database; returns (validated_rows, errors)"""
+        serializer = BrandOfferRowSerializer(data=rows, many=True)
+        if serializer.is_valid():
+            return serializer.validated_data, []
+
+        errors = [
+            {'row': index, 'errors': row_errors}
+            for index, row_errors in enumerate(serializer.errors) if row_errors
+        ]
+        return [], errors
+
+
+    @staticmethod
+    def resolve(user, validated_rows, subcategories=None):
+        """
+        Resolve subcategories and existing offers for a batch with one query each.
+        Returns (to_create, to_update, errors); rows with errors are left out of both lists.
+        """
+        errors = []
+        codes = [row['coupon_code'] for row in validated_rows]
+        seen = set()
+
+        if subcategories is None:
+            slugs = {row['subcategory'] for row in validated_rows}
+            subcategories = dict(SubCategory.objects.filter(slug__in=slugs).values_list('slug', 'id'))
+
+        existing = {offer.coupon_code: offer for offer in Offer.objects.filter(coupon_code__in=codes)}
+        allocator = SlugAllocator(
+            slugify(row['brand_name']) for row in validated_rows if row['coupon_code'] not in existing
+        )
+
+        to_create = []
+        to_update = []
+        for index, row in enumerate(validated_rows):
+            if row['coupon_code'] in seen:
+                errors.append({'row': index, 'errors': {'coupon_code': [f"Duplicate coupon code '{row['coupon_code']}' in batch."]}})
+                continue
+            seen.add(row['coupon_code'])
+
+            subcategory_id = subcategories.get(row['subcategory'])
+            if subcategory_id is None:
+                errors.append({'row': index, 'errors': {'subcategory': [f"Unknown subcategory '{row['subcategory']}'."]}})
+                continue
+
+            fields = {key: value for key, value in row.items() if key != 'subcategory'}
+            offer = existing.get(row['coupon_code'])
+
+            if offer is None:
+                offer = Offer(user=user, subcategory_id=subcategory_id, **fields)
+                offer.slug = allocator.allocate(slugify(row['brand_name']))
+                to_create.append(offer)
+            elif offer.user_id != user.id:
+                errors.append({'row': index, 'errors': {'coupon_code': ["Coupon code belongs to another brand."]}})
+            else:
+                fields['subcategory_id'] = subcategory_id
+                # Only changed fields are written; unchanged rows are skipped entirely
+                changes = {key: value for key, value in fields.items() if getattr(offer, key) != value}
+                if changes:
+                    to_update.append((offer.id, changes))
+
+        return to_create, to_update, errors
+
+
+    @staticmethod
+    def write(to_create, to_update):
+        """
+        Insert new offers with bulk_create and apply updates grouped by identical change sets,
+        so a catalog-wide change (e.g. new end_date) is a handful of UPDATE ... WHERE id IN statements.
+        """
+        groups = defaultdict(list)
+        # Subcategories whose active-offer counters this write can change
+        counted = {offer.subcategory_id for offer in to_create if offer.is_active}
+        recount_offer_ids = []
+        for offer_id, changes in to_update:
+            groups[tuple(sorted(changes.items()))].append(offer_id)
+            if 'is_active' in changes or 'subcategory_id' in changes:
+                recount_offer_ids.append(offer_id)
+                if 'subcategory_id' in changes:
+                    counted.add(changes['subcategory_id'])
+
+        with transaction.atomic():
+            if recount_offer_ids:
+                counted.update(Offer.objects.filter(id__in=recount_offer_ids).values_list('subcategory_id', flat=True))
+
+            Offer.objects.bulk_create(to_create, batch_size=OfferBulkService.BATCH_SIZE)
+
+            for changes, offer_ids in groups.items():
+                for start in range(0, len(offer_ids), OfferBulkService.BATCH_SIZE):
+                    Offer.objects.filter(id__in=offer_ids[start:start + OfferBulkService.BATCH_SIZE]).update(**dict(changes))
+
+            recount_offer_counts(counted)
+
+            # Bulk writes skip model signals, so drop the catalog snapshot ourselves
+            transaction.on_commit(invalidate_catalog_snapshot)
+
+
+    @staticmethod
+    def upsert(user, rows):
+        if len(rows) > OfferBulkService.MAX_ROWS:
+            return {'success': False, 'errors': [{'row': None, 'errors': f"At most {OfferBulkService.MAX_ROWS} offers per batch."}]}
+
+        validated_rows, errors = OfferBulkService.validate(rows)
+        if errors:
+            return {'success': False, 'errors': errors}
+
+        # A concurrent writer may claim a slug between allocation and insert; retry once with fresh slugs
+        for attempt in range(2):
+            to_create, to_update, errors = OfferBulkService.resolve(user, validated_rows)
+            if errors:
+                return {'success': False, 'errors': errors}
+            try:
+                OfferBulkService.write(to_create, to_update)
+                break
+            except IntegrityError as e:
+                if attempt:
+                    logger.error(f"Bulk offer upsert conflict for {user.email} after retry: {str(e)}")
+                    return {'success': False, 'errors': [{'row': None, 'errors': "Offers conflicted with a concurrent change, please try again."}]}
+                logger.warning(f"Bulk offer upsert conflict for {user.email}, retrying: {str(e)}")
+
+        logger.info(f"Bulk offer upsert for {user.email}: {len(to_create)} created, {len(to_update)} updated")
+        return {'success': True, 'created': len(to_create), 'updated': len(to_update)}
@@ -0,0 +1,249 @@
+# offers/catalog_snapshot.py
+"""
+Shared catalog snapshot.
+
+The rendered catalog (the CategoryListView body plus one body per category)
+is written once to a memory-mapped file. Every Gunicorn worker maps the same
+file, so the catalog lives in the page cache once instead of once per worker.
+
+File layout:
+    header  -> magic | generation | category count | index offset | index length
+    bodies  -> rendered JSON bodies, back to back
+    index   -> JSON {"list": [offset, length], "categories": {slug: [offset, length]}}
+
+The generation is a per-node counter kept next to the snapshot and bumped by
+every invalidation. A build records it before reading the catalog and is only
+published if no invalidation has bumped it since.
+"""
+import contextlib
+import fcntl
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+import logging
+
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+from Helyar1_Backend.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'HLYCAT01'
+HEADER = struct.Struct('<8sQIQQ')
+
+# Rebuild-and-open rounds before giving up when invalidations keep racing us
+SNAPSHOT_OPEN_ATTEMPTS = 3
+
+
+def get_snapshot_path():
+    return settings.CATALOG_SNAPSHOT_PATH
+
+
+@contextlib.contextmanager
+def _locked_generation_file():
+    """
+    Hold the generation counter file locked. Publishing and invalidating both
+    take it, so neither can land between the other's check and its file change.
+    """
+    path = f'{get_snapshot_path()}.generation'
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, 'a+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield f
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_generation(f):
+    f.seek(0)
+    value = f.read().strip()
+    if not value:
+        # Seeded from the clock so ETags don't repeat if the run directory is cleared
+        value = time.time_ns()
+        _write_generation(f, value)
+    return int(value)
+
+
+def _write_generation(f, value):
+    f.truncate(0)
+    f.write(str(value))
+    f.flush()
+
+
+class CatalogSnapshot:
+    """Read-only view over one mapped snapshot file"""
+
+    def __init__(self, mapping, file_id):
+        self.mapping = mapping
+        self.file_id = file_id
+
+        magic, self.generation, self.count, index_offset, index_length = HEADER.unpack_from(mapping, 0)
+        if magic != MAGIC:
+            raise ValueError("Catalog snapshot has an invalid header")
+
+        self.index = json.loads(mapping[index_offset:index_offset + index_length])
+
+    def _slice(self, location):
+        # A view into the shared mapping; HttpResponse copies it into the response
+        # body, so what is saved is the per-worker copy of the catalog, not per request
+        offset, length = location
+        return memoryview(self.mapping)[offset:offset + length]
+
+    def list_body(self):
+        """Rendered CategoryListView body"""
+        return self._slice(self.index['list'])
+
+    def category_body(self, slug):
+        """Rendered CategoryDetailView body, or None if the slug is unknown"""
+        location = self.index['categories'].get(slug)
+        if location is None:
+            return None
+        return self._slice(location)
+
+    @property
+    def etag(self):
+        return f'"catalog-{self.generation}"'
+
+
+def build_catalog_snapshot():
+    """
+    Render the catalog and atomically publish it to the snapshot file.
+    Readers holding the previous mapping keep serving it until they notice the new file.
+
+    Returns the published generation, or None if the catalog was invalidated
+    while it was being rendered and the build was discarded.
+    """
+    from .models import Category
+    from .serializers import CategorySerializer
+
+    # Taken before the catalog is read; an invalidation after this makes the build stale
+    with _locked_generation_file() as f:
+        generation = _read_generation(f)
+
+    renderer = JSONRenderer()
+    categories = list(Category.objects.prefetch_related("subcategories__products"))
+    category_data = CategorySerializer(categories, many=True).data
+
+    body = bytearray()
+    index = {'list': None, 'categories': {}}
+
+    list_body = renderer.render({
+        "detail": "Categories fetched successfully",
+        "data": category_data
+    })
+    index['list'] = [HEADER.size + len(body), len(list_body)]
+    body += list_body
+
+    for category in category_data:
+        category_body = renderer.render({
+            "detail": "Category fetched successfully",
+            "data": category
+        })
+        index['categories'][category['slug']] = [HEADER.size + len(body), len(category_body)]
+        body += category_body
+
+    index_bytes = json.dumps(index, separators=(',', ':')).encode('utf-8')
+    index_offset = HEADER.size + len(body)
+
+    header = HEADER.pack(MAGIC, generation, len(categories), index_offset, len(index_bytes))
+
+    path = get_snapshot_path()
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    # Write next to the target and rename so readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.catalog-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            f.write(body)
+            f.write(index_bytes)
+
+        with _locked_generation_file() as f:
+            if _read_generation(f) != generation:
+                os.unlink(tmp_path)
+                logger.info(f"Discarded catalog snapshot generation {generation}: invalidated during the build")
+                return None
+            os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    logger.info(f"Published catalog snapshot generation {generation} ({len(categories)} categories, {index_offset + len(index_bytes)} bytes)")
+    return generation
+
+
+def invalidate_catalog_snapshot():
+    """Drop the published snapshot and any build in progress; the next reader rebuilds it"""
+    with _locked_generation_file() as f:
+        _write_generation(f, _read_generation(f) + 1)
+        try:
+            os.unlink(get_snapshot_path())
+            logger.info("Catalog snapshot invalidated")
+        except FileNotFoundError:
+            pass
+
+
+# Per-process mapping of the current snapshot file
+_current = None
+
+# The snapshot file is local to the node, so only coalesce within it
+_rebuild_flight = SingleFlight('catalog-snapshot', shared=False)
+
+
+def _rebuild_if_missing():
+    """
+    Rebuild the snapshot unless another worker on this node already has.
+    The flock makes workers that lost the race wait for the winner's file.
+    """
+    path = get_snapshot_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(f'{path}.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if not os.path.exists(path):
+                build_catalog_snapshot()
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _file_id(stat_result):
+    return (stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size)
+
+
+def get_catalog_snapshot():
+    """
+    Return the mapped snapshot, rebuilding it if it has been invalidated
+    and remapping it if another process has published a newer one.
+    """
+    global _current
+
+    path = get_snapshot_path()
+    # The file can be invalidated between rebuilding it and opening it; rebuild again
+    for _ in range(SNAPSHOT_OPEN_ATTEMPTS):
+        try:
+            file_id = _file_id(os.stat(path))
+            if _current is not None and _current.file_id == file_id:
+                return _current
+
+            with open(path, 'rb') as f:
+                # Identify the mapping by the file actually opened, which may be newer than the stat
+                file_id = _file_id(os.fstat(f.fileno()))
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            break
+        except FileNotFoundError:
+            _rebuild_flight.do('catalog', _rebuild_if_missing)
+    else:
+        raise RuntimeError(f"Catalog snapshot {path} disappeared on every rebuild")
+
+    _current = CatalogSnapshot(mapping, file_id)
+    logger.debug(f"Mapped catalog snapshot generation {_current.generation}")
+    return _current
@@ -0,0 +1,102 @@
+# offers/counters.py
+"""
+Denormalized active-offer counters on Category and SubCategory.
+
+Single offer writes adjust the counters with F() updates inside the offer's
+transaction (see offers.signals). Bulk writes that bypass signals recount the
+subcategories they touched. reconcile_offer_counts() corrects any drift.
+
+The catalog snapshot serves these counters, and queryset updates fire no
+signals, so every recount or correction drops the snapshot itself.
+"""
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Category, SubCategory, Offer
+from .catalog_snapshot import invalidate_catalog_snapshot
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def adjust_offer_counts(subcategory_id, delta):
+    """Add delta to a subcategory's counter and its category's counter"""
+    if not delta:
+        return
+
+    subcategories = SubCategory.objects.filter(id=subcategory_id)
+    categories = Category.objects.filter(subcategories=subcategory_id)
+    if delta < 0:
+        # Never underflow a counter that has already drifted; reconciliation fixes it
+        subcategories = subcategories.filter(active_offer_count__gte=-delta)
+        categories = categories.filter(active_offer_count__gte=-delta)
+
+    subcategories.update(active_offer_count=F('active_offer_count') + delta)
+    categories.update(active_offer_count=F('active_offer_count') + delta)
+
+
+def _actual_subcategory_count():
+    return Coalesce(Subquery(
+        Offer.objects.filter(subcategory=OuterRef('pk'), is_active=True)
+        .order_by().values('subcategory').annotate(total=Count('id')).values('total')
+    ), 0)
+
+
+def _actual_category_count():
+    return Coalesce(Subquery(
+        SubCategory.objects.filter(category=OuterRef('pk'))
+        .order_by().values('category').annotate(total=Sum('active_offer_count')).values('total')
+    ), 0)
+
+
+def recount_offer_counts(subcategory_ids=None):
+    """
+    Recompute counters from the offers table with one UPDATE per level.
+    Pass subcategory_ids to limit the recount to the rows a bulk write touched.
+    """
+    subcategories = SubCategory.objects.all()
+    categories = Category.objects.all()
+    if subcategory_ids is not None:
+        subcategory_ids = set(subcategory_ids)
+        if not subcategory_ids:
+            return
+        subcategories = subcategories.filter(id__in=subcategory_ids)
+        categories = categories.filter(subcategories__id__in=subcategory_ids)
+
+    subcategories.update(active_offer_count=_actual_subcategory_count())
+    # Categories sum their (now correct) subcategory counters
+    categories.update(active_offer_count=_actual_category_count())
+    transaction.on_commit(invalidate_catalog_snapshot)
+
+
+def reconcile_offer_counts():
+    """
+    Find counters that disagree with the offers table and rewrite only those.
+    Returns the number of corrected (subcategories, categories).
+    """
+    drifted_subcategories = list(
+        SubCategory.objects.annotate(actual=_actual_subcategory_count())
+        .exclude(active_offer_count=F('actual')).values_list('id', flat=True)
+    )
+    if drifted_subcategories:
+        SubCategory.objects.filter(id__in=drifted_subcategories).update(
+            active_offer_count=_actual_subcategory_count()
+        )
+
+    drifted_categories = list(
+        Category.objects.annotate(actual=_actual_category_count())
+        .exclude(active_offer_count=F('actual')).values_list('id', flat=True)
+    )
+    if drifted_categories:
+        Category.objects.filter(id__in=drifted_categories).update(
+            active_offer_count=_actual_category_count()
+        )
+
+    if drifted_subcategories or drifted_categories:
+        transaction.on_commit(invalidate_catalog_snapshot)
+        logger.warning(
+            f"Corrected offer counter drift on {len(drifted_subcategories)} subcategories "
+            f"and {len(drifted_categories)} categories"
+        )
+    return len(drifted_subcategories), len(drifted_categories)
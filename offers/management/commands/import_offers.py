@@ -0,0 +1,165 @@
+# offers/management/commands/import_offers.py
+"""
+Management command to import an affiliate offer feed.
+
+The feed is streamed row by row and written in fixed-size chunks, so memory
+use stays flat regardless of feed size. Offers are matched to existing ones
+by coupon_code; subcategories are resolved by slug from an in-memory map.
+
+Usage:
+    python manage.py import_offers feed.csv --brand brand@example.com
+    python manage.py import_offers feed.jsonl --brand brand@example.com --chunk-size 2000
+    python manage.py import_offers feed.txt --format jsonl --brand brand@example.com
+"""
+
+import csv
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+from rest_framework.exceptions import ValidationError
+from accounts.models import User
+from offers.models import SubCategory
+from offers.bulk_service import OfferBulkService
+from offers.parsers import read_csv_rows
+from offers.serializers import BrandOfferRowSerializer
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Stream-import offers from a CSV or JSONL feed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            type=str,
+            help='Path to the feed file',
+        )
+        parser.add_argument(
+            '--brand',
+            type=str,
+            required=True,
+            help='Email of the brand user that owns the imported offers',
+        )
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'jsonl'],
+            help='Feed format (defaults to the file extension)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Rows written per transaction',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        feed_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        chunk_size = options['chunk_size']
+
+        try:
+            brand = User.objects.get(email=options['brand'], role='brand')
+        except User.DoesNotExist:
+            raise CommandError(f"Brand user not found: {options['brand']}")
+
+        # The catalog is small compared to the feed, so keep slug -> id in memory
+        self.subcategories = dict(SubCategory.objects.values_list('slug', 'id'))
+        self.totals = {'rows': 0, 'created': 0, 'updated': 0, 'skipped': 0}
+        # One serializer validates every row; building one per row dominates the import time
+        self.validator = BrandOfferRowSerializer()
+
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(self.style.SUCCESS(f'Importing {feed_format.upper()} feed: {path}'))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+
+        started = time.monotonic()
+        chunk = []
+
+        try:
+            with open(path, 'rb') as feed:
+                rows = read_csv_rows(feed) if feed_format == 'csv' else self._read_jsonl(feed)
+
+                for line_no, row in enumerate(rows, start=1):
+                    chunk.append((line_no, row))
+                    if len(chunk) >= chunk_size:
+                        self._import_chunk(brand, chunk, started)
+                        chunk = []
+
+                if chunk:
+                    self._import_chunk(brand, chunk, started)
+        except OSError as e:
+            raise CommandError(f"Cannot read feed {path}: {e}")
+        except (csv.Error, UnicodeDecodeError) as e:
+            # Chunks before the bad row are already committed
+            raise CommandError(
+                f"Feed {path} is not valid {feed_format.upper()} after {self.totals['rows']} imported rows: {e}"
+            )
+
+        elapsed = time.monotonic() - started
+        rate = self.totals['rows'] / elapsed if elapsed else 0
+
+        self.stdout.write('\n' + '-' * 60)
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Imported {self.totals['rows']} rows in {elapsed:.1f}s ({rate:.0f} rows/s)"
+        ))
+        self.stdout.write(
+            f"Created: {self.totals['created']} | Updated: {self.totals['updated']} | Skipped: {self.totals['skipped']}"
+        )
+        logger.info(f"Offer import from {path}: {self.totals}")
+
+    def _read_jsonl(self, feed):
+        for line in feed:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                yield {'__error__': str(e)}
+
+    def _import_chunk(self, brand, chunk, started):
+        """Validate, resolve and write one chunk in its own transaction"""
+        valid_rows = []
+        line_numbers = []
+
+        for line_no, row in chunk:
+            if '__error__' in row:
+                self._report_skip(line_no, row['__error__'])
+                continue
+            try:
+                valid_rows.append(self.validator.run_validation(row))
+                line_numbers.append(line_no)
+            except ValidationError as e:
+                self._report_skip(line_no, e.detail)
+
+        to_create, to_update, errors = OfferBulkService.resolve(brand, valid_rows, self.subcategories)
+        for error in errors:
+            self._report_skip(line_numbers[error['row']], error['errors'])
+
+        self.totals['rows'] += len(chunk)
+        try:
+            OfferBulkService.write(to_create, to_update)
+        except IntegrityError as e:
+            # e.g. another writer claimed one of the allocated slugs; the chunk rolled back
+            self.totals['skipped'] += len(to_create) + len(to_update)
+            self.stdout.write(self.style.WARNING(
+                f"  ⚠ Rows {chunk[0][0]}-{chunk[-1][0]} skipped: {len(to_create) + len(to_update)} offers not written ({e})"
+            ))
+            return
+
+        self.totals['created'] += len(to_create)
+        self.totals['updated'] += len(to_update)
+
+        elapsed = time.monotonic() - started
+        rate = self.totals['rows'] / elapsed if elapsed else 0
+        self.stdout.write(
+            f"{self.totals['rows']:>10} rows | +{len(to_create)} created, ~{len(to_update)} updated | {rate:.0f} rows/s"
+        )
+
+    def _report_skip(self, line_no, errors):
+        self.totals['skipped'] += 1
+        self.stdout.write(self.style.WARNING(f'  ⚠ Row {line_no} skipped: {errors}'))
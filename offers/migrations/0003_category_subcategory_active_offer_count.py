@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:18
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_active_offer_counts(apps, schema_editor):
+    Category = apps.get_model('offers', 'Category')
+    SubCategory = apps.get_model('offers', 'SubCategory')
+    Offer = apps.get_model('offers', 'Offer')
+
+    SubCategory.objects.update(active_offer_count=Coalesce(Subquery(
+        Offer.objects.filter(subcategory=OuterRef('pk'), is_active=True)
+        .order_by().values('subcategory').annotate(total=Count('id')).values('total')
+    ), 0))
+    Category.objects.update(active_offer_count=Coalesce(Subquery(
+        SubCategory.objects.filter(category=OuterRef('pk'))
+        .order_by().values('category').annotate(total=Sum('active_offer_count')).values('total')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('offers', '0002_savedoffer_offer_end_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='active_offer_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='subcategory',
+            name='active_offer_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_active_offer_counts, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,7 @@
 # models.py
 from django.utils.text import slugify
 from django.utils import timezone
-from django.db import models
+from django.db import models, transaction
 from accounts.models import User
 
 
@@ -9,6 +9,8 @@ class Category(models.Model):
     name = models.CharField(max_length=50, unique=True)
     slug = models.SlugField(max_length=100, unique=True)
     description = models.CharField(max_length=256, blank=True, null=True)
+    # Denormalized, maintained by offers.counters
+    active_offer_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ["name"]
@@ -24,6 +26,8 @@ class SubCategory(models.Model):
     name = models.CharField(max_length=50)
     slug = models.SlugField(max_length=100, unique=True)
     description = models.CharField(max_length=256, blank=True, null=True)
+    # Denormalized, maintained by offers.counters
+    active_offer_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ["name"]
@@ -47,6 +51,7 @@ class Offer(models.Model):
     subcategory = models.ForeignKey(SubCategory, on_delete=models.CASCADE, related_name="products")
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="offer_user")
     brand_name = models.CharField(max_length=100)
+    coupon_code = models.CharField(max_length=150, unique=True)
     slug = models.SlugField(max_length=150, unique=True)
     description = models.TextField(blank=True, null=True, help_text="Optional: describe the offer")
     discount_percent = models.PositiveIntegerField(blank=True, null=True)
@@ -64,6 +69,9 @@ class Offer(models.Model):
 
     class Meta:
         ordering = ["brand_name"]
+        indexes = [
+            models.Index(fields=['end_date']),
+        ]
 
     def __str__(self):
         return f"{self.brand_name} - {self.coupon_code}"
@@ -72,9 +80,27 @@ class Offer(models.Model):
         if not self.slug:
             # Create slug from brand_name and coupon_code
             self.slug = slugify(f"{self.brand_name}")
-        super().save(*args, **kwargs)
+        # Keep the row and the active-offer counters updated by the save signals in one transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
         
     def is_valid(self):
         now = timezone.now()
         return (self.is_active and 
-                self.start_date <= now <= self.end_date)
\ No newline at end of file
+                self.start_date <= now <= self.end_date)
+
+
+class SavedOffer(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="saved_offers")
+    offer = models.ForeignKey(Offer, on_delete=models.CASCADE, related_name="saved_by")
+    created_at = models.DateTimeField(auto_now_add=True)
+    expiry_alerted_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        unique_together = ("user", "offer")
+        verbose_name = 'Saved Offer'
+        verbose_name_plural = 'Saved Offers'
+
+    def __str__(self):
+        return f"{self.user.email} saved {self.offer.brand_name}"
@@ -0,0 +1,30 @@
+# parsers.py
+import codecs
+import csv
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+def read_csv_rows(stream, encoding='utf-8'):
+    """
+    Yield CSV rows as dicts, one at a time.
+    Empty cells are dropped so serializer defaults and nulls apply.
+    """
+    reader = csv.DictReader(codecs.getreader(encoding)(stream))
+    for row in reader:
+        yield {key.strip(): value for key, value in row.items() if key and value not in ('', None)}
+
+
+class CSVParser(BaseParser):
+    """Parses a text/csv request body into a list of row dicts"""
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            return list(read_csv_rows(stream, encoding))
+        except (csv.Error, UnicodeDecodeError) as exc:
+            raise ParseError(f'CSV parse error - {exc}')
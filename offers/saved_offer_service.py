@@ -0,0 +1,40 @@
+from .models import SavedOffer
+
+
+class SavedOfferService:
+    """
+    Service class for members' saved (favourite) offers.
+    Membership checks are batched so a list of offers costs a single query.
+    """
+    
+    @staticmethod
+    def save_offer(user, offer):
+        saved_offer, created = SavedOffer.objects.get_or_create(user=user, offer=offer)
+        return {'success': True, 'saved_offer': saved_offer, 'created': created}
+    
+    
+    @staticmethod
+    def remove_offer(user, offer):
+        deleted, _ = SavedOffer.objects.filter(user=user, offer=offer).delete()
+        if not deleted:
+            return {'success': False, 'error': 'Offer is not saved'}
+        return {'success': True}
+    
+    
+    @staticmethod
+    def saved_offer_ids(user, offer_ids):
+        """Return the subset of offer_ids the user has saved, in one query"""
+        if not user.is_authenticated or not offer_ids:
+            return set()
+        
+        return set(
+            SavedOffer.objects.filter(user=user, offer_id__in=offer_ids)
+            .values_list('offer_id', flat=True)
+        )
+    
+    
+    @staticmethod
+    def mark_saved(user, offers):
+        """Add an is_saved flag to serialized offers with one membership query"""
+        saved_ids = SavedOfferService.saved_offer_ids(user, [offer['id'] for offer in offers])
+        return [{**offer, 'is_saved': offer['id'] in saved_ids} for offer in offers]
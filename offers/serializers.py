@@ -1,6 +1,6 @@
 # serializers.py
 from rest_framework import serializers
-from .models import Category, SubCategory, Offer
+from .models import Category, SubCategory, Offer, SavedOffer
 
 
 class OfferSerializer(serializers.ModelSerializer):
@@ -26,8 +26,8 @@ class SubCategorySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = SubCategory
-        fields = ["id", "category", "category_name", "name", "slug", "description", "products"]
-        read_only_fields = ["id", "category_name"]
+        fields = ["id", "category", "category_name", "name", "slug", "description", "active_offer_count", "products"]
+        read_only_fields = ["id", "category_name", "active_offer_count"]
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -35,5 +35,53 @@ class CategorySerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Category
-        fields = ["id", "name", "slug", "description", "subcategories"]
-        read_only_fields = ["id"]
\ No newline at end of file
+        fields = ["id", "name", "slug", "description", "active_offer_count", "subcategories"]
+        read_only_fields = ["id", "active_offer_count"]
+
+class SavedOfferSerializer(serializers.ModelSerializer):
+    offer = OfferSerializer(read_only=True)
+    
+    class Meta:
+        model = SavedOffer
+        fields = ["id", "offer", "created_at"]
+        read_only_fields = ["id", "offer", "created_at"]
+
+
+class SaveOfferRequestSerializer(serializers.Serializer):
+    offer = serializers.SlugRelatedField(slug_field="slug", queryset=Offer.objects.filter(is_active=True))
+
+
+class SavedOfferStatusSerializer(serializers.Serializer):
+    saved = serializers.ListField(child=serializers.IntegerField())
+
+
+class BrandOfferRowSerializer(serializers.Serializer):
+    """
+    One row of a brand's bulk offer upload.
+    Rows are matched to existing offers by coupon_code; subcategories are
+    given by slug and resolved in bulk by the caller, so validation here
+    never touches the database.
+    """
+    subcategory = serializers.SlugField(max_length=100)
+    brand_name = serializers.CharField(max_length=100)
+    coupon_code = serializers.CharField(max_length=150)
+    description = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    discount_percent = serializers.IntegerField(required=False, allow_null=True, min_value=0, max_value=100)
+    discount_amount = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True)
+    start_date = serializers.DateTimeField()
+    end_date = serializers.DateTimeField()
+    usage_type = serializers.ChoiceField(choices=Offer.USAGE_CHOICES, default=Offer.MULTI_USE)
+    is_active = serializers.BooleanField(default=True)
+    max_uses = serializers.IntegerField(required=False, allow_null=True, min_value=0)
+    minimum_purchase = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True)
+    retailer_url = serializers.URLField()
+    
+    def validate(self, attrs):
+        if attrs['end_date'] <= attrs['start_date']:
+            raise serializers.ValidationError({"end_date": "End date must be after start date."})
+        return attrs
+
+
+class BrandOfferBulkResponseSerializer(serializers.Serializer):
+    created = serializers.IntegerField()
+    updated = serializers.IntegerField()
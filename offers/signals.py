@@ -0,0 +1,46 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Category, SubCategory, Offer
+from .catalog_snapshot import invalidate_catalog_snapshot
+from .counters import adjust_offer_counts
+
+
+# Any catalog change drops the shared snapshot once the transaction commits
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+@receiver(post_save, sender=Offer)
+@receiver(post_delete, sender=Offer)
+def invalidate_catalog_snapshot_signal(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_catalog_snapshot)
+
+
+@receiver(pre_save, sender=Offer)
+def remember_offer_count_state(sender, instance, **kwargs):
+    """Record what the stored row counted towards before this save"""
+    instance._counted_subcategory_id = None
+    if not instance._state.adding and instance.pk:
+        stored = Offer.objects.filter(pk=instance.pk).values_list('is_active', 'subcategory_id').first()
+        if stored and stored[0]:
+            instance._counted_subcategory_id = stored[1]
+
+
+@receiver(post_save, sender=Offer)
+def update_offer_counts_on_save(sender, instance, **kwargs):
+    previous = getattr(instance, '_counted_subcategory_id', None)
+    current = instance.subcategory_id if instance.is_active else None
+    if previous == current:
+        return
+    if previous is not None:
+        adjust_offer_counts(previous, -1)
+    if current is not None:
+        adjust_offer_counts(current, 1)
+
+
+@receiver(post_delete, sender=Offer)
+def update_offer_counts_on_delete(sender, instance, **kwargs):
+    if instance.is_active:
+        adjust_offer_counts(instance.subcategory_id, -1)
@@ -0,0 +1,75 @@
+# offers/tasks.py
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+from datetime import timedelta
+from itertools import groupby
+from .models import SavedOffer
+from .counters import reconcile_offer_counts
+from accounts.tasks import mail_send
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def send_saved_offer_expiry_alerts():
+    """
+    Alert users whose saved offers end soon.
+    One range scan over Offer.end_date finds every expiring saved offer,
+    and each user gets a single email listing all of theirs.
+    Run daily via Celery Beat.
+    """
+    logger.info("Starting saved offer expiry alerts")
+    
+    now = timezone.now()
+    window_end = now + timedelta(days=settings.SAVED_OFFER_ALERT_DAYS)
+    
+    expiring = (
+        SavedOffer.objects.filter(
+            offer__end_date__gte=now,
+            offer__end_date__lt=window_end,
+            offer__is_active=True,
+            expiry_alerted_at__isnull=True,
+        )
+        .select_related('user', 'offer')
+        .order_by('user_id', 'offer__end_date')
+    )
+    
+    alerted = 0
+    users = 0
+    for user, saved_offers in groupby(expiring.iterator(), key=lambda saved: saved.user):
+        saved_offers = list(saved_offers)
+        lines = "\n".join(
+            f"    - {saved.offer.brand_name}: ends {saved.offer.end_date.strftime('%B %d, %Y')}"
+            for saved in saved_offers
+        )
+        message = f"""
+    Hi {user.first_name or user.email},
+    
+    {len(saved_offers)} of your saved offers will end soon:
+    
+{lines}
+    
+    Best regards,
+    The Helyar1 Team
+    """
+        mail_send.delay(user.email, "Your saved offers are ending soon", message)
+        # Flag this user's rows straight away, so a crash later in the run
+        # (or tomorrow's run) never mails them again
+        SavedOffer.objects.filter(id__in=[saved.id for saved in saved_offers]).update(expiry_alerted_at=now)
+        alerted += len(saved_offers)
+        users += 1
+    
+    logger.info(f"Completed saved offer expiry alerts: {alerted} offers across {users} users")
+    return f"Alerted {users} users about {alerted} saved offers"
+
+
+@shared_task
+def reconcile_active_offer_counts():
+    """
+    Correct drift in the denormalized Category/SubCategory active-offer counters.
+    Run hourly via Celery Beat.
+    """
+    subcategories, categories = reconcile_offer_counts()
+    return f"Corrected {subcategories} subcategory and {categories} category counters"
@@ -1,3 +1,368 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.db import IntegrityError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from Helyar1_Backend.singleflight import SingleFlight
+from accounts.models import User
+from .bulk_service import OfferBulkService, SlugAllocator
+from .catalog_snapshot import build_catalog_snapshot, get_catalog_snapshot, invalidate_catalog_snapshot
+from .models import Category, SubCategory, Offer
+
+
+class CatalogSnapshotTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        snapshot_path = override_settings(CATALOG_SNAPSHOT_PATH=os.path.join(directory, 'catalog.snapshot'))
+        snapshot_path.enable()
+        self.addCleanup(snapshot_path.disable)
+
+        category = Category.objects.create(name='Tech', slug='tech')
+        SubCategory.objects.create(category=category, name='Laptops', slug='laptops')
+
+    def slugs(self, response):
+        return [category['slug'] for category in response.json()['data']]
+
+    def test_serves_rendered_catalog(self):
+        response = self.client.get('/api/offers/categories/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.slugs(response), ['tech'])
+
+        response = self.client.get('/api/offers/categories/tech/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['slug'], 'tech')
+        self.assertEqual(self.client.get('/api/offers/categories/travel/').status_code, 404)
+
+    def test_not_modified(self):
+        etag = self.client.get('/api/offers/categories/')['ETag']
+
+        response = self.client.get('/api/offers/categories/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_mapping_reused(self):
+        snapshot = get_catalog_snapshot()
+
+        with self.assertNumQueries(0):
+            self.assertIs(get_catalog_snapshot(), snapshot)
+
+    def test_catalog_write_invalidates(self):
+        etag = self.client.get('/api/offers/categories/')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Travel', slug='travel')
+        self.assertFalse(os.path.exists(settings.CATALOG_SNAPSHOT_PATH))
+
+        response = self.client.get('/api/offers/categories/')
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.slugs(response), ['tech', 'travel'])
+
+    def test_invalidated_between_stat_and_open(self):
+        opened = []
+
+        def open_after_invalidation(path, *args, **kwargs):
+            if path == settings.CATALOG_SNAPSHOT_PATH and not opened:
+                opened.append(path)
+                invalidate_catalog_snapshot()
+            return open(path, *args, **kwargs)
+
+        with mock.patch('offers.catalog_snapshot.open', side_effect=open_after_invalidation, create=True):
+            snapshot = get_catalog_snapshot()
+
+        self.assertEqual(opened, [settings.CATALOG_SNAPSHOT_PATH])
+        self.assertEqual(list(snapshot.index['categories']), ['tech'])
+        self.assertTrue(os.path.exists(settings.CATALOG_SNAPSHOT_PATH))
+
+    def test_build_invalidated_while_rendering(self):
+        render = JSONRenderer.render
+
+        def write_during_render(renderer, data, *args, **kwargs):
+            if not Category.objects.filter(slug='travel').exists():
+                # Committed after the build read the catalog
+                Category.objects.create(name='Travel', slug='travel')
+                invalidate_catalog_snapshot()
+            return render(renderer, data, *args, **kwargs)
+
+        with mock.patch.object(JSONRenderer, 'render', side_effect=write_during_render, autospec=True):
+            self.assertIsNone(build_catalog_snapshot())
+        self.assertFalse(os.path.exists(settings.CATALOG_SNAPSHOT_PATH))
+
+        self.assertEqual(list(get_catalog_snapshot().index['categories']), ['tech', 'travel'])
+
+
+class FakeRedis:
+    """The part of the redis-py client SingleFlight uses, kept in a dict"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False, px=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value.encode() if isinstance(value, str) else value
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight('test', timeout=5, shared=False)
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def search():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {'offers': 3}
+
+        def call():
+            results.append(flight.do('search', search))
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=call) for _ in range(4)]
+        for thread in followers:
+            thread.start()
+        time.sleep(0.2)  # Let the followers join the flight
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'offers': 3}] * 5)
+
+    def test_each_flight_computes_afresh(self):
+        flight = SingleFlight('test', shared=False)
+
+        self.assertEqual(flight.do('search', lambda: 1), 1)
+        self.assertEqual(flight.do('search', lambda: 2), 2)
+
+    def test_error_reaches_caller(self):
+        flight = SingleFlight('test', shared=False)
+
+        def search():
+            raise ValueError('search failed')
+
+        with self.assertRaises(ValueError):
+            flight.do('search', search)
+        self.assertEqual(flight.do('search', lambda: 1), 1)
+
+    def test_leader_publishes_result(self):
+        redis = FakeRedis()
+        flight = SingleFlight('test')
+
+        with mock.patch.object(flight, '_get_redis', return_value=redis):
+            self.assertEqual(flight.do('search', lambda: {'offers': 3}), {'offers': 3})
+
+        # The lock is released and the result kept under the leader's token
+        [(key, value)] = redis.data.items()
+        self.assertTrue(key.startswith('singleflight:test:result:search:'))
+        self.assertEqual(json.loads(value), {'offers': 3})
+
+    def test_waits_for_remote_leader(self):
+        redis = FakeRedis()
+        redis.set('singleflight:test:lock:search', 'abc')
+        redis.set('singleflight:test:result:search:abc', json.dumps({'offers': 3}))
+        flight = SingleFlight('test', timeout=1)
+        search = mock.Mock(return_value={'offers': 4})
+
+        with mock.patch.object(flight, '_get_redis', return_value=redis):
+            self.assertEqual(flight.do('search', search), {'offers': 3})
+
+        search.assert_not_called()
+
+    def test_ignores_result_of_ended_flight(self):
+        redis = FakeRedis()
+        redis.set('singleflight:test:result:search:abc', json.dumps({'offers': 3}))
+        flight = SingleFlight('test', timeout=1)
+
+        with mock.patch.object(flight, '_get_redis', return_value=redis):
+            self.assertEqual(flight.do('search', lambda: {'offers': 4}), {'offers': 4})
+
+    def test_redis_unavailable(self):
+        redis = mock.Mock(**{'set.side_effect': ConnectionError('down')})
+        flight = SingleFlight('test')
+
+        with mock.patch.object(flight, '_get_redis', return_value=redis):
+            self.assertEqual(flight.do('search', lambda: {'offers': 3}), {'offers': 3})
+
+    def test_result_not_published(self):
+        redis = FakeRedis()
+        set_lock = redis.set
+
+        def set_fails_for_result(key, value, **kwargs):
+            if ':result:' in key:
+                raise ConnectionError('down')
+            return set_lock(key, value, **kwargs)
+
+        redis.set = set_fails_for_result
+        flight = SingleFlight('test')
+
+        with mock.patch.object(flight, '_get_redis', return_value=redis):
+            self.assertEqual(flight.do('search', lambda: {'offers': 3}), {'offers': 3})
+
+        # The lock is still released
+        self.assertEqual(redis.data, {})
+
+
+class OfferTestMixin:
+
+    def setUp(self):
+        self.brand = User.objects.create_user(email='brand@example.com', password='x')
+        self.category = Category.objects.create(name='Tech', slug='tech')
+        self.subcategory = SubCategory.objects.create(category=self.category, name='Laptops', slug='laptops')
+
+    def create_offer(self, slug, coupon_code=None, user=None):
+        now = timezone.now()
+        return Offer.objects.create(
+            subcategory=self.subcategory, user=user or self.brand, brand_name=slug,
+            coupon_code=coupon_code or slug.upper(), slug=slug,
+            start_date=now, end_date=now + timedelta(days=30), retailer_url='https://shop.example.com',
+        )
+
+
+class SlugAllocatorTests(OfferTestMixin, TestCase):
+
+    def test_numbers_after_existing_slugs(self):
+        self.create_offer('acme')
+        self.create_offer('acme-2')
+
+        allocator = SlugAllocator(['acme', 'acme', 'nova'])
+
+        self.assertEqual(allocator.allocate('acme'), 'acme-3')
+        self.assertEqual(allocator.allocate('acme'), 'acme-4')
+        self.assertEqual(allocator.allocate('nova'), 'nova')
+        self.assertEqual(allocator.allocate('nova'), 'nova-2')
+
+    def test_other_bases_sharing_a_prefix(self):
+        self.create_offer('acme-corp')
+
+        self.assertEqual(SlugAllocator(['acme']).allocate('acme'), 'acme')
+
+    def test_fallback_base(self):
+        self.create_offer('offer')
+
+        allocator = SlugAllocator([''])
+
+        self.assertEqual(allocator.allocate(''), 'offer-2')
+        self.assertEqual(allocator.allocate(''), 'offer-3')
+
+    def test_one_query_per_batch(self):
+        with self.assertNumQueries(1):
+            allocator = SlugAllocator(['acme', 'nova', ''])
+        with self.assertNumQueries(0):
+            allocator.allocate('acme')
+
+
+class OfferBulkServiceTests(OfferTestMixin, TestCase):
+
+    def row(self, coupon_code, brand_name='Acme', **fields):
+        return {
+            'subcategory': 'laptops',
+            'brand_name': brand_name,
+            'coupon_code': coupon_code,
+            'start_date': '2026-01-01T00:00:00Z',
+            'end_date': '2026-12-31T00:00:00Z',
+            'retailer_url': 'https://acme.example.com',
+            **fields,
+        }
+
+    def test_creates_then_updates(self):
+        result = OfferBulkService.upsert(self.brand, [self.row('A1'), self.row('A2'), self.row('N1', 'Ноутбук')])
+
+        self.assertEqual(result, {'success': True, 'created': 3, 'updated': 0})
+        self.assertEqual(
+            dict(Offer.objects.values_list('coupon_code', 'slug')),
+            {'A1': 'acme', 'A2': 'acme-2', 'N1': 'offer'},
+        )
+        self.subcategory.refresh_from_db()
+        self.assertEqual(self.subcategory.active_offer_count, 3)
+
+        result = OfferBulkService.upsert(
+            self.brand, [self.row('A1'), self.row('A2', is_active=False), self.row('N1', 'Ноутбук')]
+        )
+
+        self.assertEqual(result, {'success': True, 'created': 0, 'updated': 1})
+        self.assertFalse(Offer.objects.get(coupon_code='A2').is_active)
+        self.subcategory.refresh_from_db()
+        self.category.refresh_from_db()
+        self.assertEqual(self.subcategory.active_offer_count, 2)
+        self.assertEqual(self.category.active_offer_count, 2)
+
+    def test_invalid_rows(self):
+        result = OfferBulkService.upsert(self.brand, [self.row('A1'), self.row('A2', end_date='2025-01-01T00:00:00Z')])
+
+        self.assertFalse(result['success'])
+        self.assertEqual([error['row'] for error in result['errors']], [1])
+        self.assertFalse(Offer.objects.exists())
+
+    def test_unresolvable_rows(self):
+        self.create_offer('other', coupon_code='TAKEN', user=User.objects.create_user(email='other@example.com'))
+
+        result = OfferBulkService.upsert(self.brand, [
+            self.row('A1'),
+            self.row('A1'),
+            self.row('A2', subcategory='phones'),
+            self.row('TAKEN'),
+        ])
+
+        self.assertFalse(result['success'])
+        self.assertEqual(
+            [(error['row'], list(error['errors'])) for error in result['errors']],
+            [(1, ['coupon_code']), (2, ['subcategory']), (3, ['coupon_code'])],
+        )
+        self.assertEqual(Offer.objects.count(), 1)
+
+    def test_too_many_rows(self):
+        with mock.patch.object(OfferBulkService, 'MAX_ROWS', 1):
+            result = OfferBulkService.upsert(self.brand, [self.row('A1'), self.row('A2')])
+
+        self.assertFalse(result['success'])
+        self.assertIsNone(result['errors'][0]['row'])
+
+    def test_retries_slug_conflict_once(self):
+        write = OfferBulkService.write
+
+        def conflict_once(to_create, to_update):
+            if not Offer.objects.filter(slug='acme').exists():
+                # A concurrent writer takes the slug between allocation and insert
+                self.create_offer('acme')
+                raise IntegrityError('UNIQUE constraint failed: offers_offer.slug')
+            return write(to_create, to_update)
+
+        with mock.patch.object(OfferBulkService, 'write', side_effect=conflict_once):
+            result = OfferBulkService.upsert(self.brand, [self.row('A1')])
+
+        self.assertEqual(result, {'success': True, 'created': 1, 'updated': 0})
+        self.assertEqual(Offer.objects.get(coupon_code='A1').slug, 'acme-2')
+
+    def test_repeated_conflict(self):
+        with mock.patch.object(OfferBulkService, 'write', side_effect=IntegrityError('conflict')) as write:
+            result = OfferBulkService.upsert(self.brand, [self.row('A1')])
+
+        self.assertEqual(write.call_count, 2)
+        self.assertFalse(result['success'])
+        self.assertIsNone(result['errors'][0]['row'])
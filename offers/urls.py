@@ -1,10 +1,18 @@
 # urls.py
 from django.urls import path
-from .views import CategoryListView, CategoryDetailView, OfferDetailView
+from .views import (
+    CategoryListView, CategoryDetailView, OfferDetailView, OfferSearchView,
+    SavedOfferListView, SavedOfferDetailView, SavedOfferStatusView, BrandOfferView
+)
 
 
 urlpatterns = [
     path('categories/', CategoryListView.as_view(), name='category-list'),
     path('categories/<slug:slug>/', CategoryDetailView.as_view(), name='category-detail'),
+    path('search/', OfferSearchView.as_view(), name='offer-search'),
+    path('saved/', SavedOfferListView.as_view(), name='saved-offer-list'),
+    path('saved/status/', SavedOfferStatusView.as_view(), name='saved-offer-status'),
+    path('saved/<slug:slug>/', SavedOfferDetailView.as_view(), name='saved-offer-detail'),
+    path('brand/offers/', BrandOfferView.as_view(), name='brand-offers'),
     path('offers/<slug:slug>/', OfferDetailView.as_view(), name='offer-detail'),
 ]
\ No newline at end of file
@@ -1,15 +1,39 @@
 # views.py
+import csv
+
 from django.shortcuts import get_object_or_404
+from django.http import Http404, HttpResponse, HttpResponseNotModified
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import permissions, status
+from rest_framework.parsers import JSONParser, MultiPartParser
 from drf_spectacular.utils import extend_schema, OpenApiResponse
 from django.db.models import Q
 
-from .models import Category,SubCategory, Offer
-from .serializers import CategorySerializer, OfferSerializer
+from .models import Category,SubCategory, Offer, SavedOffer
+from .serializers import (
+    CategorySerializer, OfferSerializer, SavedOfferSerializer,
+    SaveOfferRequestSerializer, SavedOfferStatusSerializer,
+    BrandOfferRowSerializer, BrandOfferBulkResponseSerializer
+)
+from .saved_offer_service import SavedOfferService
+from .bulk_service import OfferBulkService
+from .parsers import CSVParser, read_csv_rows
+from .catalog_snapshot import get_catalog_snapshot
+from Helyar1_Backend.singleflight import SingleFlight
 from custom_permissions.retailer_permission import IsOwner
 from custom_permissions.user_subscribed_permission import IsSubscribed
+from custom_permissions.brand_permission import IsBrand
+
+
+def snapshot_response(request, snapshot, body):
+    """Return a slice of the shared catalog snapshot as the response body"""
+    if request.headers.get('If-None-Match') == snapshot.etag:
+        return HttpResponseNotModified(headers={'ETag': snapshot.etag})
+    
+    response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = snapshot.etag
+    return response
 
 
 class CategoryListView(APIView):
@@ -25,25 +49,16 @@ class CategoryListView(APIView):
         description="Retrieve a list of all categories, each with their associated subcategories and products.",
     )
     def get(self, request):
-        categories = Category.objects.prefetch_related(
-            "subcategories__products"
-        ).all()
+        # Served from the shared snapshot instead of re-serializing per request
+        snapshot = get_catalog_snapshot()
         
-        if not categories.exists():
+        if not snapshot.count:
             return Response(
                 {"detail": "No category created yet."},
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        serializer = CategorySerializer(categories, many=True)
-        
-        return Response(
-            {
-                "detail": "Categories fetched successfully",
-                "data": serializer.data
-            },
-            status=status.HTTP_200_OK
-        )
+        return snapshot_response(request, snapshot, snapshot.list_body())
 
 
 class CategoryDetailView(APIView):
@@ -59,19 +74,13 @@ class CategoryDetailView(APIView):
         description="Retrieve a specific category by slug with all associated subcategories and products.",
     )
     def get(self, request, slug):
-        category = get_object_or_404(
-            Category.objects.prefetch_related("subcategories__products"),
-            slug=slug
-        )
+        snapshot = get_catalog_snapshot()
+        body = snapshot.category_body(slug)
         
-        serializer = CategorySerializer(category)
-        return Response(
-            {   
-                "detail": "Category fetched successfully",
-                "data": serializer.data
-            },
-            status=status.HTTP_200_OK
-        )
+        if body is None:
+            raise Http404("No Category matches the given query.")
+        
+        return snapshot_response(request, snapshot, body)
 
 
 class OfferDetailView(APIView):
@@ -104,6 +113,35 @@ class OfferDetailView(APIView):
 
 
 
+# Concurrent identical searches share one query and serialization
+search_flight = SingleFlight('offer-search')
+
+
+def search_offers(query):
+    """Serialized offers matching the query in brand, code, description or category names"""
+    # Direct matches on Offer fields
+    offers = Offer.objects.filter(
+        Q(brand_name__icontains=query) |
+        Q(coupon_code__icontains=query) |
+        Q(description__icontains=query)
+    )
+
+    # Category matches
+    category_matches = Category.objects.filter(name__icontains=query)
+    if category_matches.exists():
+        offers = offers | Offer.objects.filter(subcategory__category__in=category_matches)
+
+    # SubCategory matches
+    subcategory_matches = SubCategory.objects.filter(name__icontains=query)
+    if subcategory_matches.exists():
+        offers = offers | Offer.objects.filter(subcategory__in=subcategory_matches)
+
+    offers = offers.distinct()
+
+    serializer = OfferSerializer(offers, many=True)
+    return serializer.data
+
+
 class OfferSearchView(APIView):
     permission_classes=[ IsSubscribed ]
     def get(self, request, *args, **kwargs):
@@ -111,24 +149,168 @@ class OfferSearchView(APIView):
         if not query:
             return Response({"offers": []})
 
-        # Direct matches on Offer fields
-        offers = Offer.objects.filter(
-            Q(brand_name__icontains=query) |
-            Q(coupon_code__icontains=query) |
-            Q(description__icontains=query)
+        offers = search_flight.do(query.lower(), lambda: search_offers(query))
+        return Response({"offers": SavedOfferService.mark_saved(request.user, offers)})
+
+
+class SavedOfferListView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    
+    @extend_schema(
+        tags=["Offers"],
+        responses={200: SavedOfferSerializer(many=True)},
+        summary="Fetch the authenticated user's saved offers",
+        description="Retrieve all offers the authenticated user has bookmarked, newest first.",
+    )
+    def get(self, request):
+        saved_offers = SavedOffer.objects.filter(user=request.user).select_related(
+            "offer__subcategory", "offer__user"
+        )
+        
+        serializer = SavedOfferSerializer(saved_offers, many=True)
+        return Response(
+            {
+                "detail": "Saved offers fetched successfully",
+                "data": serializer.data
+            },
+            status=status.HTTP_200_OK
+        )
+    
+    @extend_schema(
+        tags=["Offers"],
+        request=SaveOfferRequestSerializer,
+        responses={
+            201: SavedOfferSerializer,
+            200: SavedOfferSerializer,
+            400: OpenApiResponse(description="Invalid offer")
+        },
+        summary="Save an offer",
+        description="Bookmark an active offer by slug. Saving an already saved offer is a no-op.",
+    )
+    def post(self, request):
+        serializer = SaveOfferRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        result = SavedOfferService.save_offer(request.user, serializer.validated_data['offer'])
+        
+        return Response(
+            {
+                "detail": "Offer saved successfully" if result['created'] else "Offer already saved",
+                "data": SavedOfferSerializer(result['saved_offer']).data
+            },
+            status=status.HTTP_201_CREATED if result['created'] else status.HTTP_200_OK
         )
 
-        # Category matches
-        category_matches = Category.objects.filter(name__icontains=query)
-        if category_matches.exists():
-            offers = offers | Offer.objects.filter(subcategory__category__in=category_matches)
 
-        # SubCategory matches
-        subcategory_matches = SubCategory.objects.filter(name__icontains=query)
-        if subcategory_matches.exists():
-            offers = offers | Offer.objects.filter(subcategory__in=subcategory_matches)
+class SavedOfferDetailView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    
+    @extend_schema(
+        tags=["Offers"],
+        responses={
+            204: OpenApiResponse(description="Offer removed from saved offers"),
+            404: OpenApiResponse(description="Offer is not saved")
+        },
+        summary="Remove a saved offer",
+    )
+    def delete(self, request, slug):
+        offer = get_object_or_404(Offer, slug=slug)
+        result = SavedOfferService.remove_offer(request.user, offer)
+        
+        if not result['success']:
+            return Response({"detail": result['error']}, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
-        offers = offers.distinct()
 
+class SavedOfferStatusView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    
+    @extend_schema(
+        tags=["Offers"],
+        responses={200: SavedOfferStatusSerializer},
+        summary="Check which offers are saved",
+        description="Pass offer ids as ?ids=1,2,3. Returns the ids the user has saved, checked in a single query.",
+    )
+    def get(self, request):
+        try:
+            offer_ids = [int(offer_id) for offer_id in request.query_params.get("ids", "").split(",") if offer_id]
+        except ValueError:
+            return Response({"detail": "ids must be a comma separated list of integers"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        saved_ids = SavedOfferService.saved_offer_ids(request.user, offer_ids)
+        return Response({"saved": sorted(saved_ids)}, status=status.HTTP_200_OK)
+
+
+class BrandOfferView(APIView):
+    permission_classes = [IsBrand]
+    parser_classes = [JSONParser, CSVParser, MultiPartParser]
+    
+    @extend_schema(
+        tags=["Offers"],
+        responses={200: OfferSerializer(many=True)},
+        summary="Fetch the authenticated brand's offers",
+    )
+    def get(self, request):
+        offers = Offer.objects.filter(user=request.user).select_related("subcategory", "user")
+        
         serializer = OfferSerializer(offers, many=True)
-        return Response({"offers": serializer.data})
+        return Response(
+            {
+                "detail": "Offers fetched successfully",
+                "data": serializer.data
+            },
+            status=status.HTTP_200_OK
+        )
+    
+    @extend_schema(
+        tags=["Offers"],
+        request=BrandOfferRowSerializer(many=True),
+        responses={
+            200: BrandOfferBulkResponseSerializer,
+            400: OpenApiResponse(description="Validation errors, reported per row")
+        },
+        summary="Create or update offers in bulk",
+        description=(
+            "Accepts a JSON list of offers, a text/csv body, or a multipart CSV upload in 'file'. "
+            "Offers are matched by coupon_code and subcategories are given by slug. "
+            "The batch is applied all-or-nothing."
+        ),
+    )
+    def post(self, request):
+        if 'file' in request.FILES:
+            try:
+                rows = list(read_csv_rows(request.FILES['file']))
+            except (csv.Error, UnicodeDecodeError) as exc:
+                return Response(
+                    {"detail": f"CSV parse error - {exc}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        elif isinstance(request.data, dict):
+            rows = request.data.get('offers', [])
+        else:
+            rows = request.data
+        
+        if not isinstance(rows, list) or not rows:
+            return Response(
+                {"detail": "Provide a non-empty list of offers."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        result = OfferBulkService.upsert(request.user, rows)
+        
+        if not result['success']:
+            return Response(
+                {"detail": "Offers were not saved", "errors": result['errors']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response(
+            {
+                "detail": "Offers saved successfully",
+                "created": result['created'],
+                "updated": result['updated']
+            },
+            status=status.HTTP_200_OK
+        )
+
@@ -30,5 +30,34 @@ class PaymentHistoryAdmin(admin.ModelAdmin):
     
     
     
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'resource_type', 'action', 'status', 'attempts', 'occurred_at', 'received_at', 'processed_at']
+    
+    readonly_fields = ['event_id', 'resource_type', 'action', 'payload', 'occurred_at', 'attempts', 'last_error', 'received_at', 'claimed_at', 'processed_at']
+    
+    search_fields = ['event_id']
+    
+    list_filter = ['status', 'resource_type']
+    
+    
+    
+class BillingOperationAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'kind', 'status', 'step', 'created_at', 'updated_at']
+    
+    readonly_fields = ['id', 'user', 'subscription', 'kind', 'status', 'step', 'result', 'error', 'created_at', 'updated_at']
+    
+    list_filter = ['kind', 'status']
+    
+    
+    
+class WebhookCursorAdmin(admin.ModelAdmin):
+    # Move position back to replay events through catch_up_webhook_events
+    list_display = ['name', 'position', 'updated_at']
+    
+    
+    
 admin.site.register(Subscription, SubscriptionAdmin)
-admin.site.register(PaymentHistory, PaymentHistoryAdmin)
\ No newline at end of file
+admin.site.register(PaymentHistory, PaymentHistoryAdmin)
+admin.site.register(WebhookEvent, WebhookEventAdmin)
+admin.site.register(WebhookCursor, WebhookCursorAdmin)
+admin.site.register(BillingOperation, BillingOperationAdmin)
\ No newline at end of file
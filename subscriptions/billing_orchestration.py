@@ -0,0 +1,262 @@
+# subscriptions/billing_orchestration.py
+"""
+Checkout steps that call GoCardless, run as chained Celery tasks.
+
+CreateBillingRequest and CompleteMandate only validate, store a BillingOperation
+and return its ID; the remote calls happen in billing_operation_step tasks:
+
+    create_billing_request: create_billing_request -> create_billing_flow
+    complete_mandate:       fetch_fulfilled_billing_request -> activate_subscription
+
+Each step records its output on the operation before the next one runs, and
+sends its create calls with idempotency keys derived from the operation, so a
+retried or replayed step never creates a second resource.
+"""
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from user_profile.models import UserProfile
+from Helyar1_Backend.clients import gocardless_client, idempotency_headers
+from .models import BillingOperation, Subscription, TransitionConflict
+from .state_machine import SubscriptionStateMachine
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class BillingStepNotReady(Exception):
+    """GoCardless hasn't reached the state the step needs yet; retry later"""
+
+
+class BillingStepFailed(Exception):
+    """The step can't complete from the state it found; fail the operation"""
+
+
+def is_transient(error):
+    """Errors worth retrying a step for"""
+    import requests
+    from gocardless_pro.errors import GoCardlessInternalError, MalformedResponseError, RateLimitError
+    from Helyar1_Backend.gocardless import GoCardlessUnavailableError
+
+    return isinstance(error, (
+        BillingStepNotReady,
+        TransitionConflict,
+        GoCardlessUnavailableError,
+        GoCardlessInternalError,
+        MalformedResponseError,
+        RateLimitError,
+        requests.Timeout,
+        requests.ConnectionError,
+    ))
+
+
+class BillingOrchestrator:
+
+    STEPS = {
+        'create_billing_request': ('create_billing_request', 'create_billing_flow'),
+        'complete_mandate': ('fetch_fulfilled_billing_request', 'activate_subscription'),
+    }
+
+    @staticmethod
+    def start(operation):
+        """Queue (or, with BILLING_ORCHESTRATION_ASYNC off, run inline) an operation's steps"""
+        from celery import chain
+        from .task import billing_operation_step
+
+        steps = chain(*[
+            billing_operation_step.si(str(operation.id), step)
+            for step in BillingOrchestrator.STEPS[operation.kind]
+        ])
+        if settings.BILLING_ORCHESTRATION_ASYNC:
+            steps.apply_async()
+        else:
+            try:
+                steps.apply()
+            except Exception:
+                pass  # The failing step has already marked the operation failed
+            operation.refresh_from_db()
+
+    @staticmethod
+    def run_step(operation_id, step):
+        operation = BillingOperation.objects.select_related('user', 'subscription').get(id=operation_id)
+        if operation.status in ('succeeded', 'failed'):
+            logger.info(f"Billing operation {operation_id} already {operation.status}, skipping {step}")
+            return
+
+        BillingOperation.objects.filter(id=operation.id).update(status='running', step=step)
+        getattr(BillingOrchestrator, step)(operation)
+
+        operation.status = 'succeeded' if step == BillingOrchestrator.STEPS[operation.kind][-1] else 'running'
+        operation.step = step
+        operation.save(update_fields=['status', 'step', 'result', 'updated_at'])
+
+    @staticmethod
+    def fail(operation_id, error):
+        BillingOperation.objects.filter(id=operation_id).update(
+            status='failed', error=error, updated_at=timezone.now()
+        )
+
+    # --- create_billing_request ---
+
+    @staticmethod
+    def create_billing_request(operation):
+        if operation.result.get('billing_request_id'):
+            return
+
+        user = operation.user
+        subscription = operation.subscription
+        billing_params = {
+            'payment_request': {
+                'amount': int(subscription.price * 100),
+                'currency': 'GBP',
+                'description': '1 Year access fee',
+            },
+            'mandate_request': {
+                'scheme': 'bacs',
+                'currency': 'GBP',
+                'metadata': {
+                    'user_id': str(user.id),
+                    'plan': 'yearly subscription'
+                },
+                'verify': 'recommended'
+            },
+            'metadata': {
+                'user_id': str(user.id),
+                'subscription_id': str(subscription.id)
+            }
+        }
+
+        logger.info(f"Creating GoCardless billing request for user {user.email}")
+        billing_request = gocardless_client.billing_requests.create(
+            params=billing_params,
+            headers=idempotency_headers('billing-request', operation.id),
+        )
+        logger.info(f"Billing request created: {billing_request.id}")
+
+        Subscription.objects.filter(id=subscription.id).update(temp_billing_request_id=billing_request.id)
+        operation.result['billing_request_id'] = billing_request.id
+
+    @staticmethod
+    def create_billing_flow(operation):
+        user = operation.user
+        billing_request_id = operation.result['billing_request_id']
+
+        # GoCardless redirects here after the customer authorises; webhooks complete the setup
+        billing_flow_params = {
+            'redirect_uri': 'https://lelia-leafed-lashandra.ngrok-free.dev/api/subscriptions/gocardless-complete/',
+            'exit_uri': 'https://lelia-leafed-lashandra.ngrok-free.dev/?error=user_cancelled',
+            'links': {
+                'billing_request': billing_request_id
+            },
+            'prefilled_customer': {
+                'email': user.email,
+                'given_name': user.profile.first_name,
+                'family_name': user.profile.last_name,
+            }
+        }
+
+        logger.info(f"Creating billing flow for user {user.email}")
+        billing_flow = gocardless_client.billing_request_flows.create(
+            params=billing_flow_params,
+            headers=idempotency_headers('billing-flow', operation.id),
+        )
+        logger.info(f"Billing flow created: {billing_flow.id}")
+
+        # Stored for CompleteMandate and webhook processing
+        Subscription.objects.filter(id=operation.subscription_id).update(temp_flow_id=billing_flow.id)
+        operation.result.update({
+            'status': 'started',
+            'flow_id': billing_flow.id,
+            'authorisation_url': billing_flow.authorisation_url,
+        })
+
+    # --- complete_mandate ---
+
+    @staticmethod
+    def fetch_fulfilled_billing_request(operation):
+        billing_request_id = operation.result['billing_request_id']
+
+        # Served from the cache when the webhook path just read it; the fulfilled
+        # webhook drops the cached copy, and a stale 'pending' only retries the step
+        billing_request = gocardless_client.billing_requests.get(billing_request_id)
+        logger.info(f"Billing request status: {billing_request.status}")
+
+        if billing_request.status != 'fulfilled':
+            raise BillingStepNotReady(f"Billing request not fulfilled: {billing_request.status}")
+
+        mandate_id = billing_request.links.mandate_request_mandate
+        customer_id = billing_request.links.customer
+        UserProfile.objects.filter(user_id=operation.user_id).update(mandate_id=mandate_id, customer_id=customer_id)
+        logger.info(f"Updated profile for user {operation.user.email}: mandate={mandate_id}, customer={customer_id}")
+
+        operation.result.update({
+            'mandate_id': mandate_id,
+            'customer_id': customer_id,
+            'payment_id': getattr(billing_request.links, 'payment', None),
+        })
+
+    @staticmethod
+    def activate_subscription(operation):
+        subscription = Subscription.objects.select_related('user').get(id=operation.subscription_id)
+        user = subscription.user
+        mandate_id = operation.result['mandate_id']
+
+        if subscription.is_active and subscription.subscription_id:
+            # The billing_requests.fulfilled webhook got there first
+            logger.info(f"Subscription already active for user {user.email}")
+        else:
+            sub_params = {
+                'amount': int(subscription.price * 100),
+                'currency': 'GBP',
+                'interval_unit': 'yearly',
+                'name': 'Helyar1 Yearly Subscription',
+                'links': {'mandate': mandate_id},
+                'metadata': {'user_id': str(user.id)},
+            }
+
+            sub_response = gocardless_client.subscriptions.create(
+                params=sub_params,
+                headers=idempotency_headers('subscription', mandate_id),
+            )
+            logger.info(f"GoCardless subscription created: {sub_response.id}")
+
+            # Set expiry date
+            if hasattr(sub_response, 'upcoming_payments') and sub_response.upcoming_payments:
+                expires_at = datetime.fromisoformat(sub_response.upcoming_payments[0]['charge_date'].replace('Z', '+00:00'))
+            else:
+                expires_at = timezone.now() + timedelta(days=365)
+
+            def activate(current):
+                if current.is_active and current.subscription_id == sub_response.id:
+                    return None  # The webhook activated it while we were creating
+                return 'active', {
+                    'subscription_id': sub_response.id,
+                    'is_active': True,
+                    'started_at': timezone.now(),
+                    'expires_at': expires_at,
+                    'temp_flow_id': None,
+                    'temp_billing_request_id': None,
+                    'temp_state': None,
+                }
+
+            # Update local DB and the user/profile flags. TransitionConflict retries
+            # the step; the create above is idempotent on the mandate.
+            if SubscriptionStateMachine.apply(subscription, activate) is None:
+                subscription.refresh_from_db()
+                if not (subscription.is_active and subscription.subscription_id == sub_response.id):
+                    # e.g. cancelled while the customer was in the flow
+                    raise BillingStepFailed(
+                        f"Subscription {subscription.id} is {subscription.status}, not activating {sub_response.id}"
+                    )
+                logger.info(f"Subscription activated by webhook for user {user.email}")
+            else:
+                logger.info(f"SUCCESS: Subscription activated for user {user.email}")
+
+        operation.result.update({
+            'status': 'completed',
+            'subscription_id': subscription.subscription_id,
+            'next_charge_date': subscription.expires_at.isoformat() if subscription.expires_at else None,
+            'message': 'Direct debit setup and subscription activated successfully!',
+        })
@@ -0,0 +1,189 @@
+# subscriptions/entitlements.py
+"""
+Cached subscription entitlement lookups.
+
+Permission checks ask "is this user a paying member?" on every offers request.
+The answer is cached per user in a small in-process LRU, backed by Redis when
+ENTITLEMENT_REDIS_URL is set, and invalidated whenever the subscription changes
+(Subscription saves, webhook transitions and the bulk lifecycle jobs).
+
+Entries store expires_at rather than a boolean, so a cached entitlement stops
+granting access at expiry without any invalidation.
+
+A read that loaded the row before a change committed can still cache it after
+the change's invalidation. Both tiers therefore expire within seconds
+(ENTITLEMENT_CACHE_TTL, ENTITLEMENT_LOCAL_TTL), which bounds how long such a
+stale entry is served.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Entitlement:
+    """Snapshot of the subscription fields entitlement checks need"""
+
+    FIELDS = ('status', 'is_active', 'subscription_id', 'expires_at', 'created_at')
+
+    def __init__(self, status=None, is_active=False, subscription_id=None, expires_at=None, created_at=None):
+        self.status = status
+        self.is_active = is_active
+        self.subscription_id = subscription_id
+        self.expires_at = expires_at
+        self.created_at = created_at
+
+    @property
+    def exists(self):
+        return self.status is not None
+
+    @property
+    def active(self):
+        """Same rule as Subscription.is_valid(), excluding pending subscriptions"""
+        return (
+            self.is_active
+            and self.status != 'pending'
+            and self.expires_at is not None
+            and self.expires_at > timezone.now()
+        )
+
+    @classmethod
+    def from_subscription(cls, subscription):
+        if subscription is None:
+            return cls()
+        return cls(**{field: getattr(subscription, field) for field in cls.FIELDS})
+
+    def to_json(self):
+        data = {field: getattr(self, field) for field in self.FIELDS}
+        for field in ('expires_at', 'created_at'):
+            if data[field] is not None:
+                data[field] = data[field].isoformat()
+        return json.dumps(data)
+
+    @classmethod
+    def from_json(cls, payload):
+        data = json.loads(payload)
+        for field in ('expires_at', 'created_at'):
+            if data[field] is not None:
+                data[field] = parse_datetime(data[field])
+        return cls(**data)
+
+
+class _LocalLRU:
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class EntitlementService:
+    # Local entries can't be invalidated from other processes, so they live briefly
+    _local = _LocalLRU(
+        size=getattr(settings, 'ENTITLEMENT_LOCAL_SIZE', 10000),
+        ttl=getattr(settings, 'ENTITLEMENT_LOCAL_TTL', 30),
+    )
+    _redis = None
+
+    @staticmethod
+    def _key(user_id):
+        return f"entitlement:{user_id}"
+
+    @staticmethod
+    def _get_redis():
+        url = getattr(settings, 'ENTITLEMENT_REDIS_URL', None)
+        if not url:
+            return None
+        if EntitlementService._redis is None:
+            import redis
+            EntitlementService._redis = redis.Redis.from_url(url)
+        return EntitlementService._redis
+
+    @staticmethod
+    def get(user_id, fresh=False):
+        """
+        Return the user's Entitlement, from cache when possible. With `fresh`,
+        read the database and refresh the caches; use it where a stale answer
+        would outlive the caches, such as token claims.
+        """
+        # Token claims carry the ID as a string; key on one form everywhere
+        user_id = str(user_id)
+        entitlement = None if fresh else EntitlementService._local.get(user_id)
+        if entitlement is not None:
+            return entitlement
+
+        client = EntitlementService._get_redis()
+        if client is not None and not fresh:
+            try:
+                payload = client.get(EntitlementService._key(user_id))
+                if payload is not None:
+                    entitlement = Entitlement.from_json(payload)
+            except Exception as e:
+                logger.warning(f"Entitlement cache unavailable, reading from DB: {str(e)}")
+                client = None
+
+        if entitlement is None:
+            entitlement = EntitlementService._load(user_id)
+            if client is not None:
+                try:
+                    client.set(EntitlementService._key(user_id), entitlement.to_json(), ex=settings.ENTITLEMENT_CACHE_TTL)
+                except Exception as e:
+                    logger.warning(f"Failed to cache entitlement for user {user_id}: {str(e)}")
+
+        EntitlementService._local.set(user_id, entitlement)
+        return entitlement
+
+    @staticmethod
+    def _load(user_id):
+        from .models import Subscription
+        return Entitlement.from_subscription(
+            Subscription.objects.filter(user_id=user_id).only(*Entitlement.FIELDS).first()
+        )
+
+    @staticmethod
+    def has_active_subscription(user_id):
+        return EntitlementService.get(user_id).active
+
+    @staticmethod
+    def invalidate(*user_ids):
+        """Drop cached entitlements; call after the subscription change has committed"""
+        user_ids = [str(user_id) for user_id in user_ids]
+        for user_id in user_ids:
+            EntitlementService._local.delete(user_id)
+
+        client = EntitlementService._get_redis()
+        if client is not None and user_ids:
+            try:
+                client.delete(*[EntitlementService._key(user_id) for user_id in user_ids])
+            except Exception as e:
+                logger.warning(f"Failed to invalidate cached entitlements {user_ids}: {str(e)}")
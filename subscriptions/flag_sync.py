@@ -0,0 +1,62 @@
+# subscriptions/flag_sync.py
+"""
+Denormalised subscription flags on User and UserProfile.
+
+User.subscription_status and UserProfile.subscription_status mirror whether
+the user's Subscription is active. They are written here with targeted
+queryset UPDATEs, never user.save()/profile.save(), so a transition costs two
+single-column statements instead of two full-row writes, and one call covers
+any number of users.
+"""
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from accounts.models import User
+from accounts.tokens import revoke_subscription_claims
+from user_profile.models import UserProfile
+from .models import Subscription
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class SubscriptionFlagService:
+
+    @staticmethod
+    def sync(user_id, active, revoke=False):
+        """Set one user's flags; see sync_many"""
+        SubscriptionFlagService.sync_many([user_id], active, revoke=revoke)
+
+    @staticmethod
+    def sync_many(user_ids, active, revoke=False):
+        """
+        Set the flags of every user in `user_ids` to `active`. With `revoke`,
+        also stamp subscription_revoked_at so tokens carrying subscriber claims
+        are refreshed before they grant access again.
+        """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+
+        with transaction.atomic():
+            User.objects.filter(id__in=user_ids).update(subscription_status=active)
+            UserProfile.objects.filter(user_id__in=user_ids).update(subscription_status=active)
+            if revoke:
+                # Stamped after commit: a token refreshed before then still read the
+                # old entitlement, and has to be older than the stamp
+                transaction.on_commit(lambda: revoke_subscription_claims(user_ids))
+
+    @staticmethod
+    def resync(user_ids):
+        """Recompute the flags of `user_ids` from their stored subscriptions"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+
+        with transaction.atomic():
+            User.objects.filter(id__in=user_ids).update(
+                subscription_status=Exists(Subscription.objects.filter(user_id=OuterRef('pk'), is_active=True))
+            )
+            UserProfile.objects.filter(user_id__in=user_ids).update(
+                subscription_status=Exists(Subscription.objects.filter(user_id=OuterRef('user_id'), is_active=True))
+            )
@@ -0,0 +1,96 @@
+# subscriptions/management/commands/benchmark_startup.py
+"""
+Management command to measure process startup time.
+
+Each scenario runs in a fresh interpreter so import costs are counted in
+full. Scenarios:
+    check   - `manage.py check` (settings, apps and the URLconf, i.e. every view module)
+    celery  - Celery app boot with task autodiscovery, as a worker does before consuming
+    web     - django.setup() plus the URLconf, as a web worker does before serving
+
+Each scenario also reports whether gocardless_pro was imported during boot;
+the GoCardless client is built on first use, so it should not be.
+
+Usage:
+    python manage.py benchmark_startup
+    python manage.py benchmark_startup --runs 20
+    python manage.py benchmark_startup --scenario celery
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+GOCARDLESS_PROBE = "import sys; print('gocardless_pro' in sys.modules, file=sys.stderr)"
+
+SCENARIOS = {
+    'check': (
+        "import sys; sys.argv = ['manage.py', 'check']\n"
+        "from django.core.management import execute_from_command_line\n"
+        "execute_from_command_line(sys.argv)\n"
+    ),
+    'celery': (
+        "from Helyar1_Backend.celery import app\n"
+        "app.loader.import_default_modules()\n"
+    ),
+    'web': (
+        "import django; django.setup()\n"
+        "import Helyar1_Backend.urls\n"
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = 'Measure startup time of manage.py, Celery and web worker boot'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=10,
+            help='Fresh interpreters started per scenario',
+        )
+        parser.add_argument(
+            '--scenario',
+            choices=sorted(SCENARIOS),
+            action='append',
+            help='Scenario to run (repeatable; defaults to all)',
+        )
+
+    def handle(self, *args, **options):
+        runs = options['runs']
+        if runs < 1:
+            raise CommandError('--runs must be at least 1')
+
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'Helyar1_Backend.settings')}
+
+        self.stdout.write(f"{'scenario':<10}{'median':>10}{'min':>10}{'max':>10}  gocardless_pro loaded")
+        for name in options['scenario'] or SCENARIOS:
+            timings = []
+            loaded = None
+            for _ in range(runs):
+                started = time.perf_counter()
+                result = subprocess.run(
+                    [sys.executable, '-c', SCENARIOS[name] + GOCARDLESS_PROBE],
+                    cwd=settings.BASE_DIR,
+                    env=env,
+                    capture_output=True,
+                    text=True,
+                )
+                timings.append(time.perf_counter() - started)
+                if result.returncode != 0:
+                    raise CommandError(f"Scenario '{name}' failed:\n{result.stderr}")
+                loaded = result.stderr.strip().splitlines()[-1]
+
+            self.stdout.write(
+                f"{name:<10}"
+                f"{statistics.median(timings) * 1000:>8.0f}ms"
+                f"{min(timings) * 1000:>8.0f}ms"
+                f"{max(timings) * 1000:>8.0f}ms"
+                f"  {loaded}"
+            )
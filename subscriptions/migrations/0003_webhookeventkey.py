@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0002_webhookevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookEventKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=100, unique=True)),
+                ('claim_token', models.CharField(max_length=32)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Webhook Event Key',
+                'verbose_name_plural': 'Webhook Event Keys',
+            },
+        ),
+    ]
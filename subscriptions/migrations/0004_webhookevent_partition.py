@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0003_webhookeventkey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhookevent',
+            name='ordering_key',
+            field=models.CharField(default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='webhookevent',
+            name='partition',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='webhookevent',
+            index=models.Index(fields=['partition', 'status', 'occurred_at'], name='subscriptio_partiti_d13dd8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='webhookevent',
+            index=models.Index(fields=['ordering_key', 'status'], name='subscriptio_orderin_461c8b_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0004_webhookevent_partition'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('position', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Webhook Cursor',
+                'verbose_name_plural': 'Webhook Cursors',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0006_billingoperation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
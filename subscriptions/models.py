@@ -4,11 +4,16 @@ from django.utils import timezone
 from datetime import timedelta
 from accounts.models import User
 import secrets
+import uuid
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class TransitionConflict(Exception):
+    """The row changed since it was read; the caller should re-read and retry"""
+
+
 class Subscription(models.Model):
     STATUS = [
         ("active", "Active"),
@@ -25,7 +30,7 @@ class Subscription(models.Model):
     status = models.CharField(max_length=30, choices=STATUS, default="inactive")
     
     # Temporary fields for flow tracking
-    temp_flow_id = models.CharField(max_length=100, blank=True, null=True)
+    temp_flow_id = models.CharField(max_length=100, blank=True, null=True, db_index=True)
     temp_billing_request_id = models.CharField(max_length=100, blank=True, null=True, db_index=True)
     temp_state = models.CharField(max_length=64, blank=True, null=True)  # CSRF protection
     
@@ -39,6 +44,8 @@ class Subscription(models.Model):
     # Metadata
     last_payment_date = models.DateTimeField(null=True, blank=True)
     failed_payment_count = models.IntegerField(default=0)
+    # Bumped on every write; compare-and-swap token for subscriptions.state_machine
+    version = models.PositiveIntegerField(default=0)
     
     def __str__(self):
         return f"Subscription for {self.user.email} - {self.status}"
@@ -76,11 +83,8 @@ class Subscription(models.Model):
         self.save()
         
         # Sync user flags
-        self.user.subscription_status = False
-        self.user.save()
-        if hasattr(self.user, 'profile'):
-            self.user.profile.subscription_status = False
-            self.user.profile.save()
+        from .flag_sync import SubscriptionFlagService
+        SubscriptionFlagService.sync(self.user_id, False)
         
         logger.info(f"Subscription marked as expired for user {self.user.email}")
     
@@ -99,11 +103,8 @@ class Subscription(models.Model):
         self.save()
         
         # Sync user flags
-        self.user.subscription_status = True
-        self.user.save()
-        if hasattr(self.user, 'profile'):
-            self.user.profile.subscription_status = True
-            self.user.profile.save()
+        from .flag_sync import SubscriptionFlagService
+        SubscriptionFlagService.sync(self.user_id, True)
         
         logger.info(f"Subscription renewed for user {self.user.email} until {self.expires_at}")
     
@@ -115,16 +116,14 @@ class Subscription(models.Model):
         if self.failed_payment_count >= 3:
             self.is_active = False
             self.status = 'inactive'
-            
-            self.user.subscription_status = False
-            self.user.save()
-            if hasattr(self.user, 'profile'):
-                self.user.profile.subscription_status = False
-                self.user.profile.save()
-            
-            logger.warning(f"Subscription deactivated after {self.failed_payment_count} failed payments for {self.user.email}")
         
         self.save()
+        
+        if not self.is_active:
+            from .flag_sync import SubscriptionFlagService
+            SubscriptionFlagService.sync(self.user_id, False)
+            
+            logger.warning(f"Subscription deactivated after {self.failed_payment_count} failed payments for {self.user.email}")
     
     def clear_temp_fields(self):
         """Clear temporary flow tracking fields"""
@@ -160,7 +159,31 @@ class Subscription(models.Model):
                 self.status = 'expired'
                 logger.info(f"Auto-expired subscription for {self.user.email}")
         
-        super().save(*args, **kwargs)
+        # Existing rows are written compare-and-swap on the version read (see _do_update)
+        if self._state.adding:
+            super().save(*args, **kwargs)
+            return
+        
+        read_version = self.version
+        self.version = read_version + 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        try:
+            super().save(*args, **kwargs)
+        except Exception:
+            self.version = read_version
+            raise
+    
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # UPDATE ... WHERE id = %s AND version = <version read>, like the state machine's writes
+        if not values:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        read_version = self.version - 1
+        if base_qs.filter(pk=pk_val, version=read_version)._update(values) > 0:
+            return True
+        if base_qs.filter(pk=pk_val).exists():
+            raise TransitionConflict(f"Subscription {pk_val} changed since version {read_version}")
+        return False
 
     class Meta:
         indexes = [
@@ -209,4 +232,115 @@ class PaymentHistory(models.Model):
         indexes = [
             models.Index(fields=['gc_payment_id']),
             models.Index(fields=['status']),
-        ]
\ No newline at end of file
+        ]
+
+class WebhookEvent(models.Model):
+    """
+    Inbox of verified GoCardless webhook events.
+    The webhook view only records events here; Celery workers apply them.
+    """
+    STATUS = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('processed', 'Processed'),
+        ('failed', 'Failed'),
+    ]
+    
+    event_id = models.CharField(max_length=100, db_index=True)
+    resource_type = models.CharField(max_length=50)
+    action = models.CharField(max_length=50)
+    payload = models.JSONField()
+    occurred_at = models.DateTimeField(null=True, blank=True)  # GoCardless event created_at
+    # Mandate ID (else subscription / billing request ID); events sharing it apply in order
+    ordering_key = models.CharField(max_length=100, default='')
+    partition = models.PositiveSmallIntegerField(default=0)
+    
+    status = models.CharField(max_length=20, choices=STATUS, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.event_id} {self.resource_type}.{self.action} - {self.status}"
+    
+    class Meta:
+        ordering = ['occurred_at', 'id']
+        verbose_name = 'Webhook Event'
+        verbose_name_plural = 'Webhook Events'
+        indexes = [
+            models.Index(fields=['status', 'received_at']),
+            models.Index(fields=['partition', 'status', 'occurred_at']),
+            models.Index(fields=['ordering_key', 'status']),
+        ]
+
+
+class WebhookEventKey(models.Model):
+    """
+    Idempotency keys for GoCardless webhook events, shared by every web process.
+    A row exists for each event ID already accepted into the inbox.
+    """
+    event_id = models.CharField(max_length=100, unique=True)
+    claim_token = models.CharField(max_length=32)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    def __str__(self):
+        return self.event_id
+    
+    class Meta:
+        verbose_name = 'Webhook Event Key'
+        verbose_name_plural = 'Webhook Event Keys'
+
+
+class WebhookCursor(models.Model):
+    """
+    Position of a catch-up reader in the GoCardless events API: the created_at
+    of the newest event it has fed into the webhook inbox.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    position = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
+    
+    class Meta:
+        verbose_name = 'Webhook Cursor'
+        verbose_name_plural = 'Webhook Cursors'
+
+
+class BillingOperation(models.Model):
+    """
+    Status handle for a checkout step run by Celery (see subscriptions.billing_orchestration).
+    The endpoint that starts it returns the ID; the frontend polls it for the result.
+    """
+    KIND = [
+        ('create_billing_request', 'Create billing request'),
+        ('complete_mandate', 'Complete mandate'),
+    ]
+    STATUS = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='billing_operations')
+    subscription = models.ForeignKey(Subscription, on_delete=models.CASCADE, related_name='billing_operations')
+    kind = models.CharField(max_length=30, choices=KIND)
+    status = models.CharField(max_length=20, choices=STATUS, default='queued')
+    step = models.CharField(max_length=50, blank=True, default='')  # Last step started
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.kind} for {self.user_id} - {self.status}"
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Billing Operation'
+        verbose_name_plural = 'Billing Operations'
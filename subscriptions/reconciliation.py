@@ -0,0 +1,180 @@
+# subscriptions/reconciliation.py
+"""
+Bulk reconciliation of local subscriptions against GoCardless.
+
+Instead of one subscriptions.get per subscription, pages through the
+subscriptions and mandates list endpoints (500 records per call, following the
+`after` cursor), diffs each page against local rows held in memory, and writes
+only the rows that changed with bulk UPDATEs. Status mapping matches
+sync_subscription_status.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from Helyar1_Backend.clients import gocardless_client
+from .models import Subscription
+from .entitlements import EntitlementService
+from .state_machine import SubscriptionStateMachine
+from .flag_sync import SubscriptionFlagService
+from .status_events import broker
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Mandates that can no longer collect payments. The mandates list filter takes
+# at most four statuses; 'consumed' only applies to one-off payment mandates.
+UNUSABLE_MANDATE_STATUSES = ('cancelled', 'failed', 'expired', 'blocked')
+
+FIELDS = ('status', 'is_active', 'expires_at')
+
+
+class SubscriptionReconciler:
+
+    @staticmethod
+    def pages(service, params=None):
+        """Yield the records of each page of a GoCardless list endpoint"""
+        params = {'limit': settings.GC_LIST_PAGE_SIZE, **(params or {})}
+        while True:
+            page = service.list(params=params)
+            yield page.records
+            if not page.after:
+                return
+            params = {**params, 'after': page.after}
+
+    @staticmethod
+    def target_state(gc_sub):
+        """Local fields a GoCardless subscription implies, or None to leave the row alone"""
+        if gc_sub.status == 'active':
+            target = {'status': 'active', 'is_active': True}
+            if gc_sub.upcoming_payments:
+                expires_at = datetime.fromisoformat(gc_sub.upcoming_payments[0]['charge_date'].replace('Z', '+00:00'))
+                # charge_date is a plain date; make it comparable with the stored value
+                if timezone.is_naive(expires_at):
+                    expires_at = timezone.make_aware(expires_at, dt_timezone.utc)
+                target['expires_at'] = expires_at
+            return target
+        if gc_sub.status == 'cancelled':
+            return {'status': 'cancelled', 'is_active': False}
+        if gc_sub.status == 'finished':
+            return {'status': 'expired', 'is_active': False}
+        return None
+
+    @staticmethod
+    def _differs(row, target):
+        return any(row[field] != value for field, value in target.items())
+
+    @staticmethod
+    def run():
+        """Reconcile every local subscription; returns counts"""
+        local = {
+            row['subscription_id']: row
+            for row in Subscription.objects.exclude(subscription_id=None).values('id', 'subscription_id', *FIELDS)
+        }
+        result = {'remote': 0, 'matched': 0, 'updated': 0, 'mandates_unusable': 0}
+
+        for records in SubscriptionReconciler.pages(gocardless_client.subscriptions):
+            result['remote'] += len(records)
+            changes = {}
+            for gc_sub in records:
+                row = local.get(gc_sub.id)
+                if row is None:
+                    continue
+                result['matched'] += 1
+                target = SubscriptionReconciler.target_state(gc_sub)
+                if target is not None and SubscriptionReconciler._differs(row, target):
+                    changes[row['id']] = target
+            result['updated'] += SubscriptionReconciler.apply(changes)
+
+        # Active rows whose mandate can no longer collect, e.g. missed cancellation webhooks
+        unusable = set()
+        for records in SubscriptionReconciler.pages(
+            gocardless_client.mandates, {'status': ','.join(UNUSABLE_MANDATE_STATUSES)}
+        ):
+            unusable.update(mandate.id for mandate in records)
+        result['mandates_unusable'] = len(unusable)
+
+        unusable = list(unusable)
+        chunk_size = settings.SUBSCRIPTION_JOB_CHUNK_SIZE
+        for start in range(0, len(unusable), chunk_size):
+            subscription_ids = Subscription.objects.filter(
+                is_active=True,
+                user__profile__mandate_id__in=unusable[start:start + chunk_size],
+            ).values_list('id', flat=True)
+            result['updated'] += SubscriptionReconciler.apply(
+                {subscription_id: {'status': 'cancelled', 'is_active': False} for subscription_id in subscription_ids}
+            )
+
+        return result
+
+    @staticmethod
+    def apply(changes):
+        """
+        Write {subscription pk: target fields} with bulk UPDATEs and sync the
+        user/profile flags. Rows are locked and re-checked first, so a webhook
+        that changed a row since it was read isn't overwritten with a stale diff;
+        moves the state machine doesn't allow are skipped.
+        """
+        if not changes:
+            return 0
+
+        with transaction.atomic():
+            subscriptions = list(
+                Subscription.objects.select_for_update()
+                .filter(id__in=changes).only('id', 'user_id', *FIELDS)
+            )
+            updated = []
+            activated = []
+            deactivated = []
+            for subscription in subscriptions:
+                target = changes[subscription.id]
+                if not SubscriptionReconciler._differs(
+                    {field: getattr(subscription, field) for field in target}, target
+                ):
+                    continue
+                if not SubscriptionStateMachine.allowed(subscription.status, target['status']):
+                    logger.warning(
+                        f"Not reconciling subscription {subscription.id}: {subscription.status} -> {target['status']}"
+                    )
+                    continue
+                was_active = subscription.is_active
+                for field, value in target.items():
+                    setattr(subscription, field, value)
+                subscription.version = F('version') + 1
+                updated.append(subscription)
+                if subscription.is_active and not was_active:
+                    activated.append(subscription.user_id)
+                elif was_active and not subscription.is_active:
+                    deactivated.append(subscription.user_id)
+
+            if not updated:
+                return 0
+
+            Subscription.objects.bulk_update(updated, [*FIELDS, 'version'])
+            SubscriptionFlagService.sync_many(activated, True)
+            # Also make tokens carrying subscriber claims refresh
+            SubscriptionFlagService.sync_many(deactivated, False, revoke=True)
+
+            # bulk_update() skips the Subscription signals
+            user_ids = [subscription.user_id for subscription in updated]
+            transaction.on_commit(lambda: EntitlementService.invalidate(*user_ids))
+            statuses = [
+                (subscription.user_id, {'status': subscription.status, 'is_active': subscription.is_active})
+                for subscription in updated
+            ]
+            transaction.on_commit(lambda: SubscriptionReconciler._publish(statuses))
+
+        logger.info(
+            f"Reconciled {len(updated)} subscriptions "
+            f"({len(activated)} activated, {len(deactivated)} deactivated)"
+        )
+        return len(updated)
+
+    @staticmethod
+    def _publish(statuses):
+        """Wake MandateStatusStream connections held for the reconciled users"""
+        for user_id, message in statuses:
+            broker.publish(user_id, message)
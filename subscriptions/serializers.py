@@ -33,6 +33,14 @@ class CompleteBillingRequestSerializer(serializers.Serializer):
     status_url = serializers.CharField()
     message = serializers.CharField()
 
+class BillingOperationSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=['queued', 'running', 'succeeded', 'failed'])
+    operation_id = serializers.UUIDField()
+    status_url = serializers.URLField(required=False)
+    kind = serializers.CharField(required=False)
+    result = serializers.JSONField(required=False, allow_null=True)
+    error = serializers.CharField(required=False, allow_null=True)
+
 class MandateStatusResponseSerializer(serializers.Serializer):
     status = serializers.CharField()
     mandate_id = serializers.CharField(required=False)
@@ -0,0 +1,23 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Subscription
+from .entitlements import EntitlementService
+from .status_events import broker
+
+
+# Cached entitlements are dropped once the subscription change commits
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_entitlement(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: EntitlementService.invalidate(user_id))
+
+
+# Wake any MandateStatusStream connections held for this user
+@receiver(post_save, sender=Subscription)
+def publish_subscription_status(sender, instance, **kwargs):
+    user_id = instance.user_id
+    message = {'status': instance.status, 'is_active': instance.is_active}
+    transaction.on_commit(lambda: broker.publish(user_id, message))
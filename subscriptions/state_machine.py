@@ -0,0 +1,129 @@
+# subscriptions/state_machine.py
+"""
+Subscription status transitions, written with compare-and-swap.
+
+Every Subscription row carries a `version` that each write bumps. A transition
+checks the move against TRANSITIONS and writes only if nobody has touched the
+row since it was read:
+
+    UPDATE subscriptions_subscription SET ..., version = version + 1
+    WHERE id = %s AND version = %s
+
+If no row matches, another worker got there first: the row is re-read and the
+caller's decision made again against what is now stored (the move may have
+already happened, or may no longer be allowed). No row lock is held, so
+GoCardless calls can happen between the read and the write.
+
+    SubscriptionStateMachine.transition(subscription, 'cancelled', is_active=False)
+
+A write that sets is_active updates the User/UserProfile flags in the same
+transaction (SubscriptionFlagService).
+
+Writers that lock rows instead (the lifecycle jobs, reconciliation) bump
+`version` too, so they never slip under a CAS write. Subscription.save() on an
+existing row is itself a CAS write on the version it was loaded with, and
+raises TransitionConflict instead of overwriting a newer row.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from .models import Subscription, TransitionConflict
+from .flag_sync import SubscriptionFlagService
+
+import logging
+logger = logging.getLogger(__name__)
+
+# status -> statuses it may move to; staying in the same status is always allowed
+TRANSITIONS = {
+    'inactive': {'pending', 'active', 'cancelled'},
+    'pending': {'active', 'inactive', 'cancelled'},
+    'active': {'pending', 'inactive', 'cancelled', 'expired'},
+    'expired': {'pending', 'active', 'cancelled'},
+    # A cancelled GoCardless subscription never collects again; a new checkout goes via pending
+    'cancelled': {'pending'},
+}
+
+
+class SubscriptionStateMachine:
+
+    @staticmethod
+    def allowed(from_status, to_status):
+        return from_status == to_status or to_status in TRANSITIONS.get(from_status, ())
+
+    @staticmethod
+    def transition(subscription, to_status, **fields):
+        """
+        Move `subscription` to `to_status`, also setting `fields`. Returns the
+        updated subscription, or None if the move isn't allowed from its status.
+        """
+        return SubscriptionStateMachine.apply(subscription, lambda current: (to_status, fields))
+
+    @staticmethod
+    def apply(subscription, decide):
+        """
+        Call decide(subscription) -> (to_status, fields), or None to leave the
+        row alone, and CAS-write the result. On a version conflict the row is
+        reloaded and decide() called again with the fresh copy.
+
+        Returns the updated subscription, or None if decide() declined or the
+        move isn't allowed. Raises TransitionConflict after
+        SUBSCRIPTION_TRANSITION_ATTEMPTS lost races.
+        """
+        for _ in range(settings.SUBSCRIPTION_TRANSITION_ATTEMPTS):
+            change = decide(subscription)
+            if change is None:
+                return None
+
+            to_status, fields = change
+            if not SubscriptionStateMachine.allowed(subscription.status, to_status):
+                logger.warning(
+                    f"Ignoring subscription {subscription.id} transition {subscription.status} -> {to_status}"
+                )
+                return None
+
+            if SubscriptionStateMachine._swap(subscription, to_status, fields):
+                return subscription
+
+            logger.info(f"Subscription {subscription.id} changed since version {subscription.version}, re-reading")
+            subscription.refresh_from_db()
+
+        raise TransitionConflict(f"Subscription {subscription.id} changed on every attempt")
+
+    @staticmethod
+    def _swap(subscription, to_status, fields):
+        values = {'status': to_status, **fields}
+
+        # What Subscription.save() would have filled in
+        if to_status == 'active' and values.get('is_active', subscription.is_active) and not subscription.started_at:
+            values.setdefault('started_at', timezone.now())
+        expires_at = values.get('expires_at')
+        if expires_at is not None and timezone.is_naive(expires_at):
+            values['expires_at'] = timezone.make_aware(expires_at)
+
+        was_active = subscription.is_active
+        with transaction.atomic():
+            updated = Subscription.objects.filter(id=subscription.id, version=subscription.version).update(
+                version=F('version') + 1, **values
+            )
+            if not updated:
+                return False
+
+            if 'is_active' in values:
+                # Losing access early also invalidates tokens carrying subscriber claims
+                SubscriptionFlagService.sync(
+                    subscription.user_id, values['is_active'], revoke=was_active and not values['is_active']
+                )
+
+            for field, value in values.items():
+                setattr(subscription, field, value)
+            subscription.version += 1
+
+            # update() skips the Subscription signals (entitlement invalidation, status push)
+            post_save.send(
+                sender=Subscription, instance=subscription, created=False,
+                update_fields=frozenset(values) | {'version'}, raw=False, using=subscription._state.db,
+            )
+        return True
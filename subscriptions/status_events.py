@@ -0,0 +1,126 @@
+# subscriptions/status_events.py
+"""
+Local pub/sub for subscription status changes.
+
+Subscription saves publish the user's new status once the change commits.
+Held MandateStatusStream connections subscribe per user and are woken through
+an asyncio queue on their own event loop, so one process serves any number of
+waiting clients with no polling.
+
+Webhooks are applied by Celery workers, so with SUBSCRIPTION_EVENTS_REDIS_URL
+set, publishes go through Redis and each web process runs a single listener
+thread that fans messages out to its local subscribers. Without it, only
+changes made in the same process are delivered.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+
+import logging
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'subscription-status:'
+
+# How long subscribe() waits for the listener's Redis subscription to be confirmed
+LISTENER_READY_TIMEOUT = 5
+
+
+class SubscriptionStatusBroker:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)  # user_id -> {(loop, queue)}
+        self._redis = None
+        self._listener = None
+        self._listener_ready = threading.Event()
+
+    def _get_redis(self):
+        url = getattr(settings, 'SUBSCRIPTION_EVENTS_REDIS_URL', None)
+        if not url:
+            return None
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(url)
+        return self._redis
+
+    def subscribe(self, user_id):
+        """
+        Register the calling coroutine's loop for a user's updates; returns its queue.
+        With Redis, returns once the listener is subscribed, so nothing published
+        after this call is missed.
+        """
+        queue = asyncio.Queue()
+        entry = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers[str(user_id)].add(entry)
+        self._ensure_listener()
+        return entry
+
+    def unsubscribe(self, user_id, entry):
+        with self._lock:
+            subscribers = self._subscribers.get(str(user_id))
+            if subscribers is not None:
+                subscribers.discard(entry)
+                if not subscribers:
+                    del self._subscribers[str(user_id)]
+
+    def publish(self, user_id, message):
+        """Announce a status change for a user (callable from sync code in any process)"""
+        client = self._get_redis()
+        if client is not None:
+            try:
+                client.publish(f"{CHANNEL_PREFIX}{user_id}", json.dumps(message))
+                return
+            except Exception as e:
+                logger.warning(f"Failed to publish subscription status for user {user_id}: {str(e)}")
+        self._deliver(str(user_id), message)
+
+    def _deliver(self, user_id, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, message)
+            except RuntimeError:
+                # The subscriber's loop has closed; it will unsubscribe itself
+                pass
+
+    def _ensure_listener(self):
+        if self._get_redis() is None:
+            return
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener_ready = threading.Event()
+                self._listener = threading.Thread(
+                    target=self._listen, args=(self._listener_ready,),
+                    name='subscription-status-listener', daemon=True,
+                )
+                self._listener.start()
+            ready = self._listener_ready
+
+        # Redis drops messages published before the psubscribe is confirmed
+        if not ready.wait(LISTENER_READY_TIMEOUT):
+            logger.warning("Subscription status listener not subscribed yet; updates may be missed")
+
+    def _listen(self, ready):
+        """One Redis subscription per process, fanned out to local subscribers"""
+        try:
+            pubsub = self._get_redis().pubsub()
+            pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+            for item in pubsub.listen():
+                if item['type'] == 'psubscribe':
+                    ready.set()
+                    continue
+                if item['type'] != 'pmessage':
+                    continue
+                channel = item['channel'].decode() if isinstance(item['channel'], bytes) else item['channel']
+                self._deliver(channel[len(CHANNEL_PREFIX):], json.loads(item['data']))
+        except Exception as e:
+            # Next subscribe() restarts the listener
+            logger.error(f"Subscription status listener stopped: {str(e)}", exc_info=True)
+
+
+broker = SubscriptionStatusBroker()
@@ -1,8 +1,15 @@
 # subscriptions/tasks.py
 from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
 from datetime import timedelta
 from .models import Subscription
+from .entitlements import EntitlementService
+from .state_machine import SubscriptionStateMachine
+from .flag_sync import SubscriptionFlagService
+from Helyar1_Backend.ratelimit import background_priority
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,21 +19,38 @@ logger = logging.getLogger(__name__)
 def check_expired_subscriptions():
     """
     Check for expired subscriptions and mark them accordingly.
+    Works in chunked transactions of set-based UPDATEs over subscriptions,
+    users and profiles instead of saving each row.
     Run daily via Celery Beat.
     """
     logger.info("Starting expired subscriptions check")
     
-    # Find subscriptions that should be expired
-    expired_subs = Subscription.objects.filter(
-        is_active=True,
-        expires_at__lt=timezone.now()
-    )
-    
+    now = timezone.now()
+    chunk_size = settings.SUBSCRIPTION_JOB_CHUNK_SIZE
     count = 0
-    for sub in expired_subs:
-        sub.mark_expired()
-        count += 1
-        logger.info(f"Expired subscription for user {sub.user.email}")
+    
+    while True:
+        with transaction.atomic():
+            # Lock the chunk so a renewal webhook can't slip in between select and update
+            rows = list(
+                Subscription.objects.select_for_update(skip_locked=True)
+                .filter(is_active=True, expires_at__lt=now)
+                .values_list('id', 'user_id')[:chunk_size]
+            )
+            if not rows:
+                break
+            
+            subscription_ids = [subscription_id for subscription_id, _ in rows]
+            user_ids = [user_id for _, user_id in rows]
+            
+            Subscription.objects.filter(id__in=subscription_ids).update(
+                is_active=False, status='expired', version=F('version') + 1
+            )
+            SubscriptionFlagService.sync_many(user_ids, False)
+            # update() skips the Subscription signals
+            transaction.on_commit(lambda user_ids=user_ids: EntitlementService.invalidate(*user_ids))
+        
+        count += len(rows)
     
     logger.info(f"Completed expired subscriptions check: {count} subscriptions expired")
     return f"Expired {count} subscriptions"
@@ -62,6 +86,7 @@ def send_expiry_reminders():
 
 
 @shared_task
+@background_priority()
 def sync_subscription_status(subscription_id):
     """
     Sync subscription status with GoCardless.
@@ -83,32 +108,27 @@ def sync_subscription_status(subscription_id):
         
         # Update based on GoCardless status
         if gc_sub.status == 'active':
-            subscription.is_active = True
-            subscription.status = 'active'
+            to_status, fields = 'active', {'is_active': True}
             
             # Update expiry from upcoming payments
             if hasattr(gc_sub, 'upcoming_payments') and gc_sub.upcoming_payments:
                 from datetime import datetime
-                subscription.expires_at = datetime.fromisoformat(
+                fields['expires_at'] = datetime.fromisoformat(
                     gc_sub.upcoming_payments[0]['charge_date'].replace('Z', '+00:00')
                 )
         
         elif gc_sub.status == 'cancelled':
-            subscription.is_active = False
-            subscription.status = 'cancelled'
+            to_status, fields = 'cancelled', {'is_active': False}
         
         elif gc_sub.status == 'finished':
-            subscription.is_active = False
-            subscription.status = 'expired'
+            to_status, fields = 'expired', {'is_active': False}
         
-        subscription.save()
+        else:
+            to_status = None
         
-        # Sync user flags
-        subscription.user.subscription_status = subscription.is_active
-        subscription.user.save()
-        if hasattr(subscription.user, 'profile'):
-            subscription.user.profile.subscription_status = subscription.is_active
-            subscription.user.profile.save()
+        # The transition also syncs the user/profile flags; otherwise repair them from the row
+        if not (to_status and SubscriptionStateMachine.transition(subscription, to_status, **fields)):
+            SubscriptionFlagService.resync([subscription.user_id])
         
         logger.info(f"Successfully synced subscription for {subscription.user.email}")
         return f"Synced subscription for {subscription.user.email}"
@@ -121,7 +141,47 @@ def sync_subscription_status(subscription_id):
         return f"Sync failed: {str(e)}"
 
 
+@shared_task(bind=True, max_retries=None)
+def billing_operation_step(self, operation_id, step):
+    """
+    Run one step of a BillingOperation (see subscriptions.billing_orchestration).
+    Chained per operation; transient GoCardless errors retry the step with backoff.
+    """
+    from .billing_orchestration import BillingOrchestrator, is_transient
+    
+    try:
+        BillingOrchestrator.run_step(operation_id, step)
+    except Exception as e:
+        # Inline (eager) runs answer the request now rather than retrying
+        if is_transient(e) and not self.request.is_eager and self.request.retries < settings.BILLING_STEP_MAX_RETRIES:
+            logger.warning(f"Billing operation {operation_id} step {step} will retry: {str(e)}")
+            raise self.retry(exc=e, countdown=min(2 ** self.request.retries, 30))
+        logger.error(f"Billing operation {operation_id} failed at {step}: {str(e)}", exc_info=True)
+        BillingOrchestrator.fail(operation_id, str(e))
+        raise
+    return f"{step} done for {operation_id}"
+
+
 @shared_task
+@background_priority()
+def reconcile_subscriptions():
+    """
+    Reconcile all subscriptions with GoCardless using paginated list calls.
+    Run daily via Celery Beat; replaces fanning out sync_subscription_status.
+    """
+    from .reconciliation import SubscriptionReconciler
+    
+    logger.info("Starting subscription reconciliation")
+    result = SubscriptionReconciler.run()
+    logger.info(f"Completed subscription reconciliation: {result}")
+    return (
+        f"Reconciled {result['matched']} subscriptions against {result['remote']} remote: "
+        f"{result['updated']} updated"
+    )
+
+
+@shared_task
+@background_priority()
 def retry_failed_payment(subscription_id):
     """
     Retry a failed payment for a subscription.
@@ -202,24 +262,91 @@ def send_expiry_notification(user, expiry_date):
 def cleanup_pending_subscriptions():
     """
     Clean up subscriptions stuck in pending state for more than 24 hours.
+    Clears the temp flow fields and resets status with chunked UPDATEs.
     Run daily via Celery Beat.
     """
     logger.info("Starting cleanup of pending subscriptions")
     
     cutoff_time = timezone.now() - timedelta(hours=24)
-    stale_subs = Subscription.objects.filter(
-        status='pending',
-        created_at__lt=cutoff_time
-    )
-    
+    chunk_size = settings.SUBSCRIPTION_JOB_CHUNK_SIZE
     count = 0
-    for sub in stale_subs:
-        # Clear temp fields
-        sub.clear_temp_fields()
-        sub.status = 'inactive'
-        sub.save()
-        count += 1
-        logger.info(f"Cleaned up stale pending subscription for {sub.user.email}")
+    
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Subscription.objects.select_for_update(skip_locked=True)
+                .filter(status='pending', created_at__lt=cutoff_time)
+                .values_list('id', 'user_id')[:chunk_size]
+            )
+            if not rows:
+                break
+            
+            subscription_ids = [subscription_id for subscription_id, _ in rows]
+            user_ids = [user_id for _, user_id in rows]
+            
+            Subscription.objects.filter(id__in=subscription_ids).update(
+                status='inactive',
+                version=F('version') + 1,
+                temp_flow_id=None,
+                temp_billing_request_id=None,
+                temp_state=None,
+            )
+            transaction.on_commit(lambda user_ids=user_ids: EntitlementService.invalidate(*user_ids))
+        
+        count += len(rows)
     
     logger.info(f"Completed cleanup: {count} pending subscriptions cleaned")
-    return f"Cleaned {count} stale subscriptions"
\ No newline at end of file
+    return f"Cleaned {count} stale subscriptions"
+
+
+@shared_task
+def process_webhook_partition(partition):
+    """
+    Drain one partition of the webhook inbox in event order.
+    Enqueued on the webhooks.<partition> queue by WebhookHandler.
+    """
+    from .webhook_service import WebhookInboxService
+    
+    result = WebhookInboxService.process(partition)
+    logger.info(f"Processed webhook partition: {result}")
+    return result
+
+
+@shared_task
+def retry_webhook_events():
+    """
+    Requeue inbox events that were never enqueued, were abandoned by a worker,
+    or failed with attempts left.
+    Run every few minutes via Celery Beat.
+    """
+    from .webhook_service import WebhookInboxService
+    
+    count = WebhookInboxService.requeue_stuck()
+    return f"Requeued {count} webhook events"
+
+
+@shared_task
+@background_priority()
+def catch_up_webhook_events():
+    """
+    Feed GoCardless events missed by the webhook endpoint into the inbox.
+    Run every 10 minutes via Celery Beat.
+    """
+    from .webhook_service import WebhookCatchUpService
+    
+    result = WebhookCatchUpService.run()
+    logger.info(f"Webhook catch-up: {result}")
+    return f"Recorded {result['recorded']} of {result['seen']} events"
+
+
+@shared_task
+def prune_webhook_events():
+    """
+    Drop expired webhook idempotency keys and old processed inbox events.
+    Run daily via Celery Beat.
+    """
+    from .webhook_service import WebhookIdempotencyStore
+    
+    keys, events = WebhookIdempotencyStore.prune()
+    logger.info(f"Pruned {keys} webhook event keys and {events} processed webhook events")
+    return f"Pruned {keys} keys and {events} events"
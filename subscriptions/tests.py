@@ -14,11 +14,34 @@ Usage:
 
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
+from types import SimpleNamespace
+from unittest import mock
+import asyncio
+import json
+import requests
+import threading
+from rest_framework.test import APIClient
+from gocardless_pro.resources import Event, Mandate, Subscription as GoCardlessSubscription
 from Helyar1_Backend.clients import gocardless_client
+from Helyar1_Backend.gocardless import CircuitBreaker, ResilientApiClient
+from Helyar1_Backend.ratelimit import BACKGROUND, INTERACTIVE, TokenBucketLimiter, background_priority, current_lane
+from Helyar1_Backend.resource_cache import GoCardlessResourceCache
 from accounts.models import User
-from subscriptions.models import Subscription
+from user_profile.models import UserProfile
+from subscriptions.models import BillingOperation, Subscription, TransitionConflict, WebhookEvent, WebhookEventKey
+from subscriptions.billing_orchestration import BillingOrchestrator, BillingStepFailed, is_transient
+from subscriptions.entitlements import EntitlementService, _LocalLRU
+from subscriptions.flag_sync import SubscriptionFlagService
+from subscriptions.reconciliation import SubscriptionReconciler
+from subscriptions.state_machine import SubscriptionStateMachine
+from subscriptions.status_events import SubscriptionStatusBroker
+from subscriptions.webhook_service import WebhookEventProcessor, WebhookIdempotencyStore, WebhookInboxService
 import logging
 
 logger = logging.getLogger(__name__)
@@ -497,4 +520,833 @@ class Command(BaseCommand):
         elif status_lower in ['cancelled', 'failed', 'expired', 'inactive']:
             return self.style.ERROR(status)
         else:
-            return status
\ No newline at end of file
+            return status
+
+
+def webhook_event(event_id, resource_type, action, minute, **links):
+    return Event({
+        'id': event_id,
+        'resource_type': resource_type,
+        'action': action,
+        'created_at': f'2026-01-01T00:{minute:02d}:00.000Z',
+        'links': links,
+    }, None)
+
+
+class WebhookIdempotencyStoreTests(TestCase):
+
+    def test_claim_new_overlapping_batches(self):
+        self.assertEqual(WebhookIdempotencyStore.claim_new(['EV1', 'EV2']), {'EV1', 'EV2'})
+        self.assertEqual(WebhookIdempotencyStore.claim_new(['EV2', 'EV3']), {'EV3'})
+        self.assertEqual(WebhookIdempotencyStore.claim_new(['EV1', 'EV3']), set())
+        self.assertEqual(WebhookEventKey.objects.count(), 3)
+
+    def test_claim_new_repeated_in_batch(self):
+        self.assertEqual(WebhookIdempotencyStore.claim_new(['EV1', 'EV1']), {'EV1'})
+
+    def test_claim_new_empty(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(WebhookIdempotencyStore.claim_new([]), set())
+
+    def test_record_skips_received_events(self):
+        with transaction.atomic():
+            WebhookInboxService.record([webhook_event('EV1', 'payments', 'confirmed', 1, subscription='SB1')])
+            rows = WebhookInboxService.record([
+                webhook_event('EV1', 'payments', 'confirmed', 1, subscription='SB1'),
+                webhook_event('EV2', 'payments', 'paid_out', 2, subscription='SB1'),
+                webhook_event('EV2', 'payments', 'paid_out', 2, subscription='SB1'),
+            ])
+
+        self.assertEqual([row.event_id for row in rows], ['EV2'])
+        self.assertEqual(WebhookEvent.objects.count(), 2)
+
+
+@override_settings(WEBHOOK_PARTITIONS=1)
+class WebhookCoalescingTests(TestCase):
+
+    def test_burst_applies_net_transition(self):
+        with transaction.atomic():
+            WebhookInboxService.record([
+                webhook_event('EV1', 'payments', 'confirmed', 1, subscription='SB1'),
+                webhook_event('EV2', 'payments', 'paid_out', 2, subscription='SB1'),
+                webhook_event('EV3', 'payments', 'failed', 3, subscription='SB1'),
+                webhook_event('EV4', 'payments', 'confirmed', 4, subscription='SB2'),
+            ])
+
+        with mock.patch.object(WebhookEventProcessor, 'apply_transition') as apply_transition:
+            result = WebhookInboxService.process(0)
+
+        self.assertEqual(result, {'partition': 0, 'processed': 4, 'failed': 0})
+        self.assertCountEqual(
+            apply_transition.call_args_list, [mock.call('SB1', 'deactivate'), mock.call('SB2', 'activate')]
+        )
+
+    def test_events_without_transition(self):
+        with transaction.atomic():
+            WebhookInboxService.record([
+                webhook_event('EV1', 'payments', 'confirmed', 1, subscription='SB1'),
+                webhook_event('EV2', 'payments', 'created', 2, subscription='SB1'),
+            ])
+
+        with mock.patch.object(WebhookEventProcessor, 'apply_transition') as apply_transition:
+            WebhookInboxService.process(0)
+
+        # An event with no transition of its own doesn't undo an earlier one
+        apply_transition.assert_called_once_with('SB1', 'activate')
+
+
+class FakeRedis:
+    """The part of the redis-py client the caches use, kept in a dict"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False, ex=None, px=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value.encode() if isinstance(value, str) else value
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+
+class EntitlementServiceTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='entitled@example.com', password='x')
+        self.subscription = Subscription.objects.create(
+            user=self.user, status='active', is_active=True, expires_at=timezone.now() + timedelta(days=30),
+        )
+        EntitlementService.invalidate(self.user.id)
+
+    def test_cached_after_first_read(self):
+        self.assertTrue(EntitlementService.has_active_subscription(self.user.id))
+
+        with self.assertNumQueries(0):
+            self.assertTrue(EntitlementService.has_active_subscription(self.user.id))
+
+    def test_subscription_change_invalidates(self):
+        self.assertTrue(EntitlementService.has_active_subscription(self.user.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.subscription.mark_cancelled()
+
+        self.assertFalse(EntitlementService.has_active_subscription(self.user.id))
+
+    def test_lapses_at_expiry_without_invalidation(self):
+        EntitlementService.get(self.user.id)
+
+        expired = self.subscription.expires_at + timedelta(seconds=1)
+        with self.assertNumQueries(0), mock.patch('subscriptions.entitlements.timezone.now', return_value=expired):
+            self.assertFalse(EntitlementService.has_active_subscription(self.user.id))
+
+    def test_shared_through_redis(self):
+        redis = FakeRedis()
+        with mock.patch.object(EntitlementService, '_get_redis', return_value=redis):
+            EntitlementService.get(self.user.id)
+
+            # Another process starts with an empty local cache
+            with mock.patch.object(EntitlementService, '_local', _LocalLRU(size=10, ttl=30)):
+                with self.assertNumQueries(0):
+                    self.assertTrue(EntitlementService.has_active_subscription(self.user.id))
+
+                EntitlementService.invalidate(self.user.id)
+
+        self.assertEqual(redis.data, {})
+
+
+@override_settings(
+    GC_RATE_LIMIT_REDIS_URL=None,
+    GC_RATE_LIMIT_PER_MINUTE=6,
+    GC_RATE_LIMIT_BURST=10,
+    GC_RATE_LIMIT_RESERVE=0.5,
+    GC_RATE_LIMIT_INTERACTIVE_WAIT=0,
+    GC_RATE_LIMIT_BACKGROUND_WAIT=0,
+)
+class TokenBucketLimiterTests(SimpleTestCase):
+
+    def take(self, limiter, attempts):
+        return sum(limiter.acquire() for _ in range(attempts))
+
+    def test_background_lane_leaves_reserve(self):
+        limiter = TokenBucketLimiter()
+
+        with background_priority():
+            self.assertEqual(self.take(limiter, 10), 5)
+        # The reserve is still there for interactive calls
+        self.assertEqual(self.take(limiter, 10), 5)
+
+    def test_interactive_lane_uses_whole_bucket(self):
+        limiter = TokenBucketLimiter()
+
+        self.assertEqual(self.take(limiter, 12), 10)
+        with background_priority():
+            self.assertFalse(limiter.acquire())
+
+    def test_drain(self):
+        limiter = TokenBucketLimiter()
+        limiter.drain()
+
+        self.assertFalse(limiter.acquire())
+
+    def test_waits_for_next_token(self):
+        with override_settings(GC_RATE_LIMIT_INTERACTIVE_WAIT=30):
+            limiter = TokenBucketLimiter()
+        limiter.drain()
+
+        def refill(seconds):
+            limiter._local._tokens = 1
+
+        with mock.patch('Helyar1_Backend.ratelimit.time.sleep', side_effect=refill) as sleep:
+            self.assertTrue(limiter.acquire())
+
+        # One token refills in 10s at 6 a minute
+        self.assertAlmostEqual(sleep.call_args.args[0], 10, delta=0.1)
+
+    def test_background_priority_decorator(self):
+        @background_priority()
+        def job():
+            return current_lane()
+
+        self.assertEqual(job(), BACKGROUND)
+        self.assertEqual(current_lane(), INTERACTIVE)
+
+
+class SubscriptionFlagServiceTests(TestCase):
+
+    def setUp(self):
+        self.users = [User.objects.create_user(email=f'flags{n}@example.com', password='x') for n in range(3)]
+        for user in self.users:
+            UserProfile.objects.create(user=user)
+
+    def _flags(self, user):
+        user = User.objects.get(pk=user.pk)
+        return user.subscription_status, user.profile.subscription_status, user.subscription_revoked_at
+
+    def test_sync_many(self):
+        first, second, other = self.users
+        SubscriptionFlagService.sync_many([first.id, second.id], True)
+
+        self.assertEqual(self._flags(first), (True, True, None))
+        self.assertEqual(self._flags(second), (True, True, None))
+        self.assertEqual(self._flags(other), (False, False, None))
+
+    def test_sync_many_revoke(self):
+        first, second, _ = self.users
+        SubscriptionFlagService.sync_many([first.id, second.id], True)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                SubscriptionFlagService.sync_many([first.id], False, revoke=True)
+                # Not stamped until the downgrade is visible to token refreshes
+                self.assertIsNone(self._flags(first)[2])
+
+        active, profile_active, revoked_at = self._flags(first)
+        self.assertFalse(active)
+        self.assertFalse(profile_active)
+        self.assertIsNotNone(revoked_at)
+        self.assertEqual(self._flags(second), (True, True, None))
+
+    def test_sync_many_empty(self):
+        with self.assertNumQueries(0):
+            SubscriptionFlagService.sync_many([], True)
+
+    def test_resync(self):
+        first, second, _ = self.users
+        Subscription.objects.create(user=first, status='active', is_active=True,
+                                    expires_at=timezone.now() + timedelta(days=30))
+        User.objects.filter(pk=second.pk).update(subscription_status=True)
+
+        SubscriptionFlagService.resync([first.id, second.id])
+
+        self.assertEqual(self._flags(first), (True, True, None))
+        self.assertEqual(self._flags(second), (False, False, None))
+
+
+class WebhookRequeueTests(TestCase):
+
+    def event(self, event_id, **fields):
+        return WebhookEvent.objects.create(
+            event_id=event_id, resource_type='payments', action='confirmed', payload={}, **fields
+        )
+
+    def test_requeue_stuck(self):
+        now = timezone.now()
+        self.event('EV1')
+        WebhookEvent.objects.filter(event_id='EV1').update(received_at=now - timedelta(minutes=5))
+        self.event('EV2', status='processing', claimed_at=now - timedelta(hours=1))
+        self.event('EV3', status='failed', attempts=1)
+        # Not stuck: just received, being processed, out of attempts
+        self.event('EV4')
+        self.event('EV5', status='processing', claimed_at=now)
+        self.event('EV6', status='failed', attempts=settings.WEBHOOK_MAX_ATTEMPTS)
+
+        with mock.patch.object(WebhookInboxService, 'enqueue') as enqueue:
+            self.assertEqual(WebhookInboxService.requeue_stuck(), 3)
+
+        enqueue.assert_called_once()
+        self.assertEqual(
+            dict(WebhookEvent.objects.values_list('event_id', 'status')),
+            {'EV1': 'pending', 'EV2': 'pending', 'EV3': 'pending',
+             'EV4': 'pending', 'EV5': 'processing', 'EV6': 'failed'},
+        )
+
+    def test_nothing_stuck(self):
+        self.event('EV1')
+
+        with mock.patch.object(WebhookInboxService, 'enqueue') as enqueue:
+            self.assertEqual(WebhookInboxService.requeue_stuck(), 0)
+
+        enqueue.assert_not_called()
+
+
+@override_settings(WEBHOOK_PARTITIONS=1)
+class WebhookInboxServiceTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(email='inbox@example.com', password='x')
+        UserProfile.objects.create(user=user, mandate_id='MD1')
+        Subscription.objects.create(user=user, status='active', is_active=True, subscription_id='SB1',
+                                    expires_at=timezone.now() + timedelta(days=30))
+
+    def _record(self, *events):
+        with transaction.atomic():
+            return WebhookInboxService.record(list(events))
+
+    def _statuses(self):
+        return dict(WebhookEvent.objects.values_list('event_id', 'status'))
+
+    def test_record_orders_by_mandate(self):
+        self._record(
+            webhook_event('EV1', 'mandates', 'active', 1, mandate='MD1'),
+            webhook_event('EV2', 'subscriptions', 'cancelled', 2, subscription='SB1'),
+            webhook_event('EV3', 'billing_requests', 'fulfilled', 3, billing_request='BRQ9'),
+        )
+
+        keys = dict(WebhookEvent.objects.values_list('event_id', 'ordering_key'))
+        self.assertEqual(keys, {'EV1': 'MD1', 'EV2': 'MD1', 'EV3': 'BRQ9'})
+
+    def test_claim_in_order(self):
+        self._record(
+            webhook_event('EV2', 'payments', 'paid_out', 2, subscription='SB1'),
+            webhook_event('EV1', 'mandates', 'active', 1, mandate='MD1'),
+        )
+
+        rows = WebhookInboxService.claim(0)
+
+        self.assertEqual([row.event_id for row in rows], ['EV1', 'EV2'])
+        self.assertEqual(set(self._statuses().values()), {'processing'})
+        self.assertEqual(WebhookInboxService.claim(0), [])
+
+    def test_failure_holds_later_events(self):
+        self._record(
+            webhook_event('EV1', 'mandates', 'active', 1, mandate='MD1'),
+            webhook_event('EV2', 'payments', 'confirmed', 2, subscription='SB1'),
+            webhook_event('EV3', 'mandates', 'active', 3, mandate='MD2'),
+        )
+
+        failures = ['EV1']
+
+        def dispatch(event):
+            if event.id in failures:
+                failures.remove(event.id)
+                raise RuntimeError('GoCardless unavailable')
+
+        with mock.patch.object(WebhookEventProcessor, 'dispatch', side_effect=dispatch), \
+                mock.patch.object(WebhookEventProcessor, 'apply_transition') as apply_transition:
+            result = WebhookInboxService._apply(WebhookInboxService.claim(0))
+
+            self.assertEqual(result, {'processed': 1, 'failed': 1})
+            apply_transition.assert_not_called()
+            self.assertEqual(self._statuses(), {'EV1': 'failed', 'EV2': 'pending', 'EV3': 'processed'})
+            # A held event wasn't attempted
+            self.assertEqual(WebhookEvent.objects.get(event_id='EV2').attempts, 0)
+
+            # EV2 waits for EV1's retry, and then runs after it
+            self.assertEqual(WebhookInboxService.claim(0), [])
+            WebhookEvent.objects.filter(event_id='EV1').update(status='pending')
+            result = WebhookInboxService._apply(WebhookInboxService.claim(0))
+
+        self.assertEqual(result, {'processed': 2, 'failed': 0})
+        apply_transition.assert_called_once_with('SB1', 'activate')
+        self.assertEqual(set(self._statuses().values()), {'processed'})
+
+    def test_apply_coalesces_consecutive_events(self):
+        self._record(
+            webhook_event('EV1', 'payments', 'confirmed', 1, subscription='SB1'),
+            webhook_event('EV2', 'payments', 'paid_out', 2, subscription='SB1'),
+            webhook_event('EV3', 'mandates', 'active', 3, mandate='MD1'),
+            webhook_event('EV4', 'payments', 'failed', 4, subscription='SB1'),
+            webhook_event('EV5', 'subscriptions', 'cancelled', 5, subscription='SB1'),
+        )
+
+        with mock.patch.object(WebhookEventProcessor, 'dispatch') as dispatch, \
+                mock.patch.object(WebhookEventProcessor, 'apply_transition') as apply_transition:
+            result = WebhookInboxService._apply(WebhookInboxService.claim(0))
+
+        self.assertEqual(result, {'processed': 5, 'failed': 0})
+        # The mandate event splits the payment events into two runs
+        self.assertEqual(
+            apply_transition.call_args_list, [mock.call('SB1', 'activate'), mock.call('SB1', 'cancel')]
+        )
+        self.assertEqual([call.args[0].id for call in dispatch.call_args_list], ['EV3'])
+
+
+class FakeListService:
+    """A GoCardless list endpoint serving pages of records"""
+
+    def __init__(self, *pages):
+        self.pages = pages
+        self.calls = []
+
+    def list(self, params=None):
+        self.calls.append(params)
+        index = int(params.get('after', 0))
+        after = str(index + 1) if index + 1 < len(self.pages) else None
+        return SimpleNamespace(records=self.pages[index], after=after)
+
+
+def gocardless_subscription(subscription_id, status, charge_date=None):
+    return GoCardlessSubscription({
+        'id': subscription_id,
+        'status': status,
+        'upcoming_payments': [{'charge_date': charge_date}] if charge_date else [],
+    }, None)
+
+
+class SubscriptionReconcilerTests(TestCase):
+
+    EXPIRES = datetime(2027, 1, 1, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.users = {}
+        for subscription_id, status, mandate_id in (
+            ('SB1', 'active', 'MD1'),
+            ('SB2', 'active', 'MD2'),
+            ('SB3', 'cancelled', 'MD3'),
+            ('SB4', 'active', 'MD4'),
+        ):
+            active = status == 'active'
+            user = User.objects.create_user(email=f'{subscription_id.lower()}@example.com', password='x')
+            UserProfile.objects.create(user=user, mandate_id=mandate_id, subscription_status=active)
+            User.objects.filter(pk=user.pk).update(subscription_status=active)
+            Subscription.objects.create(
+                user=user, subscription_id=subscription_id, status=status, is_active=active, expires_at=self.EXPIRES,
+            )
+            self.users[subscription_id] = user
+
+    def test_target_state(self):
+        self.assertEqual(
+            SubscriptionReconciler.target_state(gocardless_subscription('SB1', 'active', '2027-01-01')),
+            {'status': 'active', 'is_active': True, 'expires_at': self.EXPIRES},
+        )
+        self.assertEqual(
+            SubscriptionReconciler.target_state(gocardless_subscription('SB1', 'cancelled')),
+            {'status': 'cancelled', 'is_active': False},
+        )
+        self.assertEqual(
+            SubscriptionReconciler.target_state(gocardless_subscription('SB1', 'finished')),
+            {'status': 'expired', 'is_active': False},
+        )
+        self.assertIsNone(SubscriptionReconciler.target_state(gocardless_subscription('SB1', 'paused')))
+
+    def test_run(self):
+        subscriptions = FakeListService(
+            [
+                gocardless_subscription('SB1', 'active', '2027-01-01'),
+                gocardless_subscription('SB2', 'cancelled'),
+            ],
+            [
+                # Not allowed from cancelled; a new checkout goes through pending
+                gocardless_subscription('SB3', 'active', '2027-01-01'),
+                gocardless_subscription('SB4', 'active', '2027-01-01'),
+                gocardless_subscription('SB9', 'active', '2027-01-01'),
+            ],
+        )
+        mandates = FakeListService([
+            Mandate({'id': mandate_id, 'status': 'cancelled'}, None) for mandate_id in ('MD3', 'MD4', 'MD9')
+        ])
+
+        client = SimpleNamespace(subscriptions=subscriptions, mandates=mandates)
+        with mock.patch('subscriptions.reconciliation.gocardless_client', client), \
+                mock.patch('subscriptions.reconciliation.broker') as broker, \
+                self.captureOnCommitCallbacks(execute=True):
+            result = SubscriptionReconciler.run()
+
+        self.assertEqual(result, {'remote': 5, 'matched': 4, 'updated': 2, 'mandates_unusable': 3})
+        self.assertEqual([params.get('after') for params in subscriptions.calls], [None, '1'])
+        self.assertEqual(mandates.calls[0]['status'], 'cancelled,failed,expired,blocked')
+
+        stored = {
+            row['subscription_id']: row
+            for row in Subscription.objects.values('subscription_id', 'status', 'is_active', 'version')
+        }
+        self.assertEqual(stored['SB1'], {'subscription_id': 'SB1', 'status': 'active', 'is_active': True, 'version': 0})
+        self.assertEqual(stored['SB2'], {'subscription_id': 'SB2', 'status': 'cancelled', 'is_active': False, 'version': 1})
+        self.assertEqual(stored['SB3']['status'], 'cancelled')
+        self.assertEqual(stored['SB4'], {'subscription_id': 'SB4', 'status': 'cancelled', 'is_active': False, 'version': 1})
+
+        for subscription_id, active in (('SB1', True), ('SB2', False), ('SB4', False)):
+            user = User.objects.select_related('profile').get(pk=self.users[subscription_id].pk)
+            self.assertEqual(user.subscription_status, active)
+            self.assertEqual(user.profile.subscription_status, active)
+            self.assertEqual(user.subscription_revoked_at is not None, not active)
+
+        # Held status streams hear about the bulk-updated rows too
+        self.assertCountEqual(broker.publish.call_args_list, [
+            mock.call(self.users[subscription_id].id, {'status': 'cancelled', 'is_active': False})
+            for subscription_id in ('SB2', 'SB4')
+        ])
+
+
+@override_settings(GC_CACHE_REDIS_URL=None, GC_CACHE_TTL=10, GC_CACHE_LOCAL_TTL=10)
+class GoCardlessResourceCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = GoCardlessResourceCache()
+
+    def response(self, payload):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(payload).encode()
+        return response
+
+    def test_repeated_get_served_from_cache(self):
+        api = ResilientApiClient(
+            'https://api.gocardless.test', 'token', CircuitBreaker(5, 30), mock.Mock(**{'acquire.return_value': True}),
+        )
+        subscription = self.response({'subscriptions': {'id': 'SB1', 'status': 'active', 'links': {'mandate': 'MD1'}}})
+        cancelled = self.response({'subscriptions': {'id': 'SB1', 'status': 'cancelled', 'links': {'mandate': 'MD1'}}})
+
+        with mock.patch('Helyar1_Backend.gocardless.gocardless_cache', self.cache), \
+                mock.patch.object(api.session, 'request', side_effect=[subscription, subscription, cancelled, cancelled]) as request:
+            self.assertEqual(api.get('/subscriptions/SB1').json(), subscription.json())
+            self.assertEqual(api.get('/subscriptions/SB1').json(), subscription.json())
+            self.assertEqual(request.call_count, 1)
+
+            # Listing and other parameterised reads aren't cached
+            api.get('/subscriptions', params={'limit': 10})
+            self.assertEqual(request.call_count, 2)
+
+            # A write drops the resource it addressed
+            api.post('/subscriptions/SB1/actions/cancel', {})
+            self.assertEqual(api.get('/subscriptions/SB1').json(), cancelled.json())
+            self.assertEqual(request.call_count, 4)
+
+    def test_invalidate_write(self):
+        for resource in (('subscriptions', 'SB1'), ('mandates', 'MD1'), ('mandates', 'MD2'), ('billing_requests', 'BRQ1')):
+            self.cache.set(*resource, b'{}')
+
+        self.cache.invalidate_write(
+            '/subscriptions/SB1/actions/cancel',
+            json.dumps({'subscriptions': {'id': 'SB1', 'links': {'mandate': 'MD1'}}}),
+        )
+        self.assertIsNone(self.cache.get('subscriptions', 'SB1'))
+        self.assertIsNone(self.cache.get('mandates', 'MD1'))
+        self.assertEqual(self.cache.get('mandates', 'MD2'), b'{}')
+
+        # No response (e.g. a timeout): the addressed resource is still dropped
+        self.cache.invalidate_write('/billing_requests/BRQ1/actions/fulfil', None)
+        self.assertIsNone(self.cache.get('billing_requests', 'BRQ1'))
+
+    def test_invalidate_links(self):
+        self.cache.set('subscriptions', 'SB1', b'{}')
+        self.cache.set('mandates', 'MD1', b'{}')
+        self.cache.set('customers', 'CU1', b'{}')
+
+        self.cache.invalidate_links({'subscription': 'SB1'}, None, {'mandate': 'MD1', 'payment': 'PM1'})
+
+        self.assertIsNone(self.cache.get('subscriptions', 'SB1'))
+        self.assertIsNone(self.cache.get('mandates', 'MD1'))
+        self.assertEqual(self.cache.get('customers', 'CU1'), b'{}')
+
+    def test_shared_through_redis(self):
+        redis = FakeRedis()
+        other = GoCardlessResourceCache()
+        with mock.patch.object(self.cache, '_get_redis', return_value=redis), \
+                mock.patch.object(other, '_get_redis', return_value=redis):
+            self.cache.set('subscriptions', 'SB1', b'{}')
+            self.assertEqual(other.get('subscriptions', 'SB1'), b'{}')
+
+            other.invalidate(('subscriptions', 'SB1'))
+
+        self.assertEqual(redis.data, {})
+
+    @override_settings(GC_CACHE_LOCAL_TTL=5, GC_CACHE_TTL=0.5)
+    def test_local_entries_never_outlive_shared_ones(self):
+        self.assertEqual(GoCardlessResourceCache._local_ttl(), 0.5)
+
+
+class SubscriptionVersionTests(TestCase):
+    """Two workers holding copies of the same row, read before either wrote"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='worker@example.com', password='x')
+        self.subscription = Subscription.objects.create(
+            user=self.user, status='active', is_active=True,
+            expires_at=timezone.now() + timedelta(days=30),
+        )
+
+    def _copies(self):
+        return (
+            Subscription.objects.get(pk=self.subscription.pk),
+            Subscription.objects.get(pk=self.subscription.pk),
+        )
+
+    def test_stale_save_conflicts(self):
+        first, second = self._copies()
+        first.mark_cancelled()
+
+        second.failed_payment_count = 1
+        with self.assertRaises(TransitionConflict), transaction.atomic():
+            second.save()
+
+        stored = Subscription.objects.get(pk=self.subscription.pk)
+        self.assertEqual(stored.status, 'cancelled')
+        self.assertEqual(stored.failed_payment_count, 0)
+        self.assertEqual(stored.version, 1)
+        self.assertEqual(second.version, 0)
+
+    def test_save_after_transition_conflicts(self):
+        first, second = self._copies()
+        SubscriptionStateMachine.transition(first, 'cancelled', is_active=False)
+
+        with self.assertRaises(TransitionConflict), transaction.atomic():
+            second.renew()
+
+        stored = Subscription.objects.get(pk=self.subscription.pk)
+        self.assertEqual(stored.status, 'cancelled')
+        self.assertFalse(stored.is_active)
+
+    def test_save_refreshed_copy(self):
+        first, second = self._copies()
+        first.mark_cancelled()
+
+        second.refresh_from_db()
+        second.temp_state = 'state'
+        second.save()
+
+        stored = Subscription.objects.get(pk=self.subscription.pk)
+        self.assertEqual(stored.status, 'cancelled')
+        self.assertEqual(stored.temp_state, 'state')
+        self.assertEqual(stored.version, 2)
+
+    def test_stale_transition_retries(self):
+        first, second = self._copies()
+        first.record_failed_payment()
+
+        seen = []
+
+        def decide(current):
+            seen.append(current.version)
+            return 'cancelled', {'is_active': False}
+
+        result = SubscriptionStateMachine.apply(second, decide)
+
+        self.assertEqual(seen, [0, 1])
+        self.assertEqual(result.version, 2)
+        stored = Subscription.objects.get(pk=self.subscription.pk)
+        self.assertEqual(stored.status, 'cancelled')
+        self.assertEqual(stored.failed_payment_count, 1)
+
+
+class SubscriptionStateMachineTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='machine@example.com', password='x')
+        UserProfile.objects.create(user=self.user)
+        self.subscription = Subscription.objects.create(user=self.user, status='pending')
+
+    def test_transition_syncs_flags(self):
+        SubscriptionStateMachine.transition(
+            self.subscription, 'active', is_active=True, expires_at=timezone.now() + timedelta(days=365)
+        )
+
+        stored = Subscription.objects.get(pk=self.subscription.pk)
+        self.assertEqual(stored.status, 'active')
+        self.assertIsNotNone(stored.started_at)
+        self.assertEqual(stored.version, 1)
+        self.assertTrue(User.objects.get(pk=self.user.pk).subscription_status)
+        self.assertTrue(UserProfile.objects.get(user=self.user).subscription_status)
+
+    def test_disallowed_transition_is_ignored(self):
+        SubscriptionStateMachine.transition(self.subscription, 'cancelled', is_active=False)
+
+        self.assertIsNone(SubscriptionStateMachine.transition(self.subscription, 'active', is_active=True))
+        self.assertEqual(Subscription.objects.get(pk=self.subscription.pk).status, 'cancelled')
+
+    def test_decision_is_remade_after_conflict(self):
+        stale = Subscription.objects.get(pk=self.subscription.pk)
+        SubscriptionStateMachine.transition(self.subscription, 'cancelled', is_active=False)
+
+        seen = []
+
+        def activate(current):
+            seen.append(current.status)
+            if current.status == 'cancelled':
+                return None
+            return 'active', {'is_active': True}
+
+        self.assertIsNone(SubscriptionStateMachine.apply(stale, activate))
+        self.assertEqual(seen, ['pending', 'cancelled'])
+        self.assertEqual(Subscription.objects.get(pk=self.subscription.pk).status, 'cancelled')
+
+    @override_settings(SUBSCRIPTION_TRANSITION_ATTEMPTS=3)
+    def test_conflict_after_every_attempt_lost(self):
+        decide = mock.Mock(return_value=('active', {'is_active': True}))
+
+        with mock.patch.object(SubscriptionStateMachine, '_swap', return_value=False):
+            with self.assertRaises(TransitionConflict):
+                SubscriptionStateMachine.apply(self.subscription, decide)
+
+        self.assertEqual(decide.call_count, 3)
+
+
+class BillingOperationStatusTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='checkout@example.com', password='x')
+        self.operation = BillingOperation.objects.create(
+            user=self.user, subscription=Subscription.objects.create(user=self.user),
+            kind='create_billing_request', status='succeeded', result={'flow_id': 'BRF1'},
+        )
+        self.client = APIClient()
+
+    def get(self, user=None):
+        if user is not None:
+            self.client.force_authenticate(user)
+        return self.client.get(reverse('billing-operation-status', args=[self.operation.id]))
+
+    def test_owner_reads_result(self):
+        response = self.get(self.user)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['result'], {'flow_id': 'BRF1'})
+
+    def test_other_users(self):
+        self.assertEqual(self.get().status_code, 401)
+        self.assertEqual(self.get(User.objects.create_user(email='other@example.com', password='x')).status_code, 404)
+
+
+class ActivateSubscriptionTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='activate@example.com', password='x')
+        UserProfile.objects.create(user=self.user)
+        self.subscription = Subscription.objects.create(user=self.user, status='pending')
+        self.operation = BillingOperation.objects.create(
+            user=self.user, subscription=self.subscription, kind='complete_mandate', result={'mandate_id': 'MD1'},
+        )
+
+    def activate(self, meanwhile=None):
+        def create(params, headers):
+            if meanwhile:
+                Subscription.objects.filter(id=self.subscription.id).update(version=F('version') + 1, **meanwhile)
+            return SimpleNamespace(id='SB1', upcoming_payments=[{'charge_date': '2027-01-01'}])
+
+        client = SimpleNamespace(subscriptions=SimpleNamespace(create=create))
+        with mock.patch('subscriptions.billing_orchestration.gocardless_client', client):
+            BillingOrchestrator.activate_subscription(self.operation)
+
+    def test_activates(self):
+        self.activate()
+
+        self.subscription.refresh_from_db()
+        self.assertEqual((self.subscription.status, self.subscription.subscription_id), ('active', 'SB1'))
+        self.assertEqual(self.operation.result['subscription_id'], 'SB1')
+        self.assertEqual(self.operation.result['next_charge_date'], '2027-01-01T00:00:00+00:00')
+
+    def test_activated_by_webhook_meanwhile(self):
+        self.activate(meanwhile={'status': 'active', 'is_active': True, 'subscription_id': 'SB1'})
+
+        self.assertEqual(self.operation.result['subscription_id'], 'SB1')
+
+    def test_cancelled_meanwhile(self):
+        with self.assertRaises(BillingStepFailed):
+            self.activate(meanwhile={'status': 'cancelled'})
+
+        self.assertNotIn('subscription_id', self.operation.result)
+
+    def test_conflict_retries_step(self):
+        self.assertTrue(is_transient(TransitionConflict('changed on every attempt')))
+
+
+class CancelSubscriptionTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='cancel@example.com', password='x')
+        UserProfile.objects.create(user=self.user)
+        self.subscription = Subscription.objects.create(
+            user=self.user, status='active', is_active=True, subscription_id='SB1',
+            expires_at=timezone.now() + timedelta(days=30),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def cancel(self, remote_cancel=None):
+        client = SimpleNamespace(subscriptions=SimpleNamespace(cancel=remote_cancel or mock.Mock()))
+        with mock.patch('subscriptions.views.gocardless_client', client):
+            return self.client.post('/api/subscriptions/cancel-subscription/')
+
+    def test_cancels(self):
+        response = self.cancel()
+
+        self.assertEqual(response.status_code, 200)
+        self.subscription.refresh_from_db()
+        self.assertEqual((self.subscription.status, self.subscription.is_active), ('cancelled', False))
+
+    def test_remote_failure(self):
+        response = self.cancel(mock.Mock(side_effect=RuntimeError('GoCardless unavailable')))
+
+        self.assertEqual(response.status_code, 400)
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.status, 'active')
+
+    def test_local_conflict_after_remote_cancel(self):
+        with mock.patch.object(SubscriptionStateMachine, '_swap', return_value=False):
+            response = self.cancel()
+
+        # Cancelled at GoCardless; the webhook brings the row up to date
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'cancelled')
+
+
+class FakePubSub:
+    """Redis pub/sub that confirms the pattern subscription once `confirm` is set"""
+
+    def __init__(self, confirm, messages):
+        self.confirm = confirm
+        self.messages = messages
+
+    def psubscribe(self, pattern):
+        self.pattern = pattern
+
+    def listen(self):
+        self.confirm.wait()
+        yield {'type': 'psubscribe', 'pattern': None, 'channel': self.pattern.encode(), 'data': 1}
+        for channel, data in self.messages:
+            yield {'type': 'pmessage', 'pattern': self.pattern.encode(), 'channel': channel, 'data': data}
+
+
+class SubscriptionStatusBrokerTests(SimpleTestCase):
+
+    def test_subscribe_waits_for_listener(self):
+        confirm = threading.Event()
+        pubsub = FakePubSub(confirm, [(b'subscription-status:7', b'{"status": "active", "is_active": true}')])
+        broker = SubscriptionStatusBroker()
+
+        async def subscribe():
+            threading.Timer(0.1, confirm.set).start()
+            _, queue = broker.subscribe(7)
+            subscribed_after_confirm = confirm.is_set()
+            return subscribed_after_confirm, await asyncio.wait_for(queue.get(), timeout=1)
+
+        with mock.patch.object(broker, '_get_redis', return_value=SimpleNamespace(pubsub=lambda: pubsub)):
+            subscribed_after_confirm, message = asyncio.run(subscribe())
+
+        self.assertTrue(subscribed_after_confirm)
+        self.assertEqual(message, {'status': 'active', 'is_active': True})
@@ -5,8 +5,10 @@ from .views import *
 urlpatterns = [
     path('create-mandate/', CreateBillingRequest.as_view()),
     path('complete-mandate/', CompleteMandate.as_view()),  # NEW: POST for token completion
+    path('billing-operations/<uuid:operation_id>/', BillingOperationStatus.as_view(), name='billing-operation-status'),  # Checkout step status handle
     path('cancel-mandate/', CancelMandate.as_view()),
     path('mandate-status/', MandateStatus.as_view()),  # Polling endpoint
+    path('mandate-status/stream/', MandateStatusStream.as_view()),  # SSE push endpoint (ASGI)
     path('cancel-subscription/', CancelSubscription.as_view()),
     path('gocardless-complete/', RedirectComplete.as_view()),
     path('webhook/', WebhookHandler.as_view())
@@ -1,18 +1,19 @@
 # subscriptions/views.py
 import logging
-import gocardless_pro as client
-import gocardless_pro
-from gocardless_pro import webhooks
-from gocardless_pro.errors import InvalidSignatureError
 from decimal import Decimal
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.generic import View
 from django.utils import timezone
+from django.db import transaction
 from django.shortcuts import redirect
+from django.urls import reverse
 from datetime import timedelta, datetime
+from asgiref.sync import sync_to_async
+import asyncio
+import json
 import secrets
 
 from rest_framework import status
@@ -21,12 +22,21 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.authentication import SessionAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
 
 from drf_spectacular.utils import extend_schema
 
 from accounts.models import User
-from .models import Subscription
+from user_profile.models import UserProfile
+from .models import BillingOperation, Subscription, TransitionConflict
 from .serializers import *
+from .webhook_service import WebhookInboxService
+from .billing_orchestration import BillingOrchestrator
+from .state_machine import SubscriptionStateMachine
+from .entitlements import EntitlementService
+from .status_events import broker
 from Helyar1_Backend.clients import gocardless_client
 
 logger = logging.getLogger(__name__)
@@ -34,11 +44,7 @@ logger = logging.getLogger(__name__)
 
 def has_active_subscription(user):
     """Helper to check if user has a real active sub (not pending)"""
-    try:
-        subscription = Subscription.objects.get(user=user)
-        return subscription.is_valid() and subscription.is_active and subscription.status != 'pending'
-    except Subscription.DoesNotExist:
-        return False
+    return EntitlementService.has_active_subscription(user.id)
 
 
 class CreateBillingRequest(APIView):
@@ -47,6 +53,7 @@ class CreateBillingRequest(APIView):
     @extend_schema(
         responses={
             200: CreateMandateResponseSerializer,
+            202: BillingOperationSerializer,
             400: ErrorResponseSerializer
         }
     )
@@ -84,83 +91,22 @@ class CreateBillingRequest(APIView):
         
         # Generate state for CSRF (stored in DB, frontend must pass back on complete)
         state = secrets.token_urlsafe(32)
-        subscription.temp_state = state
-        subscription.status = 'pending'
-        subscription.save()
+        SubscriptionStateMachine.transition(subscription, 'pending', temp_state=state)
         
-        # Billing params
-        billing_params = {
-            'payment_request': {
-                'amount': int(subscription.price * 100),
-                'currency': 'GBP',
-                'description': '1 Year access fee',
-            },
-            'mandate_request': {
-                'scheme': 'bacs',
-                'currency': 'GBP',
-                'metadata': {
-                    'user_id': str(user.id),
-                    'plan': 'yearly subscription'
-                },
-                'verify': 'recommended'
-            },
-            'metadata': {
-                'user_id': str(user.id),
-                'subscription_id': str(subscription.id)
-            }
-        }
-        
-        try:
-            # Create billing request
-            logger.info(f"Creating GoCardless billing request for user {user.email}")
-            billing_request = gocardless_client.billing_requests.create(billing_params)
-            billing_request_id = billing_request.id
-            logger.info(f"Billing request created: {billing_request_id}")
-            
-            # FIXED: Use proper redirect_uri for GoCardless callback
-            # GoCardless will append ?redirect_flow_id=XXX to this URL
-            billing_flow_params = {
-                'redirect_uri': 'https://lelia-leafed-lashandra.ngrok-free.dev/api/subscriptions/gocardless-complete/',
-                'exit_uri': 'https://lelia-leafed-lashandra.ngrok-free.dev/?error=user_cancelled',
-                'links': {
-                    'billing_request': billing_request_id
-                },
-                'prefilled_customer': {
-                    'email': user.email,
-                    'given_name': user.profile.first_name,
-                    'family_name': user.profile.last_name,
-                }
-            }
-            
-            logger.info(f"Creating billing flow for user {user.email}")
-            billing_flow = gocardless_client.billing_request_flows.create(billing_flow_params)
-            logger.info(f"Billing flow created: {billing_flow.id}")
-            
-            # Store in database for webhook processing
-            subscription.temp_flow_id = billing_flow.id
-            subscription.temp_billing_request_id = billing_request_id
-            subscription.save()
-            logger.info(f"Stored flow_id and billing_request_id in database for user {user.email}")
-            
-            return Response({
-                'status': 'started',
-                'billing_request_id': billing_request_id,
-                'authorisation_url': billing_flow.authorisation_url,
-                'state': state
-            }, status=status.HTTP_200_OK)
-        
-        except Exception as e:
-            logger.error(f"Billing request creation failed for user {user.email}: {str(e)}", exc_info=True)
-            return Response(
-                {'error': str(e)},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        operation = BillingOperation.objects.create(
+            user=user,
+            subscription=subscription,
+            kind='create_billing_request',
+            result={'state': state},
+        )
+        return billing_operation_response(request, operation)
 
 
 class CompleteMandate(APIView):
     """
-    FIXED: This endpoint should be called programmatically after RedirectComplete
-    extracts the redirect_flow_id from GoCardless callback
+    Called by the frontend after the GoCardless billing request flow redirects
+    back. Activation is queued as a BillingOperation; the billing_requests
+    webhook completes the same setup if this is never called.
     """
     permission_classes = [AllowAny]
     
@@ -168,6 +114,7 @@ class CompleteMandate(APIView):
         request=CompleteMandateSerializer,
         responses={
             200: CompleteMandateSerializer,
+            202: BillingOperationSerializer,
             400: ErrorResponseSerializer
         }
     )
@@ -179,100 +126,71 @@ class CompleteMandate(APIView):
             logger.error("Missing flow_id in request")
             return Response({'error': 'Missing flow_id'}, status=status.HTTP_400_BAD_REQUEST)
         
-        try:
-            # FIXED: Complete the billing request flow (not billing_request_flows)
-            logger.info(f"Completing billing flow: {flow_id}")
-            complete_response = gocardless_client.billing_request_flows.complete(flow_id)
-            
-            # The response contains the billing_request in links
-            billing_request_id = complete_response.links.billing_request
-            
-            # Now fetch the full billing request
-            billing_request = gocardless_client.billing_requests.get(billing_request_id)
-            logger.info(f"Billing request status: {billing_request.status}")
-            
-            if billing_request.status != 'fulfilled':
-                return Response({
-                    'error': 'Billing request not fulfilled',
-                    'details': billing_request.status
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Extract details
-            mandate_id = billing_request.links.mandate_request_mandate
-            customer_id = billing_request.links.customer
-            payment_id = getattr(billing_request.links, 'payment', None)
-            
-            # Find subscription
-            try:
-                subscription = Subscription.objects.get(temp_billing_request_id=billing_request_id)
-                user = subscription.user
-                
-                # Optional CSRF validation
-                if state and subscription.temp_state != state:
-                    logger.warning(f"State mismatch for user {user.email}")
-                    return Response({'error': 'Invalid state (CSRF mismatch)'}, status=status.HTTP_400_BAD_REQUEST)
-                
-            except Subscription.DoesNotExist:
-                logger.error(f"No subscription found for billing_request_id: {billing_request_id}")
-                return Response({'error': 'Subscription not found'}, status=status.HTTP_404_NOT_FOUND)
-            
-            # Update profile
-            user.profile.mandate_id = mandate_id
-            user.profile.customer_id = customer_id
-            user.profile.save()
-            logger.info(f"Updated profile for user {user.email}: mandate={mandate_id}, customer={customer_id}")
-            
-            # Create subscription on GoCardless
-            sub_params = {
-                'amount': int(subscription.price * 100),
-                'currency': 'GBP',
-                'interval_unit': 'yearly',
-                'name': 'Helyar1 Yearly Subscription',
-                'links': {'mandate': mandate_id},
-                'metadata': {'user_id': str(user.id)},
-            }
-            
-            sub_response = gocardless_client.subscriptions.create(params=sub_params)
-            logger.info(f"GoCardless subscription created: {sub_response.id}")
-            
-            # Update local DB
-            subscription.subscription_id = sub_response.id
-            subscription.status = 'active'
-            subscription.is_active = True
-            subscription.started_at = timezone.now()
-            subscription.temp_flow_id = None
-            subscription.temp_billing_request_id = None
-            subscription.temp_state = None
-            
-            # Set expiry date
-            if hasattr(sub_response, 'upcoming_payments') and sub_response.upcoming_payments:
-                subscription.expires_at = datetime.fromisoformat(sub_response.upcoming_payments[0]['charge_date'].replace('Z', '+00:00'))
-            else:
-                subscription.expires_at = timezone.now() + timedelta(days=365)
-            
-            subscription.save()
-            
-            # Sync user flags
-            user.subscription_status = True
-            user.save()
-            user.profile.subscription_status = True
-            user.profile.save()
-            
-            logger.info(f"SUCCESS: Subscription activated for user {user.email}")
-            
-            return Response({
-                'status': 'completed',
-                'mandate_id': mandate_id,
-                'customer_id': customer_id,
-                'payment_id': payment_id,
-                'subscription_id': sub_response.id,
-                'next_charge_date': subscription.expires_at.isoformat() if subscription.expires_at else None,
-                'message': 'Direct debit setup and subscription activated successfully!'
-            }, status=status.HTTP_200_OK)
+        # The flow and its billing request were stored when the flow was created
+        subscription = Subscription.objects.select_related('user').filter(temp_flow_id=flow_id).first()
+        if subscription is None or not subscription.temp_billing_request_id:
+            logger.error(f"No subscription found for flow_id: {flow_id}")
+            return Response({'error': 'Subscription not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        except Exception as e:
-            logger.error(f"Complete mandate failed: {str(e)}", exc_info=True)
-            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        # Optional CSRF validation
+        if state and subscription.temp_state != state:
+            logger.warning(f"State mismatch for user {subscription.user.email}")
+            return Response({'error': 'Invalid state (CSRF mismatch)'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        operation = BillingOperation.objects.create(
+            user=subscription.user,
+            subscription=subscription,
+            kind='complete_mandate',
+            result={'flow_id': flow_id, 'billing_request_id': subscription.temp_billing_request_id},
+        )
+        return billing_operation_response(request, operation)
+
+
+def billing_operation_response(request, operation):
+    """
+    Start an operation's GoCardless steps once it has committed. Returns 202 with
+    its status handle, or with BILLING_ORCHESTRATION_ASYNC off, the steps' result.
+    """
+    if settings.BILLING_ORCHESTRATION_ASYNC:
+        transaction.on_commit(lambda: BillingOrchestrator.start(operation))
+        return Response({
+            'status': operation.status,
+            'operation_id': str(operation.id),
+            'status_url': request.build_absolute_uri(
+                reverse('billing-operation-status', args=[operation.id])
+            ),
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    BillingOrchestrator.start(operation)
+    if operation.status != 'succeeded':
+        return Response({'error': operation.error or 'Billing operation failed'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(operation.result, status=status.HTTP_200_OK)
+
+
+class BillingOperationStatus(APIView):
+    """
+    Poll a checkout step started by CreateBillingRequest or CompleteMandate.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    @extend_schema(
+        responses={
+            200: BillingOperationSerializer,
+            404: ErrorResponseSerializer
+        }
+    )
+    def get(self, request, operation_id):
+        operation = BillingOperation.objects.filter(id=operation_id, user=request.user).first()
+        if operation is None:
+            return Response({'error': 'Operation not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response({
+            'status': operation.status,
+            'operation_id': str(operation.id),
+            'kind': operation.kind,
+            'result': operation.result if operation.status == 'succeeded' else None,
+            'error': operation.error,
+        }, status=status.HTTP_200_OK)
 
 
 class CancelMandate(APIView):
@@ -295,10 +213,8 @@ class CancelMandate(APIView):
             # Cancel the mandate
             mandate = gocardless_client.mandates.cancel(mandate_id)
             
-            # Clear from profile
-            user.profile.mandate_id = None
-            user.profile.customer_id = None
-            user.profile.save()
+            # Clear from profile; a targeted UPDATE so a stale profile copy can't overwrite the flags
+            UserProfile.objects.filter(user_id=user.id).update(mandate_id=None, customer_id=None)
             
             logger.info(f"Mandate cancelled successfully for user {user.email}")
             
@@ -315,6 +231,57 @@ class CancelMandate(APIView):
             )
 
 
+def mandate_status_payload(user):
+    """
+    Current subscription setup status for a user, as (data, http_status).
+    Shared by the MandateStatus poll and the MandateStatusStream push endpoint.
+    """
+    # Served from the entitlement cache; invalidated when the subscription changes
+    subscription = EntitlementService.get(user.id)
+    if subscription.exists:
+        # Check if completed
+        if subscription.status == 'active' and subscription.is_active and subscription.subscription_id:
+            logger.info(f"Subscription active for user {user.email}")
+            return {
+                'status': 'completed',
+                'subscription_id': subscription.subscription_id,
+                'mandate_id': user.profile.mandate_id if hasattr(user, 'profile') else None,
+                'expires_at': subscription.expires_at.isoformat() if subscription.expires_at else None,
+                'message': 'Subscription is active!'
+            }, status.HTTP_200_OK
+        
+        # Check if still pending but not timed out
+        elif subscription.status == 'pending':
+            age = timezone.now() - subscription.created_at
+            if age > timedelta(minutes=10):
+                logger.warning(f"Subscription setup timed out for user {user.email}")
+                return {
+                    'status': 'timeout',
+                    'message': 'Setup timed out. Please try again.'
+                }, status.HTTP_408_REQUEST_TIMEOUT
+            else:
+                logger.info(f"Subscription still processing for user {user.email}")
+                return {
+                    'status': 'processing',
+                    'message': 'Setting up your subscription... Please wait.'
+                }, status.HTTP_200_OK
+        
+        # Something went wrong
+        else:
+            logger.warning(f"Subscription in unexpected state for user {user.email}: {subscription.status}")
+            return {
+                'status': subscription.status,
+                'message': f'Subscription status: {subscription.status}'
+            }, status.HTTP_200_OK
+            
+    else:
+        logger.info(f"No subscription found for user {user.email}")
+        return {
+            'status': 'not_found',
+            'message': 'No subscription found. Please start the subscription process.'
+        }, status.HTTP_404_NOT_FOUND
+
+
 class MandateStatus(APIView):
     """
     Status check endpoint - called after GoCardless redirect for polling.
@@ -329,52 +296,71 @@ class MandateStatus(APIView):
         }
     )
     def get(self, request):
-        user = request.user
+        data, http_status = mandate_status_payload(request.user)
+        return Response(data, status=http_status)
+
+
+class MandateStatusStream(View):
+    """
+    Push version of MandateStatus as server-sent events (needs the ASGI app).
+    The connection is parked until the user's subscription changes, instead of
+    the frontend polling every few seconds; it sends the current status first,
+    then again after each change, and closes once setup is no longer processing.
+    
+    EventSource can't set headers, so the access token may be passed as ?token=.
+    """
+    KEEPALIVE_INTERVAL = 15
+    
+    async def get(self, request):
+        user = await sync_to_async(self._authenticate)(request)
+        if user is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided or are invalid.'}, status=401)
         
+        response = StreamingHttpResponse(self._stream(user), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+        return response
+    
+    def _authenticate(self, request):
+        authentication = JWTAuthentication()
         try:
-            subscription = Subscription.objects.get(user=user)
-            
-            # Check if completed
-            if subscription.status == 'active' and subscription.is_active and subscription.subscription_id:
-                logger.info(f"Subscription active for user {user.email}")
-                return Response({
-                    'status': 'completed',
-                    'subscription_id': subscription.subscription_id,
-                    'mandate_id': user.profile.mandate_id if hasattr(user, 'profile') else None,
-                    'expires_at': subscription.expires_at.isoformat() if subscription.expires_at else None,
-                    'message': 'Subscription is active!'
-                }, status=status.HTTP_200_OK)
-            
-            # Check if still pending but not timed out
-            elif subscription.status == 'pending':
-                age = timezone.now() - subscription.created_at
-                if age > timedelta(minutes=10):
-                    logger.warning(f"Subscription setup timed out for user {user.email}")
-                    return Response({
-                        'status': 'timeout',
-                        'message': 'Setup timed out. Please try again.'
-                    }, status=status.HTTP_408_REQUEST_TIMEOUT)
-                else:
-                    logger.info(f"Subscription still processing for user {user.email}")
-                    return Response({
-                        'status': 'processing',
-                        'message': 'Setting up your subscription... Please wait.'
-                    }, status=status.HTTP_200_OK)
-            
-            # Something went wrong
-            else:
-                logger.warning(f"Subscription in unexpected state for user {user.email}: {subscription.status}")
-                return Response({
-                    'status': subscription.status,
-                    'message': f'Subscription status: {subscription.status}'
-                }, status=status.HTTP_200_OK)
+            raw_token = request.GET.get('token')
+            if raw_token:
+                return authentication.get_user(authentication.get_validated_token(raw_token))
+            result = authentication.authenticate(request)
+            return result[0] if result else None
+        except (InvalidToken, AuthenticationFailed):
+            return None
+    
+    async def _stream(self, user):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.MANDATE_STATUS_STREAM_TIMEOUT
+        # Subscribe before reading the status so a change in between isn't missed
+        entry = broker.subscribe(user.id)
+        _, queue = entry
+        
+        try:
+            while True:
+                data, _ = await sync_to_async(mandate_status_payload)(user)
+                yield f"event: status\ndata: {json.dumps(data)}\n\n"
+                if data['status'] != 'processing' or loop.time() >= deadline:
+                    return
                 
-        except Subscription.DoesNotExist:
-            logger.info(f"No subscription found for user {user.email}")
-            return Response({
-                'status': 'not_found',
-                'message': 'No subscription found. Please start the subscription process.'
-            }, status=status.HTTP_404_NOT_FOUND)
+                # Park until the webhook worker publishes a change, with keep-alive comments
+                while True:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        await asyncio.wait_for(queue.get(), timeout=min(self.KEEPALIVE_INTERVAL, remaining))
+                        break
+                    except asyncio.TimeoutError:
+                        yield ": keep-alive\n\n"
+                
+                # The change was made in another process; don't trust this process's cached copy
+                await sync_to_async(EntitlementService.invalidate)(user.id)
+        finally:
+            broker.unsubscribe(user.id, entry)
 
 
 class CancelSubscription(APIView):
@@ -410,31 +396,31 @@ class CancelSubscription(APIView):
                     subscription.subscription_id,
                     params=cancel_params
                 )
-                
-                # Update local
-                subscription.is_active = False
-                subscription.status = 'cancelled'
-                subscription.save()
-                
-                # Sync flags
-                user.subscription_status = False
-                user.save()
-                user.profile.subscription_status = False
-                user.profile.save()
-                
-                logger.info(f"Cancelled subscription for user {user.email}")
-                
-                return Response({
-                    'status': 'cancelled',
-                    'details': 'Subscription cancelled successfully. It will remain active until the end of the current period.'
-                }, status=status.HTTP_200_OK)
-                
             except Exception as e:
                 logger.error(f"GoCardless cancellation failed: {str(e)}", exc_info=True)
                 return Response(
                     {'error': 'Failed to cancel subscription', 'details': str(e)},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            
+            # Cancelled at GoCardless, so the request has succeeded whatever happens locally;
+            # the subscriptions.cancelled webhook applies the same transition
+            try:
+                # Also clears the user/profile flags and revokes subscriber claims
+                cancelled = SubscriptionStateMachine.transition(subscription, 'cancelled', is_active=False)
+            except TransitionConflict as e:
+                logger.warning(f"Could not mark subscription {subscription.id} cancelled: {str(e)}")
+                cancelled = None
+            
+            if cancelled is None:
+                logger.warning(f"Leaving subscription {subscription.id} for the cancellation webhook")
+            else:
+                logger.info(f"Cancelled subscription for user {user.email}")
+            
+            return Response({
+                'status': 'cancelled',
+                'details': 'Subscription cancelled successfully. It will remain active until the end of the current period.'
+            }, status=status.HTTP_200_OK)
                 
         except Subscription.DoesNotExist:
             logger.error(f"No subscription found for user {user.email}")
@@ -445,12 +431,19 @@ class CancelSubscription(APIView):
 
 
 class WebhookHandler(View):
-    """FIXED: Improved webhook handling"""
+    """
+    Verifies GoCardless webhooks, records the events in the inbox and acknowledges.
+    Events are applied by Celery workers (see subscriptions.webhook_service), so
+    response time does not depend on GoCardless API latency.
+    """
     @method_decorator(csrf_exempt)
     def dispatch(self, request, *args, **kwargs):
         return super().dispatch(request, *args, **kwargs)
     
     def post(self, request):
+        from gocardless_pro import webhooks
+        from gocardless_pro.errors import InvalidSignatureError
+
         try:
             # FIXED: Get signature from correct header
             signature = request.headers.get('Webhook-Signature')
@@ -466,190 +459,24 @@ class WebhookHandler(View):
                 settings.GC_WEBHOOK_SECRET,  # webhook secret
                 signature  # signature header
             )
-            
-            # Track processed events to avoid duplicates
-            if not hasattr(self, 'processed_events'):
-                self.processed_events = set()
-            
-            for event in events:
-                if event.id in self.processed_events:
-                    logger.info(f"Event {event.id} already processed, skipping")
-                    continue
-                
-                logger.info(f"Processing webhook event: {event.id}, type: {event.resource_type}, action: {event.action}")
-                self.processed_events.add(event.id)
-                
-                # Handle billing_request fulfilled
-                if event.resource_type == 'billing_requests' and event.action == 'fulfilled':
-                    self._handle_billing_fulfilled(event)
-                
-                # Handle payment events
-                elif event.resource_type == 'payments':
-                    self._handle_payment(event)
-                
-                # Handle mandate events
-                elif event.resource_type == 'mandates':
-                    self._handle_mandate(event)
-                
-                # Handle subscription events
-                elif event.resource_type == 'subscriptions':
-                    self._handle_subscription(event)
-            
-            return HttpResponse(status=200)
-            
         except InvalidSignatureError as e:
             logger.error(f"Invalid webhook signature: {str(e)}")
             return HttpResponse(status=498)
         except Exception as e:
             logger.error(f"Webhook error: {str(e)}", exc_info=True)
-            return HttpResponse(status=200)  # Return 200 to prevent retries
-    
-    def _handle_billing_fulfilled(self, event):
-        """Handle billing request fulfilled events"""
-        try:
-            billing_request_id = event.links.billing_request
-            logger.info(f"Billing request fulfilled: {billing_request_id}")
-            
-            subscription = Subscription.objects.get(temp_billing_request_id=billing_request_id)
-            user = subscription.user
-            
-            # Fetch billing request details
-            billing_request = gocardless_client.billing_requests.get(billing_request_id)
-            
-            if billing_request.status == 'fulfilled':
-                mandate_id = billing_request.links.mandate_request_mandate
-                customer_id = billing_request.links.customer
-                
-                # Update profile
-                user.profile.mandate_id = mandate_id
-                user.profile.customer_id = customer_id
-                user.profile.save()
-                logger.info(f"Updated profile with mandate: {mandate_id}, customer: {customer_id}")
-                
-                # Create GoCardless subscription
-                sub_params = {
-                    'amount': int(subscription.price * 100),
-                    'currency': 'GBP',
-                    'interval_unit': 'yearly',
-                    'name': 'Helyar1 Yearly Subscription',
-                    'links': {'mandate': mandate_id},
-                    'metadata': {'user_id': str(user.id)},
-                }
-                
-                sub_response = gocardless_client.subscriptions.create(params=sub_params)
-                logger.info(f"Created GoCardless subscription: {sub_response.id}")
-                
-                # Update local subscription
-                subscription.subscription_id = sub_response.id
-                subscription.status = 'active'
-                subscription.is_active = True
-                subscription.started_at = timezone.now()
-                
-                # Set expiry date
-                if hasattr(sub_response, 'upcoming_payments') and sub_response.upcoming_payments:
-                    from datetime import datetime
-                    subscription.expires_at = datetime.fromisoformat(
-                        sub_response.upcoming_payments[0]['charge_date'].replace('Z', '+00:00')
-                    )
-                else:
-                    subscription.expires_at = timezone.now() + timedelta(days=365)
-                
-                # Clear temp fields
-                subscription.temp_billing_request_id = None
-                subscription.temp_flow_id = None
-                subscription.temp_state = None
-                subscription.save()
-                
-                # Sync user flags
-                user.subscription_status = True
-                user.save()
-                user.profile.subscription_status = True
-                user.profile.save()
-                
-                logger.info(f"SUCCESS: Webhook set mandate: {mandate_id}, customer: {customer_id}, subscription: {sub_response.id} for user {user.email}")
-            else:
-                logger.warning(f"Billing request {billing_request_id} not fulfilled: {billing_request.status}")
+            return HttpResponse(status=200)  # Unparseable body, retrying won't help
         
-        except Subscription.DoesNotExist:
-            logger.error(f"No subscription found for billing_request_id: {event.links.billing_request}")
-        except Exception as e:
-            logger.error(f"Error processing billing fulfilled: {str(e)}", exc_info=True)
-    
-    def _handle_payment(self, event):
-        """Handle payment events"""
         try:
-            sub_id = getattr(event.links, 'subscription', None)
-            if not sub_id:
-                return
-            
-            subscription = Subscription.objects.get(subscription_id=sub_id)
-            user = subscription.user
-            
-            if event.action == 'confirmed' or event.action == 'paid_out':
-                subscription.status = 'active'
-                subscription.is_active = True
-                
-                # Fetch subscription to get next charge date
-                gc_sub = gocardless_client.subscriptions.get(sub_id)
-                if hasattr(gc_sub, 'upcoming_payments') and gc_sub.upcoming_payments:
-                    subscription.expires_at = datetime.fromisoformat(
-                        gc_sub.upcoming_payments[0]['charge_date'].replace('Z', '+00:00')
-                    )
-                else:
-                    subscription.expires_at = timezone.now() + timedelta(days=365)
-                
-                subscription.save()
-                
-                # Sync user flags
-                user.subscription_status = True
-                user.save()
-                user.profile.subscription_status = True
-                user.profile.save()
-                
-                logger.info(f"Payment confirmed - activated subscription for {user.email}")
-                
-            elif event.action == 'failed':
-                subscription.is_active = False
-                subscription.status = 'inactive'
-                subscription.save()
-                
-                user.subscription_status = False
-                user.save()
-                user.profile.subscription_status = False
-                user.profile.save()
-                
-                logger.warning(f"Payment failed - deactivated subscription for {user.email}")
-                
-        except Subscription.DoesNotExist:
-            logger.error(f"Subscription not found for sub_id: {sub_id}")
+            with transaction.atomic():
+                rows = WebhookInboxService.record(events)
+                WebhookInboxService.enqueue(row.partition for row in rows)
         except Exception as e:
-            logger.error(f"Error handling payment: {str(e)}", exc_info=True)
-    
-    def _handle_mandate(self, event):
-        """Handle mandate events"""
-        if event.action in ['cancelled', 'failed', 'expired']:
-            try:
-                mandate_id = event.links.mandate
-                # Find user by mandate_id
-                profile = User.objects.get(profile__mandate_id=mandate_id).profile
-                logger.warning(f"Mandate {mandate_id} {event.action} for user {profile.user.email}")
-            except User.DoesNotExist:
-                logger.error(f"No user found for mandate: {mandate_id}")
-    
-    def _handle_subscription(self, event):
-        """Handle subscription events"""
-        try:
-            sub_id = event.links.subscription
-            subscription = Subscription.objects.get(subscription_id=sub_id)
-            
-            if event.action == 'cancelled':
-                subscription.is_active = False
-                subscription.status = 'cancelled'
-                subscription.save()
-                logger.info(f"Subscription {sub_id} cancelled via webhook")
-                
-        except Subscription.DoesNotExist:
-            logger.error(f"Subscription not found: {sub_id}")
+            # Nothing was stored, let GoCardless retry the delivery
+            logger.error(f"Failed to record webhook events: {str(e)}", exc_info=True)
+            return HttpResponse(status=500)
+        
+        logger.info(f"Recorded {len(rows)} webhook events")
+        return HttpResponse(status=200)
 
 
 class RedirectComplete(APIView):
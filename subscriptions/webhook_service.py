@@ -0,0 +1,560 @@
+# subscriptions/webhook_service.py
+from datetime import timedelta, datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from accounts.models import User
+from user_profile.models import UserProfile
+from Helyar1_Backend.clients import gocardless_client, idempotency_headers
+from Helyar1_Backend.resource_cache import gocardless_cache
+from .models import Subscription, WebhookCursor, WebhookEvent, WebhookEventKey
+from .state_machine import SubscriptionStateMachine
+
+import secrets
+import zlib
+import logging
+logger = logging.getLogger(__name__)
+
+
+class WebhookIdempotencyStore:
+    """
+    Cross-process record of webhook event IDs that have been accepted.
+    Keys live in a unique-keyed table so the check shares the inbox transaction:
+    if storing the events fails, the claim rolls back with it.
+    """
+
+    @staticmethod
+    def claim_new(event_ids):
+        """
+        Claim a batch of event IDs and return the set that had not been seen before.
+        One insert plus one select, whatever the batch size; concurrent deliveries of
+        the same event can't both win because only the inserted rows carry our token.
+        """
+        event_ids = set(event_ids)
+        if not event_ids:
+            return set()
+
+        token = secrets.token_hex(16)
+        WebhookEventKey.objects.bulk_create(
+            [WebhookEventKey(event_id=event_id, claim_token=token) for event_id in event_ids],
+            ignore_conflicts=True,
+        )
+        return set(
+            WebhookEventKey.objects.filter(event_id__in=event_ids, claim_token=token)
+            .values_list('event_id', flat=True)
+        )
+
+
+    @staticmethod
+    def prune():
+        """Forget keys, and processed inbox rows, older than WEBHOOK_IDEMPOTENCY_TTL_DAYS"""
+        cutoff = timezone.now() - timedelta(days=settings.WEBHOOK_IDEMPOTENCY_TTL_DAYS)
+        keys, _ = WebhookEventKey.objects.filter(created_at__lt=cutoff).delete()
+        events, _ = WebhookEvent.objects.filter(status='processed', processed_at__lt=cutoff).delete()
+        return keys, events
+
+
+class WebhookInboxService:
+    """
+    Durable inbox for GoCardless webhook events.
+    The webhook view records a verified batch with one bulk insert and returns;
+    Celery workers claim and apply the stored events.
+
+    Events are hash-partitioned by the mandate they concern, so a customer's
+    billing request, mandate, payment and subscription events share one ordering
+    key, and each partition is drained by its own queue (webhooks.<n>). Run one
+    single-process consumer per queue, e.g.
+
+        celery -A Helyar1_Backend worker -Q webhooks.0,webhooks.1 --concurrency=1
+
+    Events for one subscription then apply in order, while different partitions
+    are processed concurrently across workers.
+    """
+
+    @staticmethod
+    def ordering_keys(events):
+        """
+        Map event ID -> the mandate its events must apply in order with.
+        Events that don't link the mandate (e.g. subscriptions.*) are mapped to
+        it through the local subscription, with one query per link type; events
+        we can't map fall back to their own subscription or billing request.
+        """
+        links = {event.id: event.attributes.get('links') or {} for event in events}
+        unmapped = [
+            event_links for event_links in links.values()
+            if not (event_links.get('mandate') or event_links.get('mandate_request_mandate'))
+        ]
+
+        mandates = {}
+        subscription_ids = {event_links['subscription'] for event_links in unmapped if event_links.get('subscription')}
+        if subscription_ids:
+            mandates.update(
+                Subscription.objects.filter(subscription_id__in=subscription_ids)
+                .exclude(user__profile__mandate_id=None)
+                .values_list('subscription_id', 'user__profile__mandate_id')
+            )
+        billing_request_ids = {event_links['billing_request'] for event_links in unmapped if event_links.get('billing_request')}
+        if billing_request_ids:
+            mandates.update(
+                Subscription.objects.filter(temp_billing_request_id__in=billing_request_ids)
+                .exclude(user__profile__mandate_id=None)
+                .values_list('temp_billing_request_id', 'user__profile__mandate_id')
+            )
+
+        return {
+            event_id: (
+                event_links.get('mandate')
+                or event_links.get('mandate_request_mandate')
+                or mandates.get(event_links.get('subscription'))
+                or mandates.get(event_links.get('billing_request'))
+                or event_links.get('subscription')
+                or event_links.get('billing_request')
+                or event_id
+            )
+            for event_id, event_links in links.items()
+        }
+
+
+    @staticmethod
+    def partition_for(key):
+        return zlib.crc32(key.encode('utf-8')) % settings.WEBHOOK_PARTITIONS
+
+
+    @staticmethod
+    def record(events):
+        """
+        Store the events of a verified batch that haven't been accepted before.
+        Must run inside a transaction; returns the new inbox rows.
+        """
+        new_ids = WebhookIdempotencyStore.claim_new(event.id for event in events)
+        duplicates = len(events) - len(new_ids)
+        if duplicates:
+            logger.info(f"Skipping {duplicates} already received webhook events")
+
+        # The resources changed; drop cached copies once for the whole batch, so
+        # the reads made while applying it (in any process) see the change
+        gocardless_cache.invalidate_links(*[event.attributes.get('links') for event in events])
+
+        keys = WebhookInboxService.ordering_keys([event for event in events if event.id in new_ids])
+        rows = []
+        for event in events:
+            if event.id not in new_ids:
+                continue
+            new_ids.discard(event.id)  # Once per batch too
+            key = keys[event.id]
+            rows.append(WebhookEvent(
+                event_id=event.id,
+                resource_type=event.resource_type or '',
+                action=event.action or '',
+                payload=event.attributes,
+                occurred_at=parse_datetime(event.created_at) if event.created_at else None,
+                ordering_key=key,
+                partition=WebhookInboxService.partition_for(key),
+            ))
+        return WebhookEvent.objects.bulk_create(rows)
+
+
+    @staticmethod
+    def enqueue(partitions):
+        """Wake the consumers of the given partitions once the inbox insert has committed"""
+        from .task import process_webhook_partition
+
+        partitions = sorted(set(partitions))
+
+        def send():
+            for partition in partitions:
+                try:
+                    # Wait out the coalescing window so a burst is drained, and merged, together
+                    process_webhook_partition.apply_async(
+                        args=[partition],
+                        queue=f"{settings.WEBHOOK_QUEUE_PREFIX}.{partition}",
+                        countdown=settings.WEBHOOK_COALESCE_WINDOW,
+                    )
+                except Exception as e:
+                    # Events stay pending in the inbox; retry_webhook_events picks them up
+                    logger.error(f"Failed to enqueue webhook partition {partition}: {str(e)}")
+
+        transaction.on_commit(send)
+
+
+    @staticmethod
+    def claim(partition):
+        """
+        Mark the next pending events of a partition as processing and return them in order.
+        Events queued behind a failed event for the same resource wait for its retry.
+        """
+        blocked = WebhookEvent.objects.filter(
+            partition=partition,
+            ordering_key=OuterRef('ordering_key'),
+            status='failed',
+            attempts__lt=settings.WEBHOOK_MAX_ATTEMPTS,
+        )
+        with transaction.atomic():
+            rows = list(
+                WebhookEvent.objects.select_for_update(skip_locked=True)
+                .filter(partition=partition, status='pending')
+                .exclude(Exists(blocked))
+                .order_by('occurred_at', 'id')[:settings.WEBHOOK_BATCH_SIZE]
+            )
+            WebhookEvent.objects.filter(id__in=[row.id for row in rows]).update(
+                status='processing', attempts=F('attempts') + 1, claimed_at=timezone.now()
+            )
+        return rows
+
+
+    @staticmethod
+    def process(partition):
+        """Drain a partition in order; failures are kept for retry_webhook_events"""
+        processed = 0
+        failed = 0
+
+        while True:
+            rows = WebhookInboxService.claim(partition)
+            if not rows:
+                break
+            result = WebhookInboxService._apply(rows)
+            processed += result['processed']
+            failed += result['failed']
+
+        return {'partition': partition, 'processed': processed, 'failed': failed}
+
+
+    @staticmethod
+    def _apply(rows):
+        # Merge consecutive coalescible events for the same subscription within an
+        # ordering key; anything in between (e.g. a mandate event) ends the run
+        units = []
+        last_unit = {}
+        for row in rows:
+            subscription_id = WebhookEventProcessor.coalesces(row)
+            unit = last_unit.get(row.ordering_key)
+            if subscription_id and unit and unit['subscription'] == subscription_id:
+                unit['rows'].append(row)
+                continue
+            unit = {'subscription': subscription_id, 'rows': [row]}
+            units.append(unit)
+            last_unit[row.ordering_key] = unit
+
+        from gocardless_pro.resources import Event
+
+        done = []
+        held = []
+        failed_keys = set()
+
+        for unit in units:
+            subscription_id, unit = unit['subscription'], unit['rows']
+            key = unit[0].ordering_key
+            if key in failed_keys:
+                # Keep per-resource order: wait until the earlier event succeeds
+                held.extend(row.id for row in unit)
+                continue
+
+            events = [Event(row.payload, None) for row in unit]
+            for event in events:
+                logger.info(f"Processing webhook event: {event.id}, type: {event.resource_type}, action: {event.action}")
+            try:
+                if subscription_id:
+                    WebhookEventProcessor.apply_coalesced(subscription_id, events)
+                else:
+                    WebhookEventProcessor.dispatch(events[0])
+                done.extend(row.id for row in unit)
+            except Exception as e:
+                failed_keys.add(key)
+                logger.error(f"Webhook events {[event.id for event in events]} failed: {str(e)}", exc_info=True)
+                WebhookEvent.objects.filter(id__in=[row.id for row in unit]).update(
+                    status='failed', last_error=str(e), processed_at=timezone.now()
+                )
+
+        WebhookEvent.objects.filter(id__in=done).update(
+            status='processed', last_error=None, processed_at=timezone.now()
+        )
+        # Held events didn't run, so the claim shouldn't count as an attempt
+        WebhookEvent.objects.filter(id__in=held).update(status='pending', attempts=F('attempts') - 1)
+        return {'processed': len(done), 'failed': len(failed_keys)}
+
+
+    @staticmethod
+    def requeue_stuck():
+        """
+        Reset events whose enqueue was lost, whose worker died, or that failed
+        with attempts left, and wake their partitions again. Returns the number requeued.
+        """
+        now = timezone.now()
+        stuck = WebhookEvent.objects.filter(
+            Q(status='pending', received_at__lt=now - timedelta(minutes=1))
+            | Q(status='processing', claimed_at__lt=now - timedelta(seconds=settings.WEBHOOK_STALE_AFTER))
+            | Q(status='failed', attempts__lt=settings.WEBHOOK_MAX_ATTEMPTS)
+        )
+        rows = list(stuck.values_list('id', 'partition'))
+        if not rows:
+            return 0
+
+        # Re-check the same conditions in the UPDATE: a worker may have claimed or
+        # finished a row since it was read, and must not have it reset under it
+        requeued = stuck.filter(id__in=[event_id for event_id, _ in rows]).update(status='pending')
+        if not requeued:
+            return 0
+        WebhookInboxService.enqueue(partition for _, partition in rows)
+
+        logger.warning(f"Requeued {requeued} stuck webhook events")
+        return requeued
+
+
+class WebhookCatchUpService:
+    """
+    Fills gaps left by missed webhook deliveries from the GoCardless events API.
+    Reads events created since the stored cursor (minus an overlap for events
+    that become visible late) and records them in the webhook inbox, where the
+    idempotency store drops the ones already delivered by webhook.
+    """
+
+    CURSOR = 'gocardless-events'
+
+    # Event types WebhookEventProcessor acts on; the rest aren't worth storing
+    RESOURCE_TYPES = ('billing_requests', 'payments', 'mandates', 'subscriptions')
+
+    @staticmethod
+    def run():
+        from .reconciliation import SubscriptionReconciler
+
+        cursor, _ = WebhookCursor.objects.get_or_create(name=WebhookCatchUpService.CURSOR)
+        if cursor.position is not None:
+            since = cursor.position - timedelta(seconds=settings.WEBHOOK_CATCHUP_OVERLAP)
+        else:
+            since = timezone.now() - timedelta(seconds=settings.WEBHOOK_CATCHUP_INITIAL_LOOKBACK)
+
+        newest = cursor.position
+        seen = 0
+        recorded = 0
+        pages = SubscriptionReconciler.pages(
+            gocardless_client.events, {'created_at[gte]': since.isoformat().replace('+00:00', 'Z')}
+        )
+        for records in pages:
+            seen += len(records)
+            for event in records:
+                created_at = parse_datetime(event.created_at)
+                if newest is None or created_at > newest:
+                    newest = created_at
+
+            events = [event for event in records if event.resource_type in WebhookCatchUpService.RESOURCE_TYPES]
+            # One transaction per page; a crash re-reads the page next run and the duplicates are dropped
+            with transaction.atomic():
+                rows = WebhookInboxService.record(events)
+                WebhookInboxService.enqueue(row.partition for row in rows)
+            recorded += len(rows)
+
+        if newest is not None:
+            # Never move the cursor backwards if runs overlap
+            WebhookCursor.objects.filter(name=WebhookCatchUpService.CURSOR).filter(
+                Q(position__isnull=True) | Q(position__lt=newest)
+            ).update(position=newest)
+
+        if recorded:
+            logger.warning(f"Caught up {recorded} GoCardless events missed by webhooks")
+        return {'seen': seen, 'recorded': recorded, 'position': newest}
+
+
+class WebhookEventProcessor:
+    """Applies GoCardless events to local subscription state"""
+
+    # (resource_type, action) -> transition applied to the local subscription
+    TRANSITIONS = {
+        ('payments', 'confirmed'): 'activate',
+        ('payments', 'paid_out'): 'activate',
+        ('payments', 'failed'): 'deactivate',
+        ('subscriptions', 'cancelled'): 'cancel',
+    }
+
+    @staticmethod
+    def dispatch(event):
+        # Handle billing_request fulfilled
+        if event.resource_type == 'billing_requests' and event.action == 'fulfilled':
+            WebhookEventProcessor.handle_billing_fulfilled(event)
+
+        # Handle payment events
+        elif event.resource_type == 'payments':
+            WebhookEventProcessor.handle_payment(event)
+
+        # Handle mandate events
+        elif event.resource_type == 'mandates':
+            WebhookEventProcessor.handle_mandate(event)
+
+        # Handle subscription events
+        elif event.resource_type == 'subscriptions':
+            WebhookEventProcessor.handle_subscription(event)
+
+
+    @staticmethod
+    def handle_billing_fulfilled(event):
+        """Handle billing request fulfilled events"""
+        try:
+            billing_request_id = event.links.billing_request
+            logger.info(f"Billing request fulfilled: {billing_request_id}")
+
+            subscription = Subscription.objects.get(temp_billing_request_id=billing_request_id)
+            user = subscription.user
+
+            # Fetch billing request details
+            billing_request = gocardless_client.billing_requests.get(billing_request_id)
+
+            if billing_request.status == 'fulfilled':
+                mandate_id = billing_request.links.mandate_request_mandate
+                customer_id = billing_request.links.customer
+
+                # Update profile
+                UserProfile.objects.filter(user_id=user.id).update(mandate_id=mandate_id, customer_id=customer_id)
+                logger.info(f"Updated profile with mandate: {mandate_id}, customer: {customer_id}")
+
+                # Create GoCardless subscription
+                sub_params = {
+                    'amount': int(subscription.price * 100),
+                    'currency': 'GBP',
+                    'interval_unit': 'yearly',
+                    'name': 'Helyar1 Yearly Subscription',
+                    'links': {'mandate': mandate_id},
+                    'metadata': {'user_id': str(user.id)},
+                }
+
+                sub_response = gocardless_client.subscriptions.create(
+                    params=sub_params,
+                    headers=idempotency_headers('subscription', mandate_id),
+                )
+                logger.info(f"Created GoCardless subscription: {sub_response.id}")
+
+                # Set expiry date
+                if hasattr(sub_response, 'upcoming_payments') and sub_response.upcoming_payments:
+                    expires_at = datetime.fromisoformat(
+                        sub_response.upcoming_payments[0]['charge_date'].replace('Z', '+00:00')
+                    )
+                else:
+                    expires_at = timezone.now() + timedelta(days=365)
+
+                def activate(current):
+                    if current.is_active and current.subscription_id == sub_response.id:
+                        return None  # CompleteMandate got there first
+                    return 'active', {
+                        'subscription_id': sub_response.id,
+                        'is_active': True,
+                        'started_at': timezone.now(),
+                        'expires_at': expires_at,
+                        # Clear temp fields
+                        'temp_billing_request_id': None,
+                        'temp_flow_id': None,
+                        'temp_state': None,
+                    }
+
+                # Also sets the user/profile flags
+                if not SubscriptionStateMachine.apply(subscription, activate):
+                    logger.info(f"Subscription {sub_response.id} already activated for user {user.email}")
+                    return
+
+                logger.info(f"SUCCESS: Webhook set mandate: {mandate_id}, customer: {customer_id}, subscription: {sub_response.id} for user {user.email}")
+            else:
+                logger.warning(f"Billing request {billing_request_id} not fulfilled: {billing_request.status}")
+
+        except Subscription.DoesNotExist:
+            logger.error(f"No subscription found for billing_request_id: {event.links.billing_request}")
+
+
+    @staticmethod
+    def handle_payment(event):
+        """Handle payment events"""
+        sub_id = getattr(event.links, 'subscription', None)
+        if not sub_id:
+            return
+
+        WebhookEventProcessor.apply_transition(sub_id, WebhookEventProcessor.transition_for(event))
+
+
+    @staticmethod
+    def handle_mandate(event):
+        """Handle mandate events"""
+        if event.action in ['cancelled', 'failed', 'expired']:
+            mandate_id = event.links.mandate
+            try:
+                # Find user by mandate_id
+                profile = User.objects.get(profile__mandate_id=mandate_id).profile
+                logger.warning(f"Mandate {mandate_id} {event.action} for user {profile.user.email}")
+            except User.DoesNotExist:
+                logger.error(f"No user found for mandate: {mandate_id}")
+
+
+    @staticmethod
+    def handle_subscription(event):
+        """Handle subscription events"""
+        WebhookEventProcessor.apply_transition(event.links.subscription, WebhookEventProcessor.transition_for(event))
+
+
+    @staticmethod
+    def coalesces(row):
+        """The subscription a payment or subscription event can be merged under, or None"""
+        if row.resource_type not in ('payments', 'subscriptions'):
+            return None
+        return (row.payload.get('links') or {}).get('subscription')
+
+
+    @staticmethod
+    def transition_for(event):
+        return WebhookEventProcessor.TRANSITIONS.get((event.resource_type, event.action))
+
+
+    @staticmethod
+    def apply_coalesced(sub_id, events):
+        """
+        Apply a burst of events for one subscription as its net transition:
+        the last event that changes state wins, so e.g. confirmed -> paid_out
+        costs one GoCardless fetch and one write instead of two of each.
+        """
+        transition = None
+        for event in events:
+            transition = WebhookEventProcessor.transition_for(event) or transition
+
+        if len(events) > 1:
+            logger.info(f"Coalesced {len(events)} events for subscription {sub_id} into '{transition}'")
+        WebhookEventProcessor.apply_transition(sub_id, transition)
+
+
+    @staticmethod
+    def apply_transition(sub_id, transition):
+        """Apply an activate / deactivate / cancel transition to a local subscription"""
+        if transition is None:
+            return
+
+        try:
+            subscription = Subscription.objects.select_related('user').get(subscription_id=sub_id)
+        except Subscription.DoesNotExist:
+            logger.error(f"Subscription not found for sub_id: {sub_id}")
+            return
+
+        user = subscription.user
+
+        if transition == 'activate':
+            # Fetch subscription to get next charge date
+            gc_sub = gocardless_client.subscriptions.get(sub_id)
+            if hasattr(gc_sub, 'upcoming_payments') and gc_sub.upcoming_payments:
+                expires_at = datetime.fromisoformat(
+                    gc_sub.upcoming_payments[0]['charge_date'].replace('Z', '+00:00')
+                )
+            else:
+                expires_at = timezone.now() + timedelta(days=365)
+
+            # Also sets the user/profile flags
+            if not SubscriptionStateMachine.transition(subscription, 'active', is_active=True, expires_at=expires_at):
+                return
+
+            logger.info(f"Payment confirmed - activated subscription for {user.email}")
+
+        elif transition == 'deactivate':
+            if not SubscriptionStateMachine.transition(subscription, 'inactive', is_active=False):
+                return
+
+            logger.warning(f"Payment failed - deactivated subscription for {user.email}")
+
+        elif transition == 'cancel':
+            if not SubscriptionStateMachine.transition(subscription, 'cancelled', is_active=False):
+                return
+            logger.info(f"Subscription {sub_id} cancelled via webhook")